@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import deque
+
+from starlette.responses import JSONResponse
+
+from db_pool import POOL_MAX_SIZE
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Configuration
+# Requests of the admitted routes allowed to run at once, across all classes
+ADMISSION_CAPACITY = int(os.getenv("ADMISSION_CAPACITY", str(POOL_MAX_SIZE)))
+MAX_RETRY_AFTER = 30  # seconds
+SERVICE_TIME_ALPHA = 0.1  # weight of the newest request in the service time average
+
+class Overloaded(Exception):
+    """A request was shed; retry_after is the suggested wait in seconds"""
+
+    def __init__(self, admission_class, reason, retry_after):
+        super().__init__(f"{admission_class} {reason}")
+        self.admission_class = admission_class
+        self.reason = reason
+        self.retry_after = retry_after
+
+class AdmissionClass:
+    """One priority class: its share of the capacity and its bounded queue"""
+
+    __slots__ = (
+        "name", "priority", "limit", "max_queue", "queue_timeout", "in_flight", "waiters",
+        "admitted", "shed_queue_full", "shed_timeout", "service_time"
+    )
+
+    def __init__(self, name, priority, limit, max_queue, queue_timeout):
+        self.name = name
+        self.priority = priority          # higher is served first when a slot frees up
+        self.limit = limit                # most requests of this class running at once
+        self.max_queue = max_queue        # waiting requests beyond this are shed immediately
+        self.queue_timeout = queue_timeout  # seconds a request may wait before it is shed
+        self.in_flight = 0
+        self.waiters = deque()
+        self.admitted = 0
+        self.shed_queue_full = 0
+        self.shed_timeout = 0
+        self.service_time = 0.05  # moving average of seconds a slot is held
+
+    def retry_after(self):
+        """Seconds until the current queue has probably drained"""
+        drain = (len(self.waiters) + 1) * self.service_time / max(self.limit, 1)
+        return min(MAX_RETRY_AFTER, max(1, math.ceil(drain)))
+
+    def stats(self):
+        return {
+            "priority": self.priority,
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "queue_depth": len(self.waiters),
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "shed_queue_full": self.shed_queue_full,
+            "shed_timeout": self.shed_timeout,
+            "avg_service_ms": round(self.service_time * 1000, 1),
+        }
+
+class AdmissionController:
+    """Priority-aware concurrency limits with bounded queues.
+
+    A request runs if its class is under its limit, nothing of its class
+    is queued ahead of it and the shared capacity isn't used up; otherwise
+    it waits in its class's queue. Whenever a slot frees up it goes to the
+    oldest waiter of the highest-priority class that is under its limit.
+    A request is shed (Overloaded) when its class's queue is full or it has
+    waited queue_timeout, so a saturated class fails fast instead of
+    holding sockets until the client gives up.
+    """
+
+    def __init__(self, classes, capacity=ADMISSION_CAPACITY):
+        self.capacity = capacity
+        self.classes = {c.name: c for c in classes}
+        # Highest priority first, for handing out freed slots
+        self._by_priority = sorted(classes, key=lambda c: c.priority, reverse=True)
+        self.in_flight = 0
+
+    async def acquire(self, name):
+        """Wait for a slot in the named class; raises Overloaded when shed"""
+        cls = self.classes[name]
+        if not cls.waiters and cls.in_flight < cls.limit and self.in_flight < self.capacity:
+            self._grant(cls)
+            return
+        if len(cls.waiters) >= cls.max_queue:
+            cls.shed_queue_full += 1
+            raise Overloaded(name, "queue full", cls.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        cls.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, cls.queue_timeout)
+        except asyncio.TimeoutError:
+            self._forget(cls, waiter)
+            cls.shed_timeout += 1
+            raise Overloaded(name, "queue timeout", cls.retry_after())
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Granted just as the client went away: hand the slot on without
+                # counting it as served, so cancellations don't lower retry_after()
+                cls.admitted -= 1
+                self._release_slot(cls)
+            else:
+                self._forget(cls, waiter)
+            raise
+
+    def release(self, name, held):
+        """Return a slot held for `held` seconds"""
+        cls = self.classes[name]
+        cls.service_time += SERVICE_TIME_ALPHA * (held - cls.service_time)
+        self._release_slot(cls)
+
+    def _grant(self, cls):
+        cls.in_flight += 1
+        cls.admitted += 1
+        self.in_flight += 1
+
+    def _release_slot(self, cls):
+        cls.in_flight -= 1
+        self.in_flight -= 1
+        self._dispatch()
+
+    def _forget(self, cls, waiter):
+        try:
+            cls.waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def _dispatch(self):
+        while self.in_flight < self.capacity:
+            for cls in self._by_priority:
+                if cls.waiters and cls.in_flight < cls.limit:
+                    waiter = cls.waiters.popleft()
+                    if not waiter.done():
+                        self._grant(cls)
+                        waiter.set_result(None)
+                    break
+            else:
+                return
+
+    def stats(self):
+        return {
+            "capacity": self.capacity,
+            "in_flight": self.in_flight,
+            "classes": {name: cls.stats() for name, cls in self.classes.items()},
+        }
+
+class AdmissionMiddleware:
+    """ASGI middleware admitting requests of the mapped paths through a controller.
+
+    `routes` maps (method, path) to a class name; other requests pass
+    straight through. A shed request gets a 503 with Retry-After.
+    """
+
+    def __init__(self, app, controller, routes):
+        self.app = app
+        self.controller = controller
+        self.routes = routes
+
+    async def __call__(self, scope, receive, send):
+        name = self.routes.get((scope.get("method"), scope["path"])) if scope["type"] == "http" else None
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+        try:
+            await self.controller.acquire(name)
+        except Overloaded as e:
+            response = JSONResponse(
+                {"detail": f"Server busy ({e.reason}), retry later"},
+                status_code=503,
+                headers={"Retry-After": str(e.retry_after)}
+            )
+            await response(scope, receive, send)
+            return
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(name, time.perf_counter() - started)
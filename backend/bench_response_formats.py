@@ -0,0 +1,100 @@
+"""Payload size and encode/decode time of JSON vs MessagePack responses.
+
+Encodes representative response bodies the way the API does (FastAPI's
+JSONResponse rendering vs content_negotiation.packb, on content already
+converted to JSON-compatible types) and decodes them the way a client
+would.
+
+Run from the backend directory:
+    python bench_response_formats.py
+"""
+import json
+import time
+
+import msgpack
+from fastapi.responses import JSONResponse
+
+from content_negotiation import packb
+
+ROUNDS = 2000
+
+def convert_body():
+    """/convert"""
+    return {
+        "from": "BTC",
+        "to": "EUR",
+        "from_name": "Bitcoin",
+        "to_name": "Euro",
+        "from_logo": "https://s2.coinmarketcap.com/static/img/coins/64x64/1.png",
+        "to_logo": "https://flagcdn.com/w80/eu.png",
+        "amount": 1.5,
+        "amount_formatted": "1.5",
+        "converted_amount": 89123.45678,
+        "converted_amount_formatted": "89,123.46",
+        "rate": 59415.63785333,
+        "rate_formatted": "59,415.64",
+        "at": None
+    }
+
+def top_tokens_body(count):
+    """/tokens/top?limit=count"""
+    return [
+        {
+            "symbol": f"TK{i}",
+            "name": f"Token number {i}",
+            "token_id": 100_000 + i,
+            "logo": f"https://assets.coingecko.com/coins/images/{i}/small/token.png",
+            "price_usd": 1234.5678 / (i + 1)
+        }
+        for i in range(count)
+    ]
+
+def portfolio_body(count):
+    """/portfolio/value with `count` holdings in three currencies"""
+    amounts = [float(i % 97) + 0.25 for i in range(count)]
+    prices = [100.0 / (i + 1) for i in range(count)]
+    return {
+        "currencies": ["USD", "EUR", "BTC"],
+        "holdings": {
+            "symbol": [f"TK{i}" for i in range(count)],
+            "amount": amounts,
+            "price_usd": prices,
+            "value": {
+                currency: [a * p * rate for a, p in zip(amounts, prices)]
+                for currency, rate in (("USD", 1.0), ("EUR", 0.92), ("BTC", 0.000016))
+            }
+        },
+        "totals": {"USD": 12345.67, "EUR": 11358.02, "BTC": 0.1975},
+        "unpriced": []
+    }
+
+def per_call_us(fn, arg, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn(arg)
+    return (time.perf_counter() - start) / rounds * 1e6
+
+def bench(name, body):
+    rounds = max(20, ROUNDS // max(1, len(json.dumps(body)) // 2000))
+    json_bytes = JSONResponse(body).body
+    msgpack_bytes = packb(body)
+    json_encode = per_call_us(lambda b: JSONResponse(b).body, body, rounds)
+    msgpack_encode = per_call_us(packb, body, rounds)
+    json_decode = per_call_us(json.loads, json_bytes, rounds)
+    msgpack_decode = per_call_us(msgpack.unpackb, msgpack_bytes, rounds)
+    print(
+        f"{name:<24} {len(json_bytes):>10,} {len(msgpack_bytes):>10,} {len(msgpack_bytes) / len(json_bytes):>6.0%}"
+        f" {json_encode:>10.1f} {msgpack_encode:>10.1f} {json_decode:>10.1f} {msgpack_decode:>10.1f}"
+    )
+
+def main():
+    print(f"{'payload':<24} {'json B':>10} {'msgpack B':>10} {'size':>6} {'json enc':>10} {'mp enc':>10} {'json dec':>10} {'mp dec':>10}")
+    print(f"{'':<24} {'':>10} {'':>10} {'':>6} {'(us)':>10} {'(us)':>10} {'(us)':>10} {'(us)':>10}")
+    bench("convert", convert_body())
+    bench("tokens/top limit=50", top_tokens_body(50))
+    bench("tokens/top limit=1000", top_tokens_body(1000))
+    bench("portfolio 1,000", portfolio_body(1000))
+    bench("portfolio 50,000", portfolio_body(50_000))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Memory and throughput benchmark for TokenRepository at 10k and 100k tokens.
+
+Compares the slot/index-based repository with the previous dict-based
+layout and its per-item scan over the batch when matching API prices.
+
+Run from the backend directory:
+    python bench_token_repository.py
+"""
+import gc
+import json
+import time
+import tracemalloc
+from datetime import datetime
+
+from token_repository import TokenRepository, DEFAULT_CRYPTO_ICON
+
+SIZES = (10_000, 100_000)
+BATCH_SIZES = (20, 500)
+
+def make_tokens_json(count):
+    """Synthetic tokens.json contents"""
+    return json.dumps({
+        "tokens": {
+            f"TK{i}": {
+                "token_id": 100_000 + i,
+                "name": f"Token {i}",
+                "symbol": f"TK{i}",
+                "logo": DEFAULT_CRYPTO_ICON
+            }
+            for i in range(count)
+        }
+    })
+
+def make_price_items(tokens):
+    """API price items for every token, keyed by ID only (the common case)"""
+    return [{"TOKEN_ID": t["token_id"], "CURRENT_PRICE": 1.5} for t in tokens.values()]
+
+def empty_repository():
+    """A repository that skips the data files"""
+    return TokenRepository(load=False)
+
+def legacy_apply(tokens, prices, price_items, batch_symbols, now):
+    """The previous matching loop: scan the whole batch for every price item"""
+    for price_item in price_items:
+        token_id = price_item.get('TOKEN_ID')
+        price = price_item.get('CURRENT_PRICE')
+        symbol = (price_item.get('TOKEN_SYMBOL') or '').upper()
+        matching_symbol = None
+        for s in batch_symbols:
+            if (s == symbol) or (str(tokens[s]['token_id']) == str(token_id)):
+                matching_symbol = s
+                break
+        if matching_symbol and price is not None:
+            prices[matching_symbol] = max(float(price), 0.000001)
+
+def measure_memory(build):
+    gc.collect()
+    tracemalloc.start()
+    obj = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return obj, current
+
+def run_matching(apply, symbols, items, batch_size):
+    start = time.perf_counter()
+    for i in range(0, len(symbols), batch_size):
+        apply(items[i:i + batch_size], symbols[i:i + batch_size])
+    return len(items) / (time.perf_counter() - start)
+
+def bench(count):
+    print(f"\n== {count:,} tokens ==")
+    text = make_tokens_json(count)
+    now = datetime.now()
+
+    def load_repository():
+        repo = empty_repository()
+        repo.set_tokens(json.loads(text)["tokens"].values())
+        return repo
+
+    # Both measured as loaded from tokens.json, strings included
+    legacy_tokens, legacy_bytes = measure_memory(lambda: json.loads(text)["tokens"])
+    repo, repo_bytes = measure_memory(load_repository)
+    source = legacy_tokens
+    print(f"memory   dict layout {legacy_bytes / 1e6:8.1f} MB   slot records + indexes {repo_bytes / 1e6:8.1f} MB")
+
+    symbols = list(source)
+    items = make_price_items(source)
+    legacy_prices = {}
+    for batch_size in BATCH_SIZES:
+        legacy_rate = run_matching(
+            lambda batch_items, batch: legacy_apply(legacy_tokens, legacy_prices, batch_items, batch, now),
+            symbols, items, batch_size
+        )
+        repo_rate = run_matching(
+            lambda batch_items, batch: repo._apply_price_items(batch_items, batch, now),
+            symbols, items, batch_size
+        )
+        print(f"matching batch={batch_size:<4} legacy {legacy_rate:12,.0f} items/s   indexed {repo_rate:12,.0f} items/s")
+
+    lookups = symbols[::max(1, count // 10_000)]
+    start = time.perf_counter()
+    for symbol in lookups:
+        token_data = legacy_tokens[symbol].copy()
+        if symbol in legacy_prices:
+            token_data['price_usd'] = legacy_prices[symbol]
+    legacy_rate = len(lookups) / (time.perf_counter() - start)
+    start = time.perf_counter()
+    for symbol in lookups:
+        repo.tokens.get(symbol.upper())
+    repo_rate = len(lookups) / (time.perf_counter() - start)
+    print(f"lookup   copy+price {legacy_rate:12,.0f} /s   record {repo_rate:12,.0f} /s")
+
+if __name__ == "__main__":
+    for size in SIZES:
+        bench(size)
@@ -0,0 +1,213 @@
+import csv
+import io
+import json
+import logging
+import math
+import time
+
+import msgpack
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Configuration
+BULK_CHUNK_ROWS = 5000  # rows converted and written back per chunk
+MAX_LINE_BYTES = 4096  # longer input lines are reported as an error row and skipped
+CSV = "csv"
+NDJSON = "ndjson"
+MSGPACK = "msgpack"  # output only: a stream of MessagePack maps shaped like the NDJSON lines
+OUTPUT_MEDIA_TYPES = {CSV: "text/csv", NDJSON: "application/x-ndjson", MSGPACK: "application/msgpack"}
+_CSV_COLUMNS = ("from", "to", "amount", "converted_amount", "rate", "error")
+_FIELD_NAMES = {
+    "from": ("from", "from_currency"),
+    "to": ("to", "to_currency"),
+    "amount": ("amount",),
+}
+
+def detect_format(content_type):
+    """Bulk format from a request Content-Type, or None if unsupported"""
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    if media_type in ("text/csv", "application/csv"):
+        return CSV
+    if media_type in ("application/x-ndjson", "application/ndjson", "application/jsonl", "application/json-lines"):
+        return NDJSON
+    return None
+
+def csv_columns(cells):
+    """Column indexes of from/to/amount if a CSV row is a header, else None"""
+    names = [cell.strip().lower() for cell in cells]
+    if not any(name in _FIELD_NAMES["from"] for name in names):
+        return None
+    return [
+        next((names.index(n) for n in aliases if n in names), None)
+        for aliases in _FIELD_NAMES.values()
+    ]
+
+def csv_fields(cells, columns):
+    """[from, to, amount] of a CSV row (None for missing cells)"""
+    return [cells[i] if i is not None and i < len(cells) else None for i in columns]
+
+def ndjson_fields(line):
+    """[from, to, amount] of an NDJSON line (None for missing or unparsable fields)"""
+    try:
+        item = json.loads(line)
+        return [
+            next((item[n] for n in aliases if n in item), None)
+            for aliases in _FIELD_NAMES.values()
+        ]
+    except (ValueError, TypeError, AttributeError):
+        return [None, None, None]
+
+class BulkConversion:
+    """Converts a stream of (from, to, amount) rows against one price snapshot.
+
+    `prices` maps every currency symbol (crypto and fiat) to its USD price
+    at the moment the job started, so every row of a job uses the same
+    prices no matter how long the upload takes. Input is consumed and
+    output produced in chunks of BULK_CHUNK_ROWS, so memory stays flat
+    regardless of file size.
+
+    CSV input may start with a header naming from/to/amount columns
+    (from_currency/to_currency also work); otherwise the first three
+    columns are used. Quoted fields must not contain newlines. NDJSON input
+    has one {"from", "to", "amount"} object per line. Output is in the
+    input format unless another `output` format is given. A line longer
+    than MAX_LINE_BYTES becomes an error row and is skipped without
+    being buffered.
+    """
+
+    def __init__(self, prices, fmt, output=None):
+        self.prices = prices
+        self.format = fmt
+        self.output = output or fmt
+        self.columns = None  # CSV column index of from/to/amount
+        self.rows = 0
+        self.errors = 0
+        self.started_at = time.perf_counter()
+
+    async def run(self, body):
+        """Async generator of output chunks for an async iterable of request body bytes"""
+        if self.output == CSV:
+            yield self._write_csv([_CSV_COLUMNS])
+
+        pending = b""
+        lines = []
+        skipping = False  # inside an overlong line, dropping bytes up to its newline
+        async for data in body:
+            if skipping:
+                newline = data.find(b"\n")
+                if newline < 0:
+                    continue
+                data = data[newline + 1:]
+                skipping = False
+            pending += data
+            *complete, pending = pending.split(b"\n")
+            lines.extend(complete)
+            if len(pending) > MAX_LINE_BYTES:
+                # Keep the output in input order: flush the rows before it first
+                if lines:
+                    yield self._convert_lines(lines)
+                    lines = []
+                yield self._line_too_long()
+                pending = b""
+                skipping = True
+            elif len(lines) >= BULK_CHUNK_ROWS:
+                yield self._convert_lines(lines)
+                lines = []
+        if pending:
+            lines.append(pending)
+        if lines:
+            yield self._convert_lines(lines)
+
+        summary = self.summary()
+        logger.info(f"Bulk conversion: {summary['rows']} rows at {summary['rows_per_sec']} rows/sec")
+        if self.output == CSV:
+            yield f"# rows={summary['rows']} errors={summary['errors']} seconds={summary['seconds']} rows_per_sec={summary['rows_per_sec']}\n".encode()
+        elif self.output == MSGPACK:
+            yield msgpack.packb({"summary": summary})
+        else:
+            yield (json.dumps({"summary": summary}) + "\n").encode()
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started_at
+        return {
+            "rows": self.rows,
+            "errors": self.errors,
+            "seconds": round(elapsed, 3),
+            "rows_per_sec": round(self.rows / elapsed) if elapsed > 0 else None,
+        }
+
+    def _convert_lines(self, lines):
+        text_lines = [line.decode("utf-8", errors="replace").rstrip("\r") for line in lines]
+        text_lines = [line for line in text_lines if line.strip()]
+        if self.format == CSV:
+            results = [self._convert(*row) for row in self._csv_rows(text_lines)]
+        else:
+            results = [self._convert(*ndjson_fields(line)) for line in text_lines]
+        return self._write(results)
+
+    def _line_too_long(self):
+        self.rows += 1
+        self.errors += 1
+        return self._write([("", "", None, None, None, f"line longer than {MAX_LINE_BYTES} bytes")])
+
+    def _write(self, results):
+        if self.output == CSV:
+            return self._write_csv(results)
+        if self.output == MSGPACK:
+            return b"".join(msgpack.packb(self._as_dict(r)) for r in results)
+        return "".join(json.dumps(self._as_dict(r)) + "\n" for r in results).encode()
+
+    def _csv_rows(self, text_lines):
+        for cells in csv.reader(text_lines):
+            if self.columns is None:
+                self.columns = csv_columns(cells)
+                if self.columns is not None:
+                    continue
+                self.columns = [0, 1, 2]
+            yield csv_fields(cells, self.columns)
+
+    def _convert(self, from_currency, to_currency, amount):
+        """One row -> (from, to, amount, converted_amount, rate, error)"""
+        self.rows += 1
+        from_currency = str(from_currency or "").strip().upper()
+        to_currency = str(to_currency or "").strip().upper()
+        try:
+            value = float(amount)
+            if not math.isfinite(value):
+                raise ValueError(amount)
+        except (TypeError, ValueError):
+            self.errors += 1
+            return from_currency, to_currency, None if amount is None else str(amount), None, None, "invalid amount"
+        amount = value
+        if amount <= 0:
+            # Same rule as /convert
+            self.errors += 1
+            return from_currency, to_currency, amount, None, None, "amount must be greater than zero"
+        from_price = self.prices.get(from_currency)
+        to_price = self.prices.get(to_currency)
+        if not from_price or not to_price:
+            self.errors += 1
+            missing = from_currency if not from_price else to_currency
+            return from_currency, to_currency, amount, None, None, f"no price for {missing or 'empty currency'}"
+        rate = from_price / to_price
+        return from_currency, to_currency, amount, amount * rate, rate, None
+
+    @staticmethod
+    def _as_dict(result):
+        from_currency, to_currency, amount, converted_amount, rate, error = result
+        if error:
+            return {"from": from_currency, "to": to_currency, "amount": amount, "error": error}
+        return {
+            "from": from_currency,
+            "to": to_currency,
+            "amount": amount,
+            "converted_amount": converted_amount,
+            "rate": rate,
+        }
+
+    @staticmethod
+    def _write_csv(rows):
+        out = io.StringIO()
+        csv.writer(out, lineterminator="\n").writerows(rows)
+        return out.getvalue().encode()
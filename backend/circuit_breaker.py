@@ -0,0 +1,106 @@
+import logging
+import time
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Every breaker created in the process, by name (for stats)
+BREAKERS = {}
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because its dependency's breaker is open"""
+
+    def __init__(self, name):
+        super().__init__(f"Circuit '{name}' is open")
+        self.name = name
+
+class CircuitBreaker:
+    """Per-dependency circuit breaker.
+
+    After `failure_threshold` consecutive failures the breaker opens and
+    calls are rejected immediately, so callers can fall back to their last
+    known-good data instead of waiting out a timeout. After
+    `recovery_timeout` seconds up to `half_open_probes` calls are let
+    through; one success closes the breaker, one failure re-opens it.
+    """
+
+    def __init__(self, name, failure_threshold=5, recovery_timeout=30.0, half_open_probes=1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_probes = half_open_probes
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probes_in_flight = 0
+        self.rejected = 0
+        self.opens = 0
+        BREAKERS[name] = self
+
+    @property
+    def is_closed(self):
+        return self.state == CLOSED
+
+    def allow(self):
+        """Whether a call may go through now; every allowed call must be followed by finish()"""
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.recovery_timeout:
+                self.rejected += 1
+                return False
+            self.state = HALF_OPEN
+            self.probes_in_flight = 0
+            logger.info(f"Circuit '{self.name}' half-open, probing")
+        if self.state == HALF_OPEN:
+            if self.probes_in_flight >= self.half_open_probes:
+                self.rejected += 1
+                return False
+            self.probes_in_flight += 1
+        return True
+
+    def finish(self, success):
+        """Record the outcome of an allowed call (None = no verdict, e.g. cancelled)"""
+        if self.state == HALF_OPEN:
+            self.probes_in_flight = max(0, self.probes_in_flight - 1)
+        if success is None:
+            return
+        if success:
+            if self.state != CLOSED:
+                logger.info(f"Circuit '{self.name}' closed")
+            self.state = CLOSED
+            self.consecutive_failures = 0
+            return
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.opens += 1
+                logger.warning(f"Circuit '{self.name}' opened after {self.consecutive_failures} consecutive failures")
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+    async def call(self, func, *args, failures=(Exception,), **kwargs):
+        """Await func(*args, **kwargs) through the breaker"""
+        if not self.allow():
+            raise CircuitOpenError(self.name)
+        try:
+            result = await func(*args, **kwargs)
+        except failures:
+            self.finish(False)
+            raise
+        except BaseException:
+            self.finish(None)
+            raise
+        self.finish(True)
+        return result
+
+    def stats(self):
+        """Breaker state and counters"""
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "rejected": self.rejected,
+            "opens": self.opens,
+        }
@@ -0,0 +1,82 @@
+from contextvars import ContextVar
+
+import msgpack
+from fastapi.responses import JSONResponse
+
+# Configuration
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+_MSGPACK_TYPES = {"application/msgpack", "application/x-msgpack", "application/vnd.msgpack"}
+_JSON_TYPES = {"application/json", "application/*", "*/*"}
+
+# Media type the current request asked for, set by NegotiationMiddleware
+response_media_type = ContextVar("response_media_type", default=None)
+
+def prefers_msgpack(accept):
+    """Whether an Accept header ranks MessagePack at least as high as JSON.
+
+    JSON stays the default: MessagePack is only chosen when it is listed
+    explicitly, with a non-zero quality.
+    """
+    msgpack_q = 0.0
+    json_q = 0.0
+    for media_range in (accept or "").split(","):
+        media_type, *params = [part.strip() for part in media_range.split(";")]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        media_type = media_type.lower()
+        if media_type in _MSGPACK_TYPES:
+            msgpack_q = max(msgpack_q, quality)
+        elif media_type in _JSON_TYPES:
+            json_q = max(json_q, quality)
+    return msgpack_q > 0 and msgpack_q >= json_q
+
+def packb(content):
+    """MessagePack encoding of JSON-compatible content"""
+    return msgpack.packb(content, use_bin_type=True)
+
+class NegotiatedResponse(JSONResponse):
+    """Default response class: MessagePack when the request asked for it, JSON otherwise.
+
+    Endpoints return the same content either way (already encoded to
+    JSON-compatible types by FastAPI), so both formats share one schema.
+    """
+
+    def __init__(self, content, *args, **kwargs):
+        self.msgpack = response_media_type.get() == MSGPACK_MEDIA_TYPE
+        if self.msgpack:
+            self.media_type = MSGPACK_MEDIA_TYPE
+        super().__init__(content, *args, **kwargs)
+        # Shared caches must keep the two encodings apart
+        self.headers["Vary"] = "Accept"
+
+    def render(self, content):
+        if self.msgpack:
+            return packb(content)
+        return super().render(content)
+
+class NegotiationMiddleware:
+    """ASGI middleware recording the response format the Accept header asks for"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept = None
+        for name, value in scope["headers"]:
+            if name == b"accept":
+                accept = value.decode("latin-1")
+                break
+        token = response_media_type.set(MSGPACK_MEDIA_TYPE if prefers_msgpack(accept) else None)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            response_media_type.reset(token)
@@ -0,0 +1,219 @@
+"""Offline bulk conversion over a snapshot file written by the service.
+
+Converts (from, to, amount) rows of a CSV or NDJSON file with the catalog,
+prices and fiat rates of a snapshot (see snapshot.py), without network
+access to the API or the database. Rows are converted in chunks by a pool
+of worker processes, each memory-mapping the same snapshot file. Every
+output line is the JSON body /convert would return for the row, or
+{"row", "status_code", "detail"} for rows /convert would reject.
+
+Run from the backend directory:
+    python convert_cli.py ledger.csv -o converted.ndjson --workers 8
+"""
+import argparse
+import csv
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+
+from bulk_convert import CSV, NDJSON, csv_columns, csv_fields, ndjson_fields
+from formatting import FIATS, format_number, get_fiat_logo, get_default_logo, extract_image_from_db
+from snapshot import read_snapshot, SNAPSHOT_FILE
+
+logger = logging.getLogger("convert_cli")
+
+DEFAULT_CHUNK_ROWS = 20000
+
+# Per-worker state, loaded once by init_worker()
+_tokens = {}
+_rates = {}
+
+class ConversionError(Exception):
+    """A row /convert would answer with an HTTP error"""
+
+    def __init__(self, status_code, detail):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+def init_worker(snapshot_path):
+    global _tokens, _rates
+    snapshot = read_snapshot(snapshot_path)
+    if snapshot is None:
+        raise RuntimeError(f"No usable snapshot at {snapshot_path}")
+    _tokens = {token.symbol: token for token in snapshot.tokens}
+    _rates = snapshot.rates
+
+def _crypto_leg(symbol):
+    """(price, name, logo) of a token the way /convert reads its view row"""
+    token = _tokens.get(symbol)
+    if token is None:
+        return None, symbol, None
+    price = token.price if token.price else 0
+    return price, token.name or symbol, extract_image_from_db(token.images) or get_default_logo(symbol)
+
+def convert_row(from_currency, to_currency, amount):
+    """The /convert response body for one row (symbols only, live prices)"""
+    from_currency = str(from_currency or "").strip().upper()
+    to_currency = str(to_currency or "").strip().upper()
+    try:
+        amount = float(amount)
+    except (TypeError, ValueError):
+        raise ConversionError(422, "Amount must be a number")
+    if not from_currency or not to_currency:
+        raise ConversionError(400, "Specify a currency symbol or token ID for both sides")
+    if amount <= 0:
+        raise ConversionError(400, "Amount must be greater than zero")
+
+    if from_currency in FIATS and to_currency in FIATS:
+        if from_currency not in _rates or to_currency not in _rates:
+            raise ConversionError(400, f"Exchange rate not available for {from_currency} or {to_currency}")
+        converted_amount = amount / _rates[from_currency] * _rates[to_currency]
+        rate = converted_amount / amount
+        return {
+            "from": from_currency,
+            "to": to_currency,
+            "from_name": FIATS.get(from_currency, from_currency),
+            "to_name": FIATS.get(to_currency, to_currency),
+            "from_logo": get_fiat_logo(from_currency),
+            "to_logo": get_fiat_logo(to_currency),
+            "amount": amount,
+            "amount_formatted": format_number(amount),
+            "converted_amount": converted_amount,
+            "converted_amount_formatted": format_number(converted_amount),
+            "rate": rate,
+            "rate_formatted": format_number(rate)
+        }
+
+    if from_currency in FIATS:
+        from_rate = _rates.get(from_currency, 1.0)
+        from_price, from_name, from_logo = 1.0 / from_rate, FIATS[from_currency], get_fiat_logo(from_currency)
+    else:
+        from_price, from_name, from_logo = _crypto_leg(from_currency)
+    if to_currency in FIATS:
+        to_rate = _rates.get(to_currency, 1.0)
+        to_price, to_name, to_logo = 1.0 / to_rate, FIATS[to_currency], get_fiat_logo(to_currency)
+    else:
+        to_price, to_name, to_logo = _crypto_leg(to_currency)
+
+    if from_price is None or to_price is None:
+        raise ConversionError(404, "Could not determine prices for one or both currencies")
+    try:
+        if from_currency not in FIATS and to_currency not in FIATS:
+            rate = from_price / to_price
+        elif from_currency in FIATS:
+            rate = amount / from_rate * (1 / to_price) / amount
+        else:
+            rate = from_price * to_rate
+    except ZeroDivisionError as e:
+        raise ConversionError(500, f"Error during conversion: {str(e)}")
+    converted_amount = amount * rate
+
+    return {
+        "from": from_currency,
+        "to": to_currency,
+        "from_name": from_name,
+        "to_name": to_name,
+        "from_logo": from_logo,
+        "to_logo": to_logo,
+        "amount": amount,
+        "amount_formatted": format_number(amount),
+        "converted_amount": converted_amount,
+        "converted_amount_formatted": format_number(converted_amount),
+        "rate": rate,
+        "rate_formatted": format_number(rate),
+        "at": None
+    }
+
+def convert_chunk(task):
+    """Worker: convert a chunk of input lines into NDJSON output"""
+    first_row, lines, fmt, columns = task
+    if fmt == CSV:
+        rows = (csv_fields(cells, columns) for cells in csv.reader(lines))
+    else:
+        rows = (ndjson_fields(line) for line in lines)
+    out = []
+    errors = 0
+    for row_number, fields in enumerate(rows, first_row):
+        try:
+            result = convert_row(*fields)
+        except ConversionError as e:
+            errors += 1
+            result = {"row": row_number, "status_code": e.status_code, "detail": e.detail}
+        out.append(json.dumps(result))
+    out.append("")
+    return "\n".join(out), len(lines), errors
+
+def read_chunks(f, fmt, chunk_rows):
+    """Yield conversion tasks of up to chunk_rows non-empty lines"""
+    columns = [0, 1, 2]
+    lines = []
+    first_row = 1
+    row_number = 0
+    for line in f:
+        line = line.rstrip("\r\n")
+        if not line.strip():
+            continue
+        if fmt == CSV and row_number == 0:
+            header = csv_columns(next(csv.reader([line])))
+            if header is not None:
+                columns = header
+                continue
+        row_number += 1
+        lines.append(line)
+        if len(lines) >= chunk_rows:
+            yield first_row, lines, fmt, columns
+            first_row = row_number + 1
+            lines = []
+    if lines:
+        yield first_row, lines, fmt, columns
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert a CSV or NDJSON file of (from, to, amount) rows offline")
+    parser.add_argument("input", help="input file (.csv, .ndjson or .jsonl)")
+    parser.add_argument("-o", "--output", help="output NDJSON file (default: stdout)")
+    parser.add_argument("--snapshot", default=SNAPSHOT_FILE, help=f"snapshot file (default: {SNAPSHOT_FILE})")
+    parser.add_argument("--format", choices=(CSV, NDJSON), help="input format (default: from the file extension)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS, help="rows per worker task")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+
+    fmt = args.format or (CSV if args.input.lower().endswith(".csv") else NDJSON)
+    if read_snapshot(args.snapshot) is None:
+        parser.error(f"no usable snapshot at {args.snapshot}")
+
+    started_at = time.perf_counter()
+    rows = errors = 0
+    out = open(args.output, "w") if args.output else sys.stdout
+    try:
+        with open(args.input, "r", encoding="utf-8", errors="replace", newline="") as f, \
+                multiprocessing.Pool(args.workers, initializer=init_worker, initargs=(args.snapshot,)) as pool:
+            # Keep a bounded number of chunks in flight so memory stays flat
+            # and results are written in input order
+            pending = deque()
+            for task in read_chunks(f, fmt, args.chunk_rows):
+                pending.append(pool.apply_async(convert_chunk, (task,)))
+                if len(pending) >= args.workers * 2:
+                    text, count, failed = pending.popleft().get()
+                    out.write(text)
+                    rows += count
+                    errors += failed
+            while pending:
+                text, count, failed = pending.popleft().get()
+                out.write(text)
+                rows += count
+                errors += failed
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    elapsed = time.perf_counter() - started_at
+    print(f"Converted {rows} rows ({errors} errors) in {elapsed:.2f}s, {rows / elapsed:,.0f} rows/sec", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
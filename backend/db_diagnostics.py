@@ -0,0 +1,339 @@
+"""Database diagnostics for the converter's hot SQL.
+
+Connection settings come from the environment (DB_HOST, DB_PORT, DB_NAME,
+DB_USER, DB_PASSWORD, or a .env file), as for the service. Output is JSON
+with sorted keys so runs can be diffed over time.
+
+Run from the backend directory:
+    python db_diagnostics.py plans -o plans.json   # EXPLAIN (ANALYZE, BUFFERS) of the request-path queries
+    python db_diagnostics.py describe               # columns, size and sample rows of the source view
+    python db_diagnostics.py find rating            # tables and materialized views matching a pattern
+
+`plans` runs every query inside a transaction that is rolled back, with
+the same statement text the service prepares (see queries.py), and
+reports plan cost, sequential scans and row estimate errors, plus
+supporting indexes or a slimmer materialized view where the plans show
+they would help. Suggestions are printed, never executed.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import asyncpg
+from dotenv import load_dotenv
+
+import queries
+
+# Configuration
+SOURCE_VIEW = "analytics.crypto_info_hub_current_view"
+STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "10000"))
+MISESTIMATE_FACTOR = 10  # flag plan nodes whose row estimate is off by more than this
+SAMPLE_ROWS = 5
+
+# Columns the service reads from the view; a slimmer materialized view needs only these
+SERVICE_COLUMNS = ('"TOKEN_ID"', '"TOKEN_SYMBOL"', '"TOKEN_NAME"', '"CURRENT_PRICE"', '"MARKET_CAP"', '"IMAGES"')
+
+# Registry queries on the request path, with representative parameters.
+# Each case names the endpoint that runs it and the index that would serve
+# it if the plan falls back to a sequential scan.
+PLAN_CASES = (
+    {
+        "name": "convert: token_by_symbol (hit)",
+        "endpoint": "/convert",
+        "query": "token_by_symbol",
+        "params": ("BTC",),
+        "index": '("TOKEN_SYMBOL", "MARKET_CAP" DESC NULLS LAST)',
+    },
+    {
+        "name": "convert: token_by_symbol (unknown symbol)",
+        "endpoint": "/convert",
+        "query": "token_by_symbol",
+        "params": ("NOTATOKEN",),
+        "index": '("TOKEN_SYMBOL", "MARKET_CAP" DESC NULLS LAST)',
+    },
+    {
+        "name": "convert: token_by_id",
+        "endpoint": "/convert",
+        "query": "token_by_id",
+        "params": (3375,),
+        "index": '("TOKEN_ID")',
+    },
+    {
+        "name": "search: search_tokens (symbol)",
+        "endpoint": "/tokens/search",
+        "query": "search_tokens",
+        "params": ("%eth%", "eth"),
+        "index": "trigram",
+    },
+    {
+        "name": "search: search_tokens (one letter)",
+        "endpoint": "/tokens/search",
+        "query": "search_tokens",
+        "params": ("%b%", "b"),
+        "index": "trigram",
+    },
+    {
+        "name": "top tokens: top_tokens",
+        "endpoint": "/tokens/top",
+        "query": "top_tokens",
+        "params": (50,),
+        "index": '("MARKET_CAP" DESC) WHERE "MARKET_CAP" > 0 AND "CURRENT_PRICE" IS NOT NULL',
+    },
+)
+
+def connection_settings():
+    """asyncpg.connect() keyword arguments from the environment"""
+    load_dotenv()
+    variables = {"host": "DB_HOST", "database": "DB_NAME", "user": "DB_USER", "password": "DB_PASSWORD"}
+    settings = {key: os.getenv(name) for key, name in variables.items()}
+    missing = [variables[key] for key, value in settings.items() if not value]
+    if missing:
+        raise SystemExit(f"Missing database settings: {', '.join(missing)}")
+    settings["port"] = os.getenv("DB_PORT", "5432")
+    return settings
+
+def _walk(plan, depth=0):
+    yield plan, depth
+    for child in plan.get("Plans", ()):
+        yield from _walk(child, depth + 1)
+
+def summarize_plan(plan):
+    """Cost, sequential scans and row estimate errors of an EXPLAIN (FORMAT JSON) result"""
+    root = plan["Plan"]
+    seq_scans = []
+    misestimates = []
+    spills = []
+    for node, depth in _walk(root):
+        node_type = node["Node Type"]
+        loops = node.get("Actual Loops") or 1
+        actual_rows = node.get("Actual Rows", 0) * loops
+        estimated_rows = node.get("Plan Rows", 0) * loops
+        if node_type == "Seq Scan":
+            seq_scans.append({
+                "relation": node.get("Relation Name"),
+                "filter": node.get("Filter"),
+                "rows": actual_rows,
+                "rows_removed_by_filter": node.get("Rows Removed by Filter", 0) * loops,
+            })
+        ratio = max(actual_rows, 1) / max(estimated_rows, 1)
+        if ratio > MISESTIMATE_FACTOR or ratio < 1 / MISESTIMATE_FACTOR:
+            misestimates.append({
+                "node": node_type,
+                "depth": depth,
+                "relation": node.get("Relation Name"),
+                "estimated_rows": estimated_rows,
+                "actual_rows": actual_rows,
+            })
+        if node.get("Sort Space Type") == "Disk":
+            spills.append({"node": node_type, "sort_key": node.get("Sort Key"), "kb": node.get("Sort Space Used")})
+    return {
+        "total_cost": root["Total Cost"],
+        "startup_cost": root["Startup Cost"],
+        "estimated_rows": root["Plan Rows"],
+        "actual_rows": root.get("Actual Rows"),
+        "planning_ms": plan.get("Planning Time"),
+        "execution_ms": plan.get("Execution Time"),
+        "shared_hit_blocks": root.get("Shared Hit Blocks"),
+        "shared_read_blocks": root.get("Shared Read Blocks"),
+        "nodes": sum(1 for _ in _walk(root)),
+        "relations": sorted({node["Relation Name"] for node, _ in _walk(root) if "Relation Name" in node}),
+        "seq_scans": seq_scans,
+        "misestimates": misestimates,
+        "sort_spills": spills,
+    }
+
+async def explain(conn, sql, params):
+    """EXPLAIN (ANALYZE, BUFFERS) of a statement, rolled back afterwards"""
+    tr = conn.transaction()
+    await tr.start()
+    try:
+        await conn.execute(f"SET LOCAL statement_timeout = {STATEMENT_TIMEOUT_MS}")
+        raw = await conn.fetchval(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}", *params)
+    finally:
+        await tr.rollback()
+    return (json.loads(raw) if isinstance(raw, str) else raw)[0]
+
+def qualified_name(value):
+    """(schema, name) of a "schema.name" argument"""
+    schema, dot, name = value.partition(".")
+    if not (schema and dot and name):
+        raise argparse.ArgumentTypeError(f"expected schema.name, got {value!r}")
+    return schema, name
+
+async def describe_view(conn, view):
+    """Kind, size and columns of a view or table"""
+    schema, name = qualified_name(view)
+    relation = await conn.fetchrow(
+        """
+        SELECT c.oid, c.relkind, c.reltuples, pg_total_relation_size(c.oid) AS bytes
+        FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = $1 AND c.relname = $2
+        """,
+        schema, name
+    )
+    # From the catalog: information_schema.columns has no rows for materialized views
+    columns = await conn.fetch(
+        """
+        SELECT attname AS column_name, format_type(atttypid, atttypmod) AS data_type, NOT attnotnull AS nullable
+        FROM pg_attribute
+        WHERE attrelid = $1 AND attnum > 0 AND NOT attisdropped
+        ORDER BY attnum
+        """,
+        relation["oid"]
+    ) if relation else []
+    kinds = {"r": "table", "v": "view", "m": "materialized view", "p": "partitioned table"}
+    return {
+        "name": view,
+        "kind": kinds.get(relation["relkind"], relation["relkind"]) if relation else None,
+        "estimated_rows": relation["reltuples"] if relation else None,
+        # A plain view has no storage of its own
+        "bytes": relation["bytes"] if relation and relation["relkind"] in ("r", "m", "p") else None,
+        "columns": [
+            {"name": c["column_name"], "type": c["data_type"], "nullable": c["nullable"]}
+            for c in columns
+        ],
+    }
+
+def suggest(view_info, results):
+    """Indexes or a slimmer materialized view that the plans show would help"""
+    suggestions = []
+    indexable = view_info["kind"] in ("table", "materialized view")
+    target = SOURCE_VIEW if indexable else "analytics.converter_tokens"
+    seen = set()
+    for case, result in results:
+        summary = result.get("summary")
+        if summary is None or not summary["seq_scans"]:
+            continue
+        index = case["index"]
+        if index == "trigram":
+            statements = [
+                "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+                f'CREATE INDEX ON {target} USING gin (LOWER("TOKEN_SYMBOL") gin_trgm_ops)',
+                f'CREATE INDEX ON {target} USING gin (LOWER("TOKEN_NAME") gin_trgm_ops)',
+            ]
+            reason = "LIKE '%...%' on LOWER() can only use trigram indexes"
+        else:
+            statements = [f"CREATE INDEX ON {target} {index}"]
+            reason = "a sequential scan serves a lookup an index would answer directly"
+        key = tuple(statements)
+        if key in seen:
+            continue
+        seen.add(key)
+        scanned = sum(scan["rows"] + scan["rows_removed_by_filter"] for scan in summary["seq_scans"])
+        suggestions.append({
+            "for": case["query"],
+            "reason": f"{reason} ({scanned:,} rows scanned)",
+            "sql": statements,
+        })
+
+    if not indexable and suggestions:
+        # A plain view can't be indexed: materialize just the columns the service reads
+        relations = sorted({r for _, result in results for r in result.get("summary", {}).get("relations", ())})
+        suggestions.insert(0, {
+            "for": "all",
+            "reason": (
+                f"{SOURCE_VIEW} is a {view_info['kind'] or 'missing relation'} over {len(relations)} relation(s) "
+                f"({', '.join(relations)}) and cannot be indexed; materialize the "
+                f"{len(SERVICE_COLUMNS)} columns the service reads and index that instead"
+            ),
+            "sql": [
+                f"CREATE MATERIALIZED VIEW {target} AS SELECT {', '.join(SERVICE_COLUMNS)} FROM {SOURCE_VIEW}",
+                f'CREATE UNIQUE INDEX ON {target} ("TOKEN_ID")',
+                f"-- refresh without blocking readers: REFRESH MATERIALIZED VIEW CONCURRENTLY {target}",
+            ],
+        })
+    return suggestions
+
+async def run_plans(conn, include_raw=False):
+    view_info = await describe_view(conn, SOURCE_VIEW)
+    results = []
+    for case in PLAN_CASES:
+        result = {"endpoint": case["endpoint"], "query": case["query"], "params": list(case["params"])}
+        try:
+            plan = await explain(conn, queries.QUERIES[case["query"]], case["params"])
+            result["summary"] = summarize_plan(plan)
+            if include_raw:
+                result["plan"] = plan
+        except (asyncpg.PostgresError, asyncio.TimeoutError) as e:
+            result["error"] = f"{type(e).__name__}: {str(e)}"
+        results.append((case, result))
+    return {
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "server_version": ".".join(str(part) for part in conn.get_server_version()[:2]),
+        "view": {key: value for key, value in view_info.items() if key != "columns"},
+        "queries": {case["name"]: result for case, result in results},
+        "suggestions": suggest(view_info, results),
+    }
+
+async def run_describe(conn, view):
+    info = await describe_view(conn, view)
+    rows = await conn.fetch(f"SELECT * FROM {view} LIMIT {SAMPLE_ROWS}")
+    info["sample"] = [dict(row) for row in rows]
+    return info
+
+async def run_find(conn, pattern):
+    like = f"%{pattern}%"
+    tables = await conn.fetch(
+        """
+        SELECT table_schema, table_name, table_type
+        FROM information_schema.tables
+        WHERE table_name ILIKE $1
+        ORDER BY table_schema, table_name
+        """,
+        like
+    )
+    # information_schema doesn't list materialized views
+    matviews = await conn.fetch(
+        "SELECT schemaname, matviewname FROM pg_matviews WHERE matviewname ILIKE $1 ORDER BY 1, 2",
+        like
+    )
+    return {
+        "pattern": pattern,
+        "tables": [
+            {"name": f"{t['table_schema']}.{t['table_name']}", "type": t["table_type"]} for t in tables
+        ],
+        "materialized_views": [f"{m['schemaname']}.{m['matviewname']}" for m in matviews],
+    }
+
+async def run(args):
+    conn = await asyncpg.connect(**connection_settings())
+    try:
+        if args.command == "plans":
+            return await run_plans(conn, include_raw=args.raw)
+        if args.command == "describe":
+            return await run_describe(conn, args.view)
+        return await run_find(conn, args.pattern)
+    finally:
+        await conn.close()
+
+def main(argv=None):
+    # -o goes after the subcommand: db_diagnostics.py plans -o plans.json
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("-o", "--output", help="output JSON file (default: stdout)")
+    parser = argparse.ArgumentParser(description="Diagnostics for the converter's database queries")
+    commands = parser.add_subparsers(dest="command", required=True)
+    plans = commands.add_parser("plans", parents=[common], help="EXPLAIN (ANALYZE, BUFFERS) the request-path queries")
+    plans.add_argument("--raw", action="store_true", help="include the full JSON plans")
+    describe = commands.add_parser("describe", parents=[common], help="columns, size and sample rows of a view or table")
+    describe.add_argument("view", nargs="?", default=SOURCE_VIEW, help=f"schema.name (default: {SOURCE_VIEW})")
+    find = commands.add_parser("find", parents=[common], help="tables and materialized views whose name contains a pattern")
+    find.add_argument("pattern")
+    args = parser.parse_args(argv)
+    if args.command == "describe":
+        try:
+            qualified_name(args.view)
+        except argparse.ArgumentTypeError as e:
+            describe.error(str(e))
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2, sort_keys=True, default=str)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+import asyncpg
+
+from queries import init_connection
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Pool sizing (overridable from the environment)
+POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "20"))
+POOL_WARM_SIZE = int(os.getenv("DB_POOL_WARM_SIZE", "5"))
+
+# Server-side backstop for runaway statements (milliseconds)
+STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "10000"))
+
+# Adaptive resizing: grow when requests wait too long for a connection,
+# shrink when the pool sits mostly idle
+POOL_RESIZE_INTERVAL = 5.0  # seconds between resize decisions
+POOL_GROW_WAIT = 0.010      # average acquire wait (s) that triggers growth
+POOL_SHRINK_WAIT = 0.001    # average acquire wait (s) under which we may shrink
+POOL_GROW_STEP = 2
+POOL_IDLE_LIFETIME = 60.0   # idle connections above the limit are closed after this
+
+# Errors that mean the database is unreachable or overloaded (as opposed to a bad query)
+DB_UNAVAILABLE_ERRORS = (
+    OSError,
+    asyncio.TimeoutError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.InterfaceError,
+    asyncpg.CannotConnectNowError,
+    asyncpg.TooManyConnectionsError,
+    asyncpg.QueryCanceledError,
+)
+
+class PoolManager:
+    """asyncpg pool with warm-up, an adaptive connection limit and runtime stats.
+
+    asyncpg cannot resize a pool in place, so the pool is created at the hard
+    ceiling (max_size) and the manager gates acquisitions with its own limit.
+    Connections above the current limit go idle and are closed by asyncpg's
+    max_inactive_connection_lifetime.
+    """
+
+    def __init__(self, pool, min_size, max_size, warm_size):
+        self.pool = pool
+        self.min_size = min_size
+        self.max_size = max_size
+        self.limit = max(min_size, min(warm_size, max_size))
+        self.in_use = 0
+        self.waiters = 0
+        self.acquires = 0
+        self.grows = 0
+        self.shrinks = 0
+        self._cond = asyncio.Condition()
+        self._waits = deque(maxlen=1024)  # recent acquire waits in seconds
+        self._peak_in_use = 0
+        self._resize_task = None
+
+    @classmethod
+    async def create(cls, min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE, warm_size=POOL_WARM_SIZE, **connect_kwargs):
+        """Create the pool, prepare hot statements on each connection and warm it up"""
+        pool = await asyncpg.create_pool(
+            min_size=min_size,
+            max_size=max_size,
+            init=init_connection,
+            max_inactive_connection_lifetime=POOL_IDLE_LIFETIME,
+            server_settings={"statement_timeout": str(STATEMENT_TIMEOUT_MS)},
+            **connect_kwargs
+        )
+        manager = cls(pool, min_size, max_size, warm_size)
+        await manager.warm_up(warm_size)
+        manager._resize_task = asyncio.create_task(manager._resize_loop())
+        return manager
+
+    async def warm_up(self, target):
+        """Open connections up to target so the first requests don't pay connect cost"""
+        target = min(target, self.max_size)
+        missing = target - self.pool.get_size()
+        if missing <= 0:
+            return
+
+        async def _touch():
+            async with self.pool.acquire() as conn:
+                await conn.execute("SELECT 1")
+
+        start = time.perf_counter()
+        # Acquire concurrently so the pool has to open distinct connections
+        await asyncio.gather(*(_touch() for _ in range(target)), return_exceptions=True)
+        logger.info(f"Warmed pool to {self.pool.get_size()} connections in {time.perf_counter() - start:.3f}s")
+
+    @asynccontextmanager
+    async def acquire(self, timeout=None):
+        """Acquire a connection, respecting the adaptive limit (timeout covers the whole wait)"""
+        start = time.perf_counter()
+        async with self._cond:
+            self.waiters += 1
+            try:
+                await asyncio.wait_for(self._cond.wait_for(lambda: self.in_use < self.limit), timeout)
+            finally:
+                self.waiters -= 1
+            self.in_use += 1
+            self._peak_in_use = max(self._peak_in_use, self.in_use)
+        if timeout is not None:
+            timeout = max(0.0, timeout - (time.perf_counter() - start))
+        try:
+            async with self.pool.acquire(timeout=timeout) as conn:
+                self._waits.append(time.perf_counter() - start)
+                self.acquires += 1
+                yield conn
+        finally:
+            async with self._cond:
+                self.in_use -= 1
+                self._cond.notify()
+
+    async def _resize_loop(self):
+        """Periodically adjust the connection limit from observed acquire waits"""
+        while True:
+            await asyncio.sleep(POOL_RESIZE_INTERVAL)
+            try:
+                await self._resize()
+            except Exception as e:
+                logger.error(f"Pool resize failed: {e}")
+
+    async def _resize(self):
+        waits = list(self._waits)
+        self._waits.clear()
+        avg_wait = sum(waits) / len(waits) if waits else 0.0
+        peak = self._peak_in_use
+        self._peak_in_use = self.in_use
+
+        async with self._cond:
+            if avg_wait > POOL_GROW_WAIT and self.limit < self.max_size:
+                old_limit = self.limit
+                self.limit = min(self.max_size, self.limit + POOL_GROW_STEP)
+                self.grows += 1
+                self._cond.notify(self.limit - old_limit)
+                logger.info(f"Pool limit {old_limit} -> {self.limit} (avg acquire wait {avg_wait * 1000:.1f}ms)")
+            elif avg_wait < POOL_SHRINK_WAIT and peak < self.limit - POOL_GROW_STEP and self.limit > self.min_size:
+                old_limit = self.limit
+                self.limit = max(self.min_size, self.limit - 1)
+                self.shrinks += 1
+                logger.info(f"Pool limit {old_limit} -> {self.limit} (peak in use {peak})")
+
+    def stats(self):
+        """Snapshot of pool-level stats"""
+        waits = list(self._waits)
+        return {
+            "size": self.pool.get_size(),
+            "idle": self.pool.get_idle_size(),
+            "in_use": self.in_use,
+            "waiters": self.waiters,
+            "limit": self.limit,
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "acquires": self.acquires,
+            "grows": self.grows,
+            "shrinks": self.shrinks,
+            "avg_acquire_wait_ms": round(sum(waits) / len(waits) * 1000, 3) if waits else 0.0,
+            "max_acquire_wait_ms": round(max(waits) * 1000, 3) if waits else 0.0,
+        }
+
+    async def close(self):
+        """Stop resizing and close all connections"""
+        if self._resize_task:
+            self._resize_task.cancel()
+        await self.pool.close()
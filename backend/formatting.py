@@ -0,0 +1,191 @@
+import json
+import locale
+import logging
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Common token IDs for CoinMarketCap
+COINMARKETCAP_IDS = {
+    "BTC": 1,
+    "ETH": 1027,
+    "USDT": 825,
+    "BNB": 1839,
+    "SOL": 5426,
+    "XRP": 52,
+    "USDC": 3408,
+    "ADA": 2010,
+    "AVAX": 5805,
+    "DOGE": 74,
+    "DOT": 6636,
+    "SHIB": 5994,
+    "TRX": 1958,
+    "LINK": 1975,
+    "MATIC": 3890,
+    "LTC": 2,
+    "TON": 11419
+}
+
+def get_default_logo(symbol):
+    """Generate a default logo URL based on token symbol"""
+    # Use CoinMarketCap IDs for common tokens
+    if symbol in COINMARKETCAP_IDS:
+        return f"https://s2.coinmarketcap.com/static/img/coins/64x64/{COINMARKETCAP_IDS[symbol]}.png"
+    
+    # Generate a hash number from the token symbol for other tokens (deterministic)
+    # This ensures the same token always gets the same logo
+    hash_value = sum(ord(c) for c in symbol) % 10000
+    return f"https://s2.coinmarketcap.com/static/img/coins/64x64/{hash_value}.png"
+
+# Fiat currencies we support
+FIATS = {
+    "USD": "US Dollar",
+    "EUR": "Euro",
+    "GBP": "British Pound",
+    "JPY": "Japanese Yen",
+    "CAD": "Canadian Dollar",
+    "AUD": "Australian Dollar",
+    "CNY": "Chinese Yuan",
+    "INR": "Indian Rupee",
+    "BRL": "Brazilian Real",
+    "CHF": "Swiss Franc",
+    "VND": "Vietnamese Dong",
+    "NGN": "Nigerian Naira"
+}
+
+# Fiat exchange rates relative to USD (1 USD = X units of currency)
+FIAT_EXCHANGE_RATES = {
+    "USD": 1.0,
+    "EUR": 0.93,    # 1 USD = 0.93 EUR
+    "GBP": 0.80,    # 1 USD = 0.80 GBP
+    "JPY": 156.78,  # 1 USD = 156.78 JPY
+    "CAD": 1.37,    # 1 USD = 1.37 CAD
+    "AUD": 1.52,    # 1 USD = 1.52 AUD
+    "CNY": 7.24,    # 1 USD = 7.24 CNY
+    "INR": 83.37,   # 1 USD = 83.37 INR
+    "BRL": 5.07,    # 1 USD = 5.07 BRL
+    "CHF": 0.91,    # 1 USD = 0.91 CHF
+    "VND": 24900,   # 1 USD = 24,900 VND
+    "NGN": 1412.76  # 1 USD = 1,412.76 NGN
+}
+
+# ISO country codes for flag images
+COUNTRY_CODES = {
+    "USD": "us",
+    "EUR": "eu",
+    "GBP": "gb",
+    "JPY": "jp",
+    "CAD": "ca",
+    "AUD": "au",
+    "CNY": "cn",
+    "INR": "in",
+    "BRL": "br",
+    "CHF": "ch",
+    "VND": "vn",
+    "NGN": "ng"
+}
+
+def get_fiat_logo(currency_code):
+    """Get logo URL for fiat currency using country flag"""
+    if currency_code in COUNTRY_CODES:
+        country_code = COUNTRY_CODES[currency_code].lower()
+        # Using flagcdn.com for reliable flag images
+        return f"https://flagcdn.com/w80/{country_code}.png"
+    return None
+
+# Configure number formatting for better human readability
+try:
+    # Try to set the preferred locale
+    locale.setlocale(locale.LC_ALL, 'en_US.UTF-8')
+except locale.Error:
+    try:
+        # Try a more generic locale
+        locale.setlocale(locale.LC_ALL, 'en_US')
+    except locale.Error:
+        try:
+            # Try with just the language code
+            locale.setlocale(locale.LC_ALL, 'en')
+        except locale.Error:
+            # If all else fails, use the default locale
+            locale.setlocale(locale.LC_ALL, '')
+            logger.warning("Could not set specific locale, using system default")
+
+def format_number(number, decimal_places=2):
+    """Format number with thousand separators and fixed decimal places"""
+    try:
+        # For very small numbers, use more decimal places
+        original_number = float(number)
+        
+        # Use scientific notation for extremely small numbers
+        if 0 < original_number < 0.0000001:
+            return f"{original_number:.6e}"
+            
+        # Use adaptive decimal places based on number size
+        if original_number < 0.00001:
+            decimal_places = 10
+        elif original_number < 0.0001:
+            decimal_places = 8
+        elif original_number < 0.001:
+            decimal_places = 6
+        elif original_number < 0.1:
+            decimal_places = 4
+            
+        # Round to specified decimal places
+        rounded = round(original_number, decimal_places)
+        
+        # Format with thousand separators - simplified implementation
+        integer_part, *decimal_parts = f"{rounded:.{decimal_places}f}".split('.')
+        decimal_part = decimal_parts[0] if decimal_parts else ''
+        
+        # Add thousand separators to integer part
+        formatted_integer = ""
+        for i, digit in enumerate(reversed(integer_part)):
+            if i > 0 and i % 3 == 0:
+                formatted_integer = ',' + formatted_integer
+            formatted_integer = digit + formatted_integer
+            
+        # Add negative sign if needed
+        if rounded < 0 and not formatted_integer.startswith('-'):
+            formatted_integer = '-' + formatted_integer
+            
+        # Combine parts
+        formatted = formatted_integer
+        if decimal_places > 0:
+            formatted += f".{decimal_part}"
+            
+        # If the number is a whole number ending in .00, remove the decimal part
+        if decimal_places > 0 and formatted.endswith('.' + '0' * decimal_places):
+            formatted = formatted[:-decimal_places-1]
+            
+        # Ensure we never return "0" for small positive values
+        if original_number > 0 and formatted == "0":
+            return f"{original_number:.6e}"
+            
+        return formatted
+    except (ValueError, TypeError):
+        # In case of any error, return the original number as string
+        return str(number)
+
+def extract_image_from_db(images_data):
+    """Extract image URL from database IMAGES field"""
+    if not images_data:
+        return None
+        
+    # If images_data is a string, try to parse it as JSON
+    if isinstance(images_data, str):
+        try:
+            images_data = json.loads(images_data)
+        except json.JSONDecodeError as e:
+            logger.error(f"Failed to parse IMAGES JSON: {e}")
+            return None
+            
+    # Now extract the image URL
+    if isinstance(images_data, dict):
+        if "small" in images_data:
+            return images_data["small"]
+        elif "thumb" in images_data:
+            return images_data["thumb"]
+        elif "large" in images_data:
+            return images_data["large"]
+    
+    return None
@@ -0,0 +1,111 @@
+import math
+import time
+from array import array
+
+# Configuration
+HOT_KEYS_HALF_LIFE = 600  # seconds for a count to decay to half its weight
+_RESCALE_AT = 2.0 ** 32   # renormalize counters before weights lose precision
+_PRIME = (1 << 61) - 1    # modulus of the per-row universal hash
+_ROW_SEEDS = (
+    (0x5BD1E9955BD1E995, 0x2545F4914F6CDD1D),
+    (0x9E3779B97F4A7C15, 0x632BE59BD9B4E019),
+    (0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9),
+    (0xFF51AFD7ED558CCD, 0xC4CEB9FE1A85EC53),
+    (0x85EBCA77C2B2AE63, 0x27D4EB2F165667C5),
+    (0xD6E8FEB86659FD93, 0xA0761D6478BD642F),
+)
+
+class HeavyHitters:
+    """Approximate most frequent keys of a stream in constant memory.
+
+    A count-min sketch (`depth` rows of `width` counters) estimates the
+    count of any key; a top-k table keeps the keys with the highest
+    estimates. Counts decay exponentially with HOT_KEYS_HALF_LIFE: each
+    update is weighted by 2^(t / half_life) (forward decay), so old
+    traffic fades without touching every counter on every tick, and
+    counters are renormalized once the weights grow large.
+    """
+
+    def __init__(self, width=2048, depth=4, k=64, half_life=HOT_KEYS_HALF_LIFE):
+        if depth > len(_ROW_SEEDS):
+            raise ValueError(f"depth must be at most {len(_ROW_SEEDS)}")
+        self.width = width
+        self.depth = depth
+        self.k = k
+        self.half_life = half_life
+        self.counters = [array("d", bytes(8 * width)) for _ in range(depth)]
+        self.top = {}  # key -> decayed-weighted estimate
+        self._min_key = None
+        self.epoch = time.monotonic()
+        self.updates = 0
+
+    def _slots(self, key):
+        """Counter index of key in each row (one hash(), then a cheap universal hash per row)"""
+        h = hash(key) & _PRIME
+        width = self.width
+        return [((a * h + b) % _PRIME) % width for a, b in _ROW_SEEDS[:self.depth]]
+
+    def _weight(self, now):
+        return 2.0 ** ((now - self.epoch) / self.half_life)
+
+    def _rescale(self, now):
+        """Fold the current weight into every counter and restart the epoch"""
+        factor = 1.0 / self._weight(now)
+        for row in self.counters:
+            for i in range(self.width):
+                row[i] *= factor
+        for key in self.top:
+            self.top[key] *= factor
+        self.epoch = now
+
+    def add(self, key, count=1):
+        """Count one occurrence of key"""
+        now = time.monotonic()
+        weight = self._weight(now)
+        if weight > _RESCALE_AT:
+            self._rescale(now)
+            weight = 1.0
+        self.updates += 1
+
+        increment = count * weight
+        estimate = math.inf
+        for row, i in zip(self.counters, self._slots(key)):
+            row[i] += increment
+            if row[i] < estimate:
+                estimate = row[i]
+
+        top = self.top
+        if key in top:
+            top[key] = estimate
+            if key == self._min_key:
+                self._min_key = min(top, key=top.get)
+        elif len(top) < self.k:
+            top[key] = estimate
+            if self._min_key is None or estimate < top[self._min_key]:
+                self._min_key = key
+        elif estimate > top[self._min_key]:
+            del top[self._min_key]
+            top[key] = estimate
+            self._min_key = min(top, key=top.get)
+
+    def estimate(self, key):
+        """Decayed count estimate for any key (never an underestimate)"""
+        now = time.monotonic()
+        raw = min(row[i] for row, i in zip(self.counters, self._slots(key)))
+        return raw / self._weight(now)
+
+    def most_common(self, n=20):
+        """Top keys with their decayed counts, highest first"""
+        scale = 1.0 / self._weight(time.monotonic())
+        ranked = sorted(self.top.items(), key=lambda item: item[1], reverse=True)[:n]
+        return [{"key": key, "count": round(value * scale, 2)} for key, value in ranked]
+
+    def stats(self):
+        return {
+            "updates": self.updates,
+            "tracked": len(self.top),
+            "width": self.width,
+            "depth": self.depth,
+            "half_life_seconds": self.half_life,
+            "memory_bytes": self.width * self.depth * 8,
+        }
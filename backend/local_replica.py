@@ -0,0 +1,315 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import queries
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Configuration
+LOCAL_REPLICA_FILE = os.getenv("LOCAL_REPLICA_FILE")  # SQLite file; the replica is off unless set
+LOCAL_REPLICA_SYNC_INTERVAL = int(os.getenv("LOCAL_REPLICA_SYNC_INTERVAL", "30"))
+# Reads go back to the database once the replica is older than this (seconds)
+LOCAL_REPLICA_MAX_LAG = int(os.getenv("LOCAL_REPLICA_MAX_LAG", "120"))
+REPLICA_FETCH_BATCH = 1000  # changed tokens fetched per round-trip
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tokens (
+    token_id INTEGER PRIMARY KEY,
+    symbol TEXT,
+    name TEXT,
+    images TEXT,
+    price REAL,
+    market_cap REAL,
+    meta_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS tokens_symbol ON tokens (symbol, market_cap DESC);
+CREATE INDEX IF NOT EXISTS tokens_market_cap ON tokens (market_cap DESC);
+CREATE TABLE IF NOT EXISTS replica_meta (key TEXT PRIMARY KEY, value REAL);
+"""
+
+# Substring search index over symbol and name (trigram: LIKE '%x%' uses it)
+FTS_SCHEMA = "CREATE VIRTUAL TABLE IF NOT EXISTS tokens_fts USING fts5(symbol, name, tokenize='trigram')"
+
+_TOKEN_COLUMNS = """
+    token_id AS "TOKEN_ID",
+    name AS "TOKEN_NAME",
+    symbol AS "TOKEN_SYMBOL",
+    price AS "CURRENT_PRICE",
+    market_cap AS "MARKET_CAP",
+    images AS "IMAGES"
+"""
+
+# Local equivalents of the registry queries in queries.py: same names,
+# parameters and result columns, with the same ordering and tie-breaks
+LOCAL_QUERIES = {
+    "token_by_symbol": f"""
+    SELECT {_TOKEN_COLUMNS}
+    FROM tokens
+    WHERE symbol = ?1
+    ORDER BY market_cap DESC NULLS LAST
+    LIMIT 1
+    """,
+
+    "token_by_id": f"""
+    SELECT {_TOKEN_COLUMNS}
+    FROM tokens
+    WHERE token_id = ?1
+    """,
+
+    "search_tokens": f"""
+    SELECT {_TOKEN_COLUMNS}
+    FROM tokens
+    WHERE token_id IN (
+        SELECT rowid FROM tokens_fts WHERE symbol LIKE ?1
+        UNION
+        SELECT rowid FROM tokens_fts WHERE name LIKE ?1
+    )
+    ORDER BY
+        CASE
+            WHEN LOWER(symbol) = LOWER(?2) THEN 1
+            WHEN LOWER(symbol) LIKE LOWER(?2 || '%') THEN 2
+            WHEN LOWER(name) = LOWER(?2) THEN 3
+            WHEN LOWER(name) LIKE LOWER(?2 || '%') THEN 4
+            ELSE 5
+        END,
+        market_cap DESC NULLS LAST
+    LIMIT 20
+    """,
+
+    "top_tokens": f"""
+    SELECT {_TOKEN_COLUMNS}
+    FROM tokens
+    WHERE market_cap > 0 AND price IS NOT NULL
+    ORDER BY market_cap DESC
+    LIMIT ?1
+    """,
+
+    "current_prices": """
+    SELECT "TOKEN_SYMBOL", "CURRENT_PRICE" FROM (
+        SELECT
+            symbol AS "TOKEN_SYMBOL",
+            price AS "CURRENT_PRICE",
+            ROW_NUMBER() OVER (PARTITION BY symbol ORDER BY market_cap DESC NULLS LAST) AS rank
+        FROM tokens
+        WHERE symbol IS NOT NULL AND price IS NOT NULL
+    )
+    WHERE rank = 1
+    """,
+
+    # Array parameters are passed as a JSON list
+    "prices_for_symbols": """
+    SELECT "TOKEN_SYMBOL", "CURRENT_PRICE" FROM (
+        SELECT
+            symbol AS "TOKEN_SYMBOL",
+            price AS "CURRENT_PRICE",
+            ROW_NUMBER() OVER (PARTITION BY symbol ORDER BY market_cap DESC NULLS LAST) AS rank
+        FROM tokens
+        WHERE symbol IN (SELECT value FROM json_each(?1)) AND price IS NOT NULL
+    )
+    WHERE rank = 1
+    """,
+}
+
+# Without FTS5 trigram support search falls back to scanning the table
+_SEARCH_WITHOUT_FTS = LOCAL_QUERIES["search_tokens"].replace(
+    """token_id IN (
+        SELECT rowid FROM tokens_fts WHERE symbol LIKE ?1
+        UNION
+        SELECT rowid FROM tokens_fts WHERE name LIKE ?1
+    )""",
+    "symbol LIKE ?1 OR name LIKE ?1"
+)
+
+def _float(value):
+    return float(value) if value is not None else None
+
+def _images_text(images):
+    if images is None or isinstance(images, str):
+        return images
+    return json.dumps(images)
+
+class LocalReplica:
+    """SQLite copy of the columns the service reads from the token view.
+
+    sync() brings it up to date incrementally: one digest query returns
+    every token's price, market cap and a hash of its symbol, name and
+    images; only tokens whose hash changed are fetched in full, price
+    changes are applied in place and tokens gone from the view are
+    deleted. Reads run the LOCAL_QUERIES equivalents of the registry
+    queries in a worker thread, so they cost a local disk read instead of
+    a WAN round-trip. The replica is only served while its lag (time since
+    the data it holds was read from the view) is within max_lag.
+    """
+
+    def __init__(self, path, max_lag=LOCAL_REPLICA_MAX_LAG):
+        self.path = path
+        self.max_lag = max_lag
+        self.fts = False
+        self.synced_at = None  # when the data in the replica was read from the view
+        self.syncs = 0
+        self.failures = 0
+        self.last_sync = None
+        self._state = {}  # token_id -> (price, market_cap, meta_hash), mirrors the tokens table
+        self._writer = None
+        self._readers = threading.local()
+
+    def open(self):
+        """Create or reopen the replica file (blocking)"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._writer = sqlite3.connect(self.path, check_same_thread=False)
+        # WAL lets readers keep going while a sync writes
+        self._writer.execute("PRAGMA journal_mode=WAL")
+        self._writer.executescript(SCHEMA)
+        try:
+            self._writer.execute(FTS_SCHEMA)
+            self.fts = True
+        except sqlite3.OperationalError as e:
+            logger.warning(f"SQLite without FTS5 trigram support, replica search will scan: {str(e)}")
+        self._writer.commit()
+        self._state = {
+            token_id: (price, market_cap, meta_hash)
+            for token_id, price, market_cap, meta_hash in self._writer.execute(
+                "SELECT token_id, price, market_cap, meta_hash FROM tokens"
+            )
+        }
+        row = self._writer.execute("SELECT value FROM replica_meta WHERE key = 'synced_at'").fetchone()
+        self.synced_at = row[0] if row else None
+        logger.info(f"Opened local replica {self.path} with {len(self._state)} tokens, lag {self.lag()}s")
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def lag(self):
+        """Seconds since the replica's data was read from the view, or None before the first sync"""
+        if self.synced_at is None:
+            return None
+        return round(time.time() - self.synced_at, 1)
+
+    @property
+    def fresh(self):
+        lag = self.lag()
+        return lag is not None and lag <= self.max_lag
+
+    async def sync(self, acquire):
+        """Bring the replica up to date with the view.
+
+        `acquire` opens an async context yielding a connection, or None while
+        the database is unavailable; the sync is then skipped and returns None.
+        """
+        started = time.perf_counter()
+        read_at = time.time()
+        async with acquire() as conn:
+            if conn is None:
+                return None
+            digest = await queries.fetch(conn, "replica_digest")
+            changed_ids, price_updates, removed_ids = self._diff(digest)
+            rows = []
+            for i in range(0, len(changed_ids), REPLICA_FETCH_BATCH):
+                rows.extend(await queries.fetch(conn, "replica_rows", changed_ids[i:i + REPLICA_FETCH_BATCH]))
+        await asyncio.to_thread(self._apply, rows, price_updates, removed_ids, read_at)
+        self.syncs += 1
+        self.last_sync = {
+            "at": read_at,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+            "tokens": len(digest),
+            "rows_fetched": len(rows),
+            "price_updates": len(price_updates),
+            "removed": len(removed_ids),
+        }
+        return self.last_sync
+
+    def _diff(self, digest):
+        """(ids to fetch in full, (price, market_cap, id) updates, ids to delete)"""
+        changed_ids = []
+        price_updates = []
+        seen = set()
+        for row in digest:
+            token_id = row["TOKEN_ID"]
+            seen.add(token_id)
+            price, market_cap = _float(row["CURRENT_PRICE"]), _float(row["MARKET_CAP"])
+            local = self._state.get(token_id)
+            if local is None or local[2] != row["META_HASH"]:
+                changed_ids.append(token_id)
+            elif local[0] != price or local[1] != market_cap:
+                price_updates.append((price, market_cap, token_id))
+        removed_ids = [token_id for token_id in self._state if token_id not in seen]
+        return changed_ids, price_updates, removed_ids
+
+    def _apply(self, rows, price_updates, removed_ids, read_at):
+        """Write one sync's changes in a single transaction (blocking)"""
+        db = self._writer
+        with db:
+            for row in rows:
+                token_id = row["TOKEN_ID"]
+                price, market_cap = _float(row["CURRENT_PRICE"]), _float(row["MARKET_CAP"])
+                db.execute(
+                    "INSERT OR REPLACE INTO tokens VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (token_id, row["TOKEN_SYMBOL"], row["TOKEN_NAME"], _images_text(row["IMAGES"]),
+                     price, market_cap, row["META_HASH"])
+                )
+                if self.fts:
+                    db.execute("DELETE FROM tokens_fts WHERE rowid = ?", (token_id,))
+                    db.execute(
+                        "INSERT INTO tokens_fts (rowid, symbol, name) VALUES (?, ?, ?)",
+                        (token_id, row["TOKEN_SYMBOL"], row["TOKEN_NAME"])
+                    )
+            db.executemany("UPDATE tokens SET price = ?, market_cap = ? WHERE token_id = ?", price_updates)
+            db.executemany("DELETE FROM tokens WHERE token_id = ?", [(i,) for i in removed_ids])
+            if self.fts:
+                db.executemany("DELETE FROM tokens_fts WHERE rowid = ?", [(i,) for i in removed_ids])
+            db.execute("INSERT OR REPLACE INTO replica_meta VALUES ('synced_at', ?)", (read_at,))
+
+        for row in rows:
+            self._state[row["TOKEN_ID"]] = (_float(row["CURRENT_PRICE"]), _float(row["MARKET_CAP"]), row["META_HASH"])
+        for price, market_cap, token_id in price_updates:
+            self._state[token_id] = (price, market_cap, self._state[token_id][2])
+        for token_id in removed_ids:
+            self._state.pop(token_id, None)
+        self.synced_at = read_at
+
+    def _reader(self):
+        conn = getattr(self._readers, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            conn.row_factory = sqlite3.Row
+            self._readers.conn = conn
+        return conn
+
+    def _run(self, name, args):
+        sql = LOCAL_QUERIES[name]
+        if name == "search_tokens" and not self.fts:
+            sql = _SEARCH_WITHOUT_FTS
+        args = [json.dumps(arg) if isinstance(arg, (list, tuple)) else arg for arg in args]
+        return [dict(row) for row in self._reader().execute(sql, args)]
+
+    async def fetch(self, name, *args):
+        """Run a registry query locally and return all rows (as dicts)"""
+        return await asyncio.to_thread(self._run, name, args)
+
+    async def fetchrow(self, name, *args):
+        """Run a registry query locally and return the first row, or None"""
+        rows = await asyncio.to_thread(self._run, name, args)
+        return rows[0] if rows else None
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "tokens": len(self._state),
+            "fts": self.fts,
+            "lag_seconds": self.lag(),
+            "max_lag_seconds": self.max_lag,
+            "serving": self.fresh,
+            "syncs": self.syncs,
+            "failures": self.failures,
+            "last_sync": self.last_sync,
+        }
@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from bisect import bisect_left
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Configuration
+LOOP_LAG_INTERVAL = 0.05  # seconds between lag probes
+# Debug mode: log the stack of anything holding the loop longer than this (ms); 0 = off
+LOOP_BLOCK_THRESHOLD_MS = float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "0"))
+LAG_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+MAX_STALL_SITES = 50
+
+class LoopMonitor:
+    """Measures event loop lag and, optionally, catches what blocks the loop.
+
+    A probe coroutine sleeps LOOP_LAG_INTERVAL and records how late it
+    wakes up into a histogram: any callback that holds the loop shows up
+    as lag. With a block threshold, a watchdog thread also checks that the
+    probe keeps waking up; when it doesn't, it grabs the loop thread's
+    stack while the stall is still in progress, logs it, and attributes
+    the stall's duration to the code that was running.
+    """
+
+    def __init__(self, interval=LOOP_LAG_INTERVAL, block_threshold_ms=None):
+        self.interval = interval
+        self.block_threshold = block_threshold_ms / 1000 if block_threshold_ms else None
+        self.bucket_counts = [0] * (len(LAG_BUCKETS_MS) + 1)
+        self.samples = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+        self.stalls = 0
+        self.sites = {}  # "file:line in function" -> [count, total seconds, max seconds]
+        self._heartbeat = time.perf_counter()
+        self._loop_thread_id = None
+        self._pending_site = None  # site caught by the watchdog, awaiting the stall's duration
+        self._watchdog = None
+        self._stop = threading.Event()
+
+    async def run(self):
+        """Probe loop lag until cancelled (and run the watchdog alongside, if enabled)"""
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.perf_counter()
+        if self.block_threshold:
+            self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._watchdog.start()
+            logger.info(f"Loop block detector on, threshold {self.block_threshold * 1000:.0f} ms")
+        try:
+            while True:
+                start = time.perf_counter()
+                await asyncio.sleep(self.interval)
+                now = time.perf_counter()
+                self._record(max(0.0, now - start - self.interval))
+                self._heartbeat = now
+        finally:
+            self._stop.set()
+
+    def _record(self, lag):
+        self.samples += 1
+        self.total_lag += lag
+        self.max_lag = max(self.max_lag, lag)
+        self.bucket_counts[bisect_left(LAG_BUCKETS_MS, lag * 1000)] += 1
+        site = self._pending_site
+        if site is not None:
+            self._pending_site = None
+            entry = self.sites.setdefault(site, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += lag
+            entry[2] = max(entry[2], lag)
+            if len(self.sites) > MAX_STALL_SITES:
+                # Forget the site with the least total stall time
+                del self.sites[min(self.sites, key=lambda s: self.sites[s][1])]
+
+    def _watch(self):
+        reported = None
+        while not self._stop.wait(self.block_threshold / 4):
+            heartbeat = self._heartbeat
+            if heartbeat == reported:
+                continue
+            if time.perf_counter() - heartbeat < self.interval + self.block_threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            reported = heartbeat
+            self.stalls += 1
+            self._pending_site = self._site(frame)
+            logger.warning(
+                f"Event loop blocked for over {self.block_threshold * 1000:.0f} ms at {self._pending_site}:\n"
+                + "".join(traceback.format_stack(frame))
+            )
+
+    @staticmethod
+    def _site(frame):
+        """Innermost frame outside the standard library and site-packages"""
+        innermost = frame
+        while frame is not None:
+            filename = frame.f_code.co_filename
+            if "site-packages" not in filename and not filename.startswith(sys.base_prefix):
+                break
+            frame = frame.f_back
+        frame = frame or innermost
+        return f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno} in {frame.f_code.co_name}"
+
+    def percentile(self, p):
+        """Upper bound (ms) of the histogram bucket containing the p-th lag sample"""
+        if not self.samples:
+            return None
+        target = p * self.samples
+        seen = 0
+        for bound, count in zip(LAG_BUCKETS_MS + (None,), self.bucket_counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return None
+
+    def stats(self):
+        histogram = {f"le_{bound}ms": count for bound, count in zip(LAG_BUCKETS_MS, self.bucket_counts)}
+        histogram[f"gt_{LAG_BUCKETS_MS[-1]}ms"] = self.bucket_counts[-1]
+        sites = sorted(self.sites.items(), key=lambda item: item[1][1], reverse=True)
+        return {
+            "interval_ms": self.interval * 1000,
+            "samples": self.samples,
+            "lag_ms": {
+                "mean": round(self.total_lag / self.samples * 1000, 3) if self.samples else None,
+                "max": round(self.max_lag * 1000, 3),
+                "p50_le": self.percentile(0.5),
+                "p99_le": self.percentile(0.99),
+                "histogram": histogram,
+            },
+            "block_detector": {
+                "enabled": self.block_threshold is not None,
+                "threshold_ms": self.block_threshold * 1000 if self.block_threshold else None,
+                "stalls": self.stalls,
+                "sites": [
+                    {"site": site, "count": count, "total_ms": round(total * 1000, 1), "max_ms": round(worst * 1000, 1)}
+                    for site, (count, total, worst) in sites
+                ],
+            },
+        }
@@ -1,16 +1,52 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.routing import APIRoute
 from fastapi.middleware.cors import CORSMiddleware
 import httpx
 import os
-import asyncpg
 from dotenv import load_dotenv
 from pydantic import BaseModel
 from typing import List, Optional
 import asyncio
+import gzip
 import logging
-import json
-import locale
 import time
+from contextlib import asynccontextmanager
+
+# Load environment variables before the local modules read their settings
+load_dotenv()
+
+import queries
+from db_pool import PoolManager, DB_UNAVAILABLE_ERRORS
+from circuit_breaker import CircuitBreaker, CircuitOpenError, BREAKERS
+from search_cache import SearchCache, normalize_query
+from heavy_hitters import HeavyHitters
+from portfolio import value_portfolio, invalid_amounts, to_json_list, MAX_PORTFOLIO_HOLDINGS
+from bulk_convert import BulkConversion, detect_format, OUTPUT_MEDIA_TYPES, MSGPACK
+from content_negotiation import NegotiatedResponse, NegotiationMiddleware, prefers_msgpack
+from tiered_cache import TieredCache, MISSING, REDIS_URL
+from redis_protocol import RespClient, LocalRedisServer
+from loop_monitor import LoopMonitor, LOOP_BLOCK_THRESHOLD_MS
+from admission import AdmissionClass, AdmissionController, AdmissionMiddleware, ADMISSION_CAPACITY
+from local_replica import LocalReplica, LOCAL_REPLICA_FILE, LOCAL_REPLICA_SYNC_INTERVAL
+from profiler import (
+    StackSampler, RouteProfile, format_collapsed, PROFILER_TOKEN, PROFILER_HEADER,
+    MAX_WINDOW_SECONDS, MAX_PROFILED_REQUESTS, MAX_ARMED_SECONDS
+)
+from search_sessions import SearchSessionRegistry, SearchSuperseded, SEARCH_SESSION_HEADER
+from price_history import PriceHistory, PRICE_HISTORY_FILE
+from price_feed import PriceFeed
+from ohlc import OHLCStore, OHLC_RESOLUTIONS
+from typeahead_bundle import TypeaheadBundle
+from token_catalog import CanonicalToken, CanonicalTokenTable, CATALOG_REFRESH_INTERVAL
+from snapshot import (
+    Snapshot, SnapshotToken, StartupTimer, encode_images, read_snapshot, write_snapshot,
+    SNAPSHOT_FILE, SNAPSHOT_INTERVAL
+)
+from formatting import (
+    COINMARKETCAP_IDS, FIATS, FIAT_EXCHANGE_RATES,
+    get_default_logo, get_fiat_logo, format_number, extract_image_from_db
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -25,40 +61,65 @@ exchange_rates_cache = {
 }
 exchange_rates_timestamp = 0  # Unix timestamp of last update
 
-# Common token IDs for CoinMarketCap
-COINMARKETCAP_IDS = {
-    "BTC": 1,
-    "ETH": 1027,
-    "USDT": 825,
-    "BNB": 1839,
-    "SOL": 5426,
-    "XRP": 52,
-    "USDC": 3408,
-    "ADA": 2010,
-    "AVAX": 5805,
-    "DOGE": 74,
-    "DOT": 6636,
-    "SHIB": 5994,
-    "TRX": 1958,
-    "LINK": 1975,
-    "MATIC": 3890,
-    "LTC": 2,
-    "TON": 11419
-}
+# Cache of typeahead search results (LRU + TTL, refines longer queries locally)
+search_cache = SearchCache()
 
-def get_default_logo(symbol):
-    """Generate a default logo URL based on token symbol"""
-    # Use CoinMarketCap IDs for common tokens
-    if symbol in COINMARKETCAP_IDS:
-        return f"https://s2.coinmarketcap.com/static/img/coins/64x64/{COINMARKETCAP_IDS[symbol]}.png"
-    
-    # Generate a hash number from the token symbol for other tokens (deterministic)
-    # This ensures the same token always gets the same logo
-    hash_value = sum(ord(c) for c in symbol) % 10000
-    return f"https://s2.coinmarketcap.com/static/img/coins/64x64/{hash_value}.png"
+# Decayed heavy hitters of requested pairs, symbols and searches (for cache
+# sizing, prefetch and warm-up decisions)
+hot_pairs = HeavyHitters()
+hot_symbols = HeavyHitters()
+hot_searches = HeavyHitters()
 
-# Load environment variables
-load_dotenv()
+# Two-tier caches (in-process L1, shared Redis L2 when REDIS_URL is set) so
+# several nodes don't each poll the view and Frankfurter for the same data.
+# Search results and fiat rates already have their own L1 above/below, so
+# they only use the shared tier.
+TOKEN_ROW_CACHE_TTL = 15  # seconds a token's price row is served from cache
+UNKNOWN_SYMBOL_TTL = 60  # seconds an unknown symbol is remembered as unknown
+token_row_cache = TieredCache("token", ttl=TOKEN_ROW_CACHE_TTL, negative_ttl=UNKNOWN_SYMBOL_TTL, l1_max_entries=4096)
+top_tokens_cache = TieredCache("top_tokens", ttl=60, l1_max_entries=32)
+search_results_cache = TieredCache("search", ttl=search_cache.ttl, l1_max_entries=0)
+fiat_rates_cache = TieredCache("fiat_rates", ttl=21600, l1_max_entries=0)
+TIERED_CACHES = (token_row_cache, top_tokens_cache, search_results_cache, fiat_rates_cache)
+
+# In-flight search per client session, so newer keystrokes cancel older queries
+search_sessions = SearchSessionRegistry()
+
+# Rolling per-token price history, filled by the periodic price refresh
+price_history = PriceHistory()
+PRICE_REFRESH_INTERVAL = 60  # seconds between price snapshots
+
+# Pre-aggregated OHLC buckets for sparklines, updated on every new price
+ohlc_store = OHLCStore()
+price_history.listeners.append(ohlc_store.update)
+
+# Versioned current prices with a change log, for /prices?since= delta reads
+price_feed = PriceFeed()
+price_history.listeners.append(price_feed.update)
+SPARKLINE_WINDOW = 86400  # default sparkline span in seconds (24h)
+
+# Canonical symbol -> TOKEN_ID resolution, rebuilt when the catalog changes
+canonical_tokens = CanonicalTokenTable()
+
+# Top tokens and a prefix index for client-side typeahead, rebuilt with the catalog
+typeahead_bundle = TypeaheadBundle()
+
+# Responses served from the warm-start snapshot instead of live data carry this header
+# (also used while a dependency's circuit breaker is open)
+STALE_HEADER = "X-Data-Stale"
+
+# Circuit breakers around the database and the exchange rates API; while one
+# is open, requests fail fast to the last known-good data
+db_breaker = CircuitBreaker("database")
+frankfurter_breaker = CircuitBreaker("frankfurter")
+DB_ACQUIRE_TIMEOUT = 5.0  # seconds
+startup_timer = StartupTimer()
+
+# Local SQLite copy of the token view; read endpoints use it while it is fresh
+local_replica = LocalReplica(LOCAL_REPLICA_FILE) if LOCAL_REPLICA_FILE else None
+
+# Event loop lag histogram (and stalled-callback stacks when LOOP_BLOCK_THRESHOLD_MS is set)
+loop_monitor = LoopMonitor(block_threshold_ms=LOOP_BLOCK_THRESHOLD_MS)
 
 # Get Token Metrics API key
 TOKEN_METRICS_API_KEY = os.getenv("TOKEN_METRICS_API_KEY")
@@ -77,7 +138,28 @@ if not all([DB_HOST, DB_NAME, DB_USER, DB_PASSWORD]):
 
 logger.info("Starting up the application")
 
-app = FastAPI(title="Crypto Converter API")
+# Responses are JSON unless the client asks for MessagePack (Accept: application/msgpack)
+app = FastAPI(title="Crypto Converter API", default_response_class=NegotiatedResponse)
+app.add_middleware(NegotiationMiddleware)
+
+# Admission control: conversions before top tokens before typeahead search,
+# each class with its own share of the capacity and a bounded queue
+admission = AdmissionController([
+    AdmissionClass("convert", priority=3, limit=ADMISSION_CAPACITY, max_queue=4 * ADMISSION_CAPACITY, queue_timeout=2.0),
+    AdmissionClass("top_tokens", priority=2, limit=max(1, ADMISSION_CAPACITY // 2), max_queue=2 * ADMISSION_CAPACITY, queue_timeout=1.0),
+    AdmissionClass("search", priority=1, limit=max(1, ADMISSION_CAPACITY * 3 // 10), max_queue=ADMISSION_CAPACITY, queue_timeout=0.25),
+])
+# Added before CORS so shed responses still carry the CORS headers
+app.add_middleware(
+    AdmissionMiddleware,
+    controller=admission,
+    routes={
+        ("POST", "/convert"): "convert",
+        ("GET", "/tokens"): "top_tokens",
+        ("GET", "/tokens/top"): "top_tokens",
+        ("GET", "/tokens/search"): "search",
+    }
+)
 
 # Configure CORS for development and production
 app.add_middleware(
@@ -103,15 +185,18 @@ app.add_middleware(
     ],
     allow_credentials=True,
     allow_methods=["GET", "POST", "OPTIONS"],
-    allow_headers=["Content-Type", "Authorization", "Accept", "Origin", "X-Requested-With"],
-    expose_headers=["Content-Type", "Content-Length"]
+    allow_headers=["Content-Type", "Authorization", "Accept", "Origin", "X-Requested-With", SEARCH_SESSION_HEADER, PROFILER_HEADER],
+    expose_headers=["Content-Type", "Content-Length", "Retry-After", STALE_HEADER]
 )
 
 # Models
 class ConversionRequest(BaseModel):
-    from_currency: str
-    to_currency: str
+    from_currency: Optional[str] = None
+    to_currency: Optional[str] = None
     amount: float
+    # Token IDs may be given instead of symbols to skip symbol resolution
+    from_token_id: Optional[int] = None
+    to_token_id: Optional[int] = None
 
 class SupportedToken(BaseModel):
     symbol: str
@@ -120,134 +205,13 @@ class SupportedToken(BaseModel):
     logo: Optional[str] = None
     price_usd: Optional[float] = None
 
-# Fiat currencies we support
-FIATS = {
-    "USD": "US Dollar",
-    "EUR": "Euro",
-    "GBP": "British Pound",
-    "JPY": "Japanese Yen",
-    "CAD": "Canadian Dollar",
-    "AUD": "Australian Dollar",
-    "CNY": "Chinese Yuan",
-    "INR": "Indian Rupee",
-    "BRL": "Brazilian Real",
-    "CHF": "Swiss Franc",
-    "VND": "Vietnamese Dong",
-    "NGN": "Nigerian Naira"
-}
-
-# Fiat exchange rates relative to USD (1 USD = X units of currency)
-FIAT_EXCHANGE_RATES = {
-    "USD": 1.0,
-    "EUR": 0.93,    # 1 USD = 0.93 EUR
-    "GBP": 0.80,    # 1 USD = 0.80 GBP
-    "JPY": 156.78,  # 1 USD = 156.78 JPY
-    "CAD": 1.37,    # 1 USD = 1.37 CAD
-    "AUD": 1.52,    # 1 USD = 1.52 AUD
-    "CNY": 7.24,    # 1 USD = 7.24 CNY
-    "INR": 83.37,   # 1 USD = 83.37 INR
-    "BRL": 5.07,    # 1 USD = 5.07 BRL
-    "CHF": 0.91,    # 1 USD = 0.91 CHF
-    "VND": 24900,   # 1 USD = 24,900 VND
-    "NGN": 1412.76  # 1 USD = 1,412.76 NGN
-}
-
-# ISO country codes for flag images
-COUNTRY_CODES = {
-    "USD": "us",
-    "EUR": "eu",
-    "GBP": "gb",
-    "JPY": "jp",
-    "CAD": "ca",
-    "AUD": "au",
-    "CNY": "cn",
-    "INR": "in",
-    "BRL": "br",
-    "CHF": "ch",
-    "VND": "vn",
-    "NGN": "ng"
-}
-
-def get_fiat_logo(currency_code):
-    """Get logo URL for fiat currency using country flag"""
-    if currency_code in COUNTRY_CODES:
-        country_code = COUNTRY_CODES[currency_code].lower()
-        # Using flagcdn.com for reliable flag images
-        return f"https://flagcdn.com/w80/{country_code}.png"
-    return None
+class Holding(BaseModel):
+    symbol: str
+    amount: float
 
-# Configure number formatting for better human readability
-try:
-    # Try to set the preferred locale
-    locale.setlocale(locale.LC_ALL, 'en_US.UTF-8')
-except locale.Error:
-    try:
-        # Try a more generic locale
-        locale.setlocale(locale.LC_ALL, 'en_US')
-    except locale.Error:
-        try:
-            # Try with just the language code
-            locale.setlocale(locale.LC_ALL, 'en')
-        except locale.Error:
-            # If all else fails, use the default locale
-            locale.setlocale(locale.LC_ALL, '')
-            logger.warning("Could not set specific locale, using system default")
-
-def format_number(number, decimal_places=2):
-    """Format number with thousand separators and fixed decimal places"""
-    try:
-        # For very small numbers, use more decimal places
-        original_number = float(number)
-        
-        # Use scientific notation for extremely small numbers
-        if 0 < original_number < 0.0000001:
-            return f"{original_number:.6e}"
-            
-        # Use adaptive decimal places based on number size
-        if original_number < 0.00001:
-            decimal_places = 10
-        elif original_number < 0.0001:
-            decimal_places = 8
-        elif original_number < 0.001:
-            decimal_places = 6
-        elif original_number < 0.1:
-            decimal_places = 4
-            
-        # Round to specified decimal places
-        rounded = round(original_number, decimal_places)
-        
-        # Format with thousand separators - simplified implementation
-        integer_part, *decimal_parts = f"{rounded:.{decimal_places}f}".split('.')
-        decimal_part = decimal_parts[0] if decimal_parts else ''
-        
-        # Add thousand separators to integer part
-        formatted_integer = ""
-        for i, digit in enumerate(reversed(integer_part)):
-            if i > 0 and i % 3 == 0:
-                formatted_integer = ',' + formatted_integer
-            formatted_integer = digit + formatted_integer
-            
-        # Add negative sign if needed
-        if rounded < 0 and not formatted_integer.startswith('-'):
-            formatted_integer = '-' + formatted_integer
-            
-        # Combine parts
-        formatted = formatted_integer
-        if decimal_places > 0:
-            formatted += f".{decimal_part}"
-            
-        # If the number is a whole number ending in .00, remove the decimal part
-        if decimal_places > 0 and formatted.endswith('.' + '0' * decimal_places):
-            formatted = formatted[:-decimal_places-1]
-            
-        # Ensure we never return "0" for small positive values
-        if original_number > 0 and formatted == "0":
-            return f"{original_number:.6e}"
-            
-        return formatted
-    except (ValueError, TypeError):
-        # In case of any error, return the original number as string
-        return str(number)
+class PortfolioRequest(BaseModel):
+    holdings: List[Holding]
+    currencies: List[str] = ["USD"]
 
 async def get_exchange_rates():
     """Fetch current exchange rates from Frankfurter API"""
@@ -260,37 +224,48 @@ async def get_exchange_rates():
             # Try all currencies we're interested in
             supported_symbols = ["EUR", "GBP", "JPY", "CAD", "AUD", "CHF", "INR", "VND", "CNY", "BRL", "NGN"]
             
-            async with httpx.AsyncClient() as client:
-                # Request currencies
-                symbols_param = ','.join(supported_symbols)
-                url = f"{EXCHANGE_RATES_API_URL}?base=USD&symbols={symbols_param}"
+            # Request currencies
+            symbols_param = ','.join(supported_symbols)
+            url = f"{EXCHANGE_RATES_API_URL}?base=USD&symbols={symbols_param}"
+            
+            logger.info(f"Fetching exchange rates from: {url}")
+            
+            async def fetch_rates():
+                # Its own client: the shared load can outlive this request
+                async with httpx.AsyncClient() as client:
+                    response = await client.get(url, timeout=10.0)
+                    response.raise_for_status()
+                    return response.json()
+            
+            # Another node may have fetched them already (shared cache tier)
+            data = await fiat_rates_cache.get_or_load(
+                "frankfurter", lambda: frankfurter_breaker.call(fetch_rates)
+            )
+            
+            # Update the cache with fresh rates
+            if 'rates' in data:
+                # Start with all static rates as default
+                rates = FIAT_EXCHANGE_RATES.copy()
+                # Add USD (base currency)
+                rates["USD"] = 1.0
+                # Update with the fresh rates we got
+                rates.update(data['rates'])
                 
-                logger.info(f"Fetching exchange rates from: {url}")
-                response = await client.get(url, timeout=10.0)
-                response.raise_for_status()
-                data = response.json()
+                # Log which currencies were actually found
+                found_currencies = list(data['rates'].keys())
+                logger.info(f"Found currencies in API response: {found_currencies}")
                 
-                # Update the cache with fresh rates
-                if 'rates' in data:
-                    # Start with all static rates as default
-                    rates = FIAT_EXCHANGE_RATES.copy()
-                    # Add USD (base currency)
-                    rates["USD"] = 1.0
-                    # Update with the fresh rates we got
-                    rates.update(data['rates'])
-                    
-                    # Log which currencies were actually found
-                    found_currencies = list(data['rates'].keys())
-                    logger.info(f"Found currencies in API response: {found_currencies}")
-                    
-                    # Log which currencies are using fallback rates
-                    fallback_currencies = [c for c in FIATS.keys() if c != "USD" and c not in data['rates']]
-                    if fallback_currencies:
-                        logger.info(f"Using fallback rates for: {fallback_currencies}")
-                    
-                    exchange_rates_cache = rates
-                    exchange_rates_timestamp = current_time
-                    logger.info(f"Updated exchange rates from Frankfurter API. Found {len(data['rates'])} currencies.")
+                # Log which currencies are using fallback rates
+                fallback_currencies = [c for c in FIATS.keys() if c != "USD" and c not in data['rates']]
+                if fallback_currencies:
+                    logger.info(f"Using fallback rates for: {fallback_currencies}")
+                
+                exchange_rates_cache = rates
+                exchange_rates_timestamp = current_time
+                logger.info(f"Updated exchange rates from Frankfurter API. Found {len(data['rates'])} currencies.")
+        except CircuitOpenError:
+            # Upstream is known to be down: keep the last known-good rates
+            pass
         except Exception as e:
             logger.error(f"Failed to fetch exchange rates: {str(e)}")
             # If the cache is empty, use the static rates as fallback
@@ -306,11 +281,11 @@ async def root():
     return {"message": "Crypto Converter API is running"}
 
 @app.get("/tokens", response_model=List[SupportedToken])
-async def get_supported_tokens(limit: int = 15):
+async def get_supported_tokens(response: Response, limit: int = 15):
     """Get list of supported tokens for conversion"""
     try:
         # Return top tokens by market cap by default, with a smaller default limit
-        return await get_top_tokens(limit=limit)
+        return await get_top_tokens(response, limit=limit)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching supported tokens: {str(e)}")
 
@@ -326,17 +301,131 @@ async def get_supported_fiats():
         for symbol, name in FIATS.items()
     ]
 
+def get_historical_price(symbol, at, token_id=None):
+    """Get the USD price of a token at a unix timestamp from local price history"""
+    # History is recorded per symbol, for the token the symbol resolves to
+    if token_id is not None and canonical_tokens.resolve(symbol) != token_id:
+        raise HTTPException(status_code=404, detail=f"No price history for token {token_id}")
+    price = price_history.price_at(symbol, at)
+    if price is None:
+        raise HTTPException(status_code=404, detail=f"No price history for {symbol} at {at}")
+    return price
+
+@asynccontextmanager
+async def acquire_connection():
+    """Acquire a pooled connection through the database circuit breaker.
+
+    Yields None while only the in-memory snapshot can be served: during
+    warm-up, or while the breaker is open (callers then answer stale).
+    """
+    if app.state.db_pool is None or not db_breaker.allow():
+        yield None
+        return
+    outcome = None
+    try:
+        async with app.state.db_pool.acquire(timeout=DB_ACQUIRE_TIMEOUT) as conn:
+            yield conn
+        outcome = True
+    except HTTPException:
+        # The database answered; the request itself was bad
+        outcome = True
+        raise
+    except DB_UNAVAILABLE_ERRORS:
+        outcome = False
+        raise
+    finally:
+        db_breaker.finish(outcome)
+
+class DatabaseUnavailable(Exception):
+    """Raised by cache loaders when no connection is available (warm-up or open breaker)"""
+
+def fresh_replica():
+    """The local replica if it is enabled and within its lag budget, else None"""
+    if local_replica is not None and local_replica.fresh:
+        return local_replica
+    return None
+
+def fiat_rates_stale():
+    """Whether fiat rates are the last known-good ones because the upstream is failing"""
+    return not frankfurter_breaker.is_closed
+
+def get_token_from_snapshot(symbol, token_id=None):
+    """Build a view-like row for a token from the in-memory catalog and price history"""
+    token = canonical_tokens.get_by_id(token_id) if token_id is not None else canonical_tokens.get(symbol)
+    if token is None:
+        return None
+    latest = price_history.latest(token.symbol)
+    return {
+        "TOKEN_ID": token.token_id,
+        "TOKEN_SYMBOL": token.symbol,
+        "TOKEN_NAME": token.name,
+        "IMAGES": token.images,
+        "MARKET_CAP": token.market_cap,
+        "CURRENT_PRICE": latest[1] if latest else None
+    }
+
+async def fetch_token_row(symbol, token_id=None):
+    """Fetch the view row of a crypto token, by ID when the symbol can be resolved locally.
+
+    Returns (row, stale). The row comes from the local replica or the
+    token cache when possible; a pooled connection is only acquired on a
+    cache miss. While the database is unavailable it comes from the
+    warm-start snapshot (stale).
+    """
+    if token_id is None:
+        token_id = canonical_tokens.resolve(symbol)
+    replica = fresh_replica()
+    if replica is not None:
+        if token_id is None:
+            return await replica.fetchrow("token_by_symbol", symbol), False
+        return await replica.fetchrow("token_by_id", token_id), False
+    
+    if token_id is None:
+        # Table not built yet, a brand-new listing or an unknown symbol
+        # (cached as unknown): resolve in the database
+        key, name, arg = f"symbol:{symbol}", "token_by_symbol", symbol
+    else:
+        key, name, arg = f"id:{token_id}", "token_by_id", token_id
+    
+    async def load():
+        async with acquire_connection() as conn:
+            if conn is None:
+                raise DatabaseUnavailable()
+            row = await queries.fetchrow(conn, name, arg)
+        return dict(row) if row is not None else None
+    
+    try:
+        return await token_row_cache.get_or_load(key, load), False
+    except DatabaseUnavailable:
+        return get_token_from_snapshot(symbol, token_id), True
+
 @app.post("/convert")
-async def convert_currency(request: ConversionRequest):
-    """Convert between cryptocurrencies and fiat currencies"""
+async def convert_currency(request: ConversionRequest, response: Response, at: Optional[float] = None):
+    """Convert between cryptocurrencies and fiat currencies.
+
+    Pass `at` (unix timestamp) to price crypto legs from local price history
+    instead of the live view; fiat legs always use current exchange rates.
+    Either leg may be given as a token ID (from_token_id / to_token_id)
+    instead of a symbol.
+    """
     try:
-        from_currency = request.from_currency.upper()
-        to_currency = request.to_currency.upper()
+        # A token ID always means a crypto leg; its symbol comes from the view
+        from_currency = "" if request.from_token_id is not None else (request.from_currency or "").upper()
+        to_currency = "" if request.to_token_id is not None else (request.to_currency or "").upper()
         amount = request.amount
         
+        if not (from_currency or request.from_token_id is not None) or not (to_currency or request.to_token_id is not None):
+            raise HTTPException(status_code=400, detail="Specify a currency symbol or token ID for both sides")
+        
         if amount <= 0:
             raise HTTPException(status_code=400, detail="Amount must be greater than zero")
         
+        from_key = from_currency or f"#{request.from_token_id}"
+        to_key = to_currency or f"#{request.to_token_id}"
+        hot_pairs.add(f"{from_key}/{to_key}")
+        hot_symbols.add(from_key)
+        hot_symbols.add(to_key)
+        
         # Get the latest exchange rates
         exchange_rates = await get_exchange_rates()
         
@@ -359,6 +448,9 @@ async def convert_currency(request: ConversionRequest):
             formatted_rate = format_number(rate)
             formatted_amount = format_number(amount)
             
+            if fiat_rates_stale():
+                response.headers[STALE_HEADER] = "true"
+            
             return {
                 "from": from_currency,
                 "to": to_currency,
@@ -374,155 +466,463 @@ async def convert_currency(request: ConversionRequest):
                 "rate_formatted": formatted_rate
             }
         
-        # Get prices from database
-        async with app.state.db_pool.acquire() as conn:
-            from_price = None
-            to_price = None
-            from_logo = None
-            to_logo = None
-            from_name = from_currency
-            to_name = to_currency
-            
-            # If from_currency is crypto, get its USD price and logo
-            if from_currency not in FIATS:
-                query = """
-                SELECT 
-                    "CURRENT_PRICE",
-                    "IMAGES",
-                    "TOKEN_NAME"
-                FROM analytics.crypto_info_hub_current_view 
-                WHERE "TOKEN_SYMBOL" = $1
-                ORDER BY "MARKET_CAP" DESC NULLS LAST
-                LIMIT 1
-                """
-                from_row = await conn.fetchrow(query, from_currency)
-                if from_row:
-                    from_price = from_row["CURRENT_PRICE"] if from_row["CURRENT_PRICE"] else 0
-                    from_name = from_row["TOKEN_NAME"] if from_row["TOKEN_NAME"] else from_currency
-                    
-                    # Get default logo
-                    from_logo = get_default_logo(from_currency)
-                    
-                    # Try to get logo from database
-                    db_logo = extract_image_from_db(from_row["IMAGES"])
-                    if db_logo:
-                        from_logo = db_logo
-            else:
-                # For fiat currencies
-                exchange_rates = await get_exchange_rates()
-                from_rate = exchange_rates.get(from_currency, 1.0)
-                from_price = 1.0 / from_rate  # USD value of 1 unit of from_currency
-                from_name = FIATS.get(from_currency, from_currency)
-                from_logo = get_fiat_logo(from_currency)
-            
-            # If to_currency is crypto, get its USD price and logo
-            if to_currency not in FIATS:
-                query = """
-                SELECT 
-                    "CURRENT_PRICE",
-                    "IMAGES",
-                    "TOKEN_NAME"
-                FROM analytics.crypto_info_hub_current_view 
-                WHERE "TOKEN_SYMBOL" = $1
-                ORDER BY "MARKET_CAP" DESC NULLS LAST
-                LIMIT 1
-                """
-                to_row = await conn.fetchrow(query, to_currency)
-                if to_row:
-                    to_price = to_row["CURRENT_PRICE"] if to_row["CURRENT_PRICE"] else 0
-                    to_name = to_row["TOKEN_NAME"] if to_row["TOKEN_NAME"] else to_currency
-                    
-                    # Get default logo
-                    to_logo = get_default_logo(to_currency)
-                    
-                    # Try to get logo from database
-                    db_logo = extract_image_from_db(to_row["IMAGES"])
-                    if db_logo:
-                        to_logo = db_logo
-            else:
-                # For fiat currencies
-                exchange_rates = await get_exchange_rates()
-                to_rate = exchange_rates.get(to_currency, 1.0)
-                to_price = 1.0 / to_rate  # USD value of 1 unit of to_currency
-                to_name = FIATS.get(to_currency, to_currency)
-                to_logo = get_fiat_logo(to_currency)
-            
-            # Calculate conversion rate
-            if from_price is not None and to_price is not None:
-                if from_currency not in FIATS and to_currency not in FIATS:
-                    # Both are crypto
-                    rate = from_price / to_price
-                else:
-                    # One is fiat
-                    if from_currency in FIATS:
-                        # Get exchange rate for fiat
-                        exchange_rates = await get_exchange_rates()
-                        from_rate = exchange_rates.get(from_currency, 1.0)
-                        
-                        # Fiat to crypto: convert fiat to USD, then to crypto
-                        usd_amount = amount / from_rate  # Convert to USD first
-                        rate = usd_amount * (1 / to_price) / amount  # Then to crypto
-                    else:
-                        # Get exchange rate for fiat
-                        exchange_rates = await get_exchange_rates()
-                        to_rate = exchange_rates.get(to_currency, 1.0)
-                        
-                        # Crypto to fiat: convert crypto to USD, then to fiat
-                        rate = from_price * to_rate  # USD value * exchange rate
+        # Get prices from the replica, the token cache or the database (or the
+        # warm-start snapshot while it is unavailable)
+        stale = False
+        from_price = None
+        to_price = None
+        from_logo = None
+        to_logo = None
+        from_name = from_currency
+        to_name = to_currency
+        
+        # If from_currency is crypto, get its USD price and logo
+        if from_currency not in FIATS:
+            from_row, from_stale = await fetch_token_row(from_currency, request.from_token_id)
+            stale = stale or from_stale
+            if from_row:
+                from_currency = from_row["TOKEN_SYMBOL"] or from_currency
+                from_price = from_row["CURRENT_PRICE"] if from_row["CURRENT_PRICE"] else 0
+                if at is not None:
+                    from_price = get_historical_price(from_currency, at, request.from_token_id)
+                from_name = from_row["TOKEN_NAME"] if from_row["TOKEN_NAME"] else from_currency
                 
-                converted_amount = amount * rate
+                # Get default logo
+                from_logo = get_default_logo(from_currency)
                 
-                # Format values for display
-                formatted_converted = format_number(converted_amount)
-                formatted_rate = format_number(rate)
-                formatted_amount = format_number(amount)
+                # Try to get logo from database
+                db_logo = extract_image_from_db(from_row["IMAGES"])
+                if db_logo:
+                    from_logo = db_logo
+        else:
+            # For fiat currencies
+            exchange_rates = await get_exchange_rates()
+            from_rate = exchange_rates.get(from_currency, 1.0)
+            from_price = 1.0 / from_rate  # USD value of 1 unit of from_currency
+            from_name = FIATS.get(from_currency, from_currency)
+            from_logo = get_fiat_logo(from_currency)
+        
+        # If to_currency is crypto, get its USD price and logo
+        if to_currency not in FIATS:
+            to_row, to_stale = await fetch_token_row(to_currency, request.to_token_id)
+            stale = stale or to_stale
+            if to_row:
+                to_currency = to_row["TOKEN_SYMBOL"] or to_currency
+                to_price = to_row["CURRENT_PRICE"] if to_row["CURRENT_PRICE"] else 0
+                if at is not None:
+                    to_price = get_historical_price(to_currency, at, request.to_token_id)
+                to_name = to_row["TOKEN_NAME"] if to_row["TOKEN_NAME"] else to_currency
                 
-                return {
-                    "from": from_currency,
-                    "to": to_currency,
-                    "from_name": from_name,
-                    "to_name": to_name,
-                    "from_logo": from_logo,
-                    "to_logo": to_logo,
-                    "amount": amount,
-                    "amount_formatted": formatted_amount,
-                    "converted_amount": converted_amount,
-                    "converted_amount_formatted": formatted_converted,
-                    "rate": rate,
-                    "rate_formatted": formatted_rate
-                }
+                # Get default logo
+                to_logo = get_default_logo(to_currency)
+                
+                # Try to get logo from database
+                db_logo = extract_image_from_db(to_row["IMAGES"])
+                if db_logo:
+                    to_logo = db_logo
+        else:
+            # For fiat currencies
+            exchange_rates = await get_exchange_rates()
+            to_rate = exchange_rates.get(to_currency, 1.0)
+            to_price = 1.0 / to_rate  # USD value of 1 unit of to_currency
+            to_name = FIATS.get(to_currency, to_currency)
+            to_logo = get_fiat_logo(to_currency)
+        
+        # Calculate conversion rate
+        if from_price is not None and to_price is not None:
+            if from_currency not in FIATS and to_currency not in FIATS:
+                # Both are crypto
+                rate = from_price / to_price
             else:
-                raise HTTPException(status_code=404, detail="Could not determine prices for one or both currencies")
+                # One is fiat
+                if from_currency in FIATS:
+                    # Get exchange rate for fiat
+                    exchange_rates = await get_exchange_rates()
+                    from_rate = exchange_rates.get(from_currency, 1.0)
+                    
+                    # Fiat to crypto: convert fiat to USD, then to crypto
+                    usd_amount = amount / from_rate  # Convert to USD first
+                    rate = usd_amount * (1 / to_price) / amount  # Then to crypto
+                else:
+                    # Get exchange rate for fiat
+                    exchange_rates = await get_exchange_rates()
+                    to_rate = exchange_rates.get(to_currency, 1.0)
+                    
+                    # Crypto to fiat: convert crypto to USD, then to fiat
+                    rate = from_price * to_rate  # USD value * exchange rate
             
+            converted_amount = amount * rate
+            
+            # Format values for display
+            formatted_converted = format_number(converted_amount)
+            formatted_rate = format_number(rate)
+            formatted_amount = format_number(amount)
+            
+            stale = stale or ((from_currency in FIATS or to_currency in FIATS) and fiat_rates_stale())
+            if stale:
+                response.headers[STALE_HEADER] = "true"
+            startup_timer.response(stale=stale)
+            
+            return {
+                "from": from_currency,
+                "to": to_currency,
+                "from_name": from_name,
+                "to_name": to_name,
+                "from_logo": from_logo,
+                "to_logo": to_logo,
+                "amount": amount,
+                "amount_formatted": formatted_amount,
+                "converted_amount": converted_amount,
+                "converted_amount_formatted": formatted_converted,
+                "rate": rate,
+                "rate_formatted": formatted_rate,
+                "at": at
+            }
+        else:
+            raise HTTPException(status_code=404, detail="Could not determine prices for one or both currencies")
+        
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error during conversion: {str(e)}")
 
+@app.post("/portfolio/value")
+async def get_portfolio_value(request: PortfolioRequest, response: Response):
+    """Value a list of holdings in one or more fiat currencies.
+
+    All crypto prices are fetched in a single query and the values are
+    computed as array products. Per-holding results are column-wise (one
+    list per field, in holding order), followed by per-currency totals.
+    """
+    try:
+        if not request.holdings:
+            raise HTTPException(status_code=400, detail="Portfolio has no holdings")
+        if len(request.holdings) > MAX_PORTFOLIO_HOLDINGS:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_PORTFOLIO_HOLDINGS} holdings per request")
+        
+        exchange_rates = await get_exchange_rates()
+        currencies = [currency.upper() for currency in request.currencies]
+        unsupported = [c for c in currencies if c not in FIATS or c not in exchange_rates]
+        if not currencies or unsupported:
+            raise HTTPException(status_code=400, detail=f"Unsupported target currencies: {', '.join(unsupported)}")
+        
+        symbols = [holding.symbol.upper() for holding in request.holdings]
+        amounts = [holding.amount for holding in request.holdings]
+        invalid = invalid_amounts(amounts)
+        if invalid:
+            # Negative, NaN or infinite amounts would poison the totals
+            raise HTTPException(
+                status_code=422,
+                detail=f"Holding amounts must be finite and non-negative (holdings {', '.join(map(str, invalid[:10]))})"
+            )
+        
+        # Fiat holdings are priced from exchange rates, crypto holdings in one query
+        prices = {}
+        crypto_symbols = []
+        for symbol in set(symbols):
+            if symbol in FIATS:
+                rate = exchange_rates.get(symbol)
+                prices[symbol] = 1.0 / rate if rate else None
+            else:
+                crypto_symbols.append(symbol)
+        
+        stale = fiat_rates_stale()
+        replica = fresh_replica()
+        if crypto_symbols and replica is not None:
+            rows = await replica.fetch("prices_for_symbols", crypto_symbols)
+            prices.update((row["TOKEN_SYMBOL"], row["CURRENT_PRICE"]) for row in rows)
+        elif crypto_symbols:
+            async with acquire_connection() as conn:
+                if conn is None:
+                    stale = True
+                    for symbol in crypto_symbols:
+                        latest = price_history.latest(symbol)
+                        prices[symbol] = latest[1] if latest else None
+                else:
+                    rows = await queries.fetch(conn, "prices_for_symbols", crypto_symbols)
+                    prices.update((row["TOKEN_SYMBOL"], row["CURRENT_PRICE"]) for row in rows)
+        
+        price_usd, values, totals = value_portfolio(
+            symbols, amounts, prices, [exchange_rates[c] for c in currencies]
+        )
+        
+        if stale:
+            response.headers[STALE_HEADER] = "true"
+        startup_timer.response(stale=stale)
+        
+        return {
+            "currencies": currencies,
+            "holdings": {
+                "symbol": symbols,
+                "amount": amounts,
+                "price_usd": to_json_list(price_usd),
+                "value": {currency: to_json_list(values[:, i]) for i, currency in enumerate(currencies)}
+            },
+            "totals": {currency: float(totals[i]) for i, currency in enumerate(currencies)},
+            "unpriced": [symbol for symbol in dict.fromkeys(symbols) if prices.get(symbol) is None]
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error valuing portfolio: {str(e)}")
+
+async def get_price_snapshot():
+    """USD price of every fiat and crypto currency at one point in time, and whether it is stale"""
+    exchange_rates = await get_exchange_rates()
+    stale = fiat_rates_stale()
+    replica = fresh_replica()
+    if replica is not None:
+        rows = await replica.fetch("current_prices")
+        prices = {row["TOKEN_SYMBOL"]: row["CURRENT_PRICE"] for row in rows}
+    else:
+        async with acquire_connection() as conn:
+            if conn is None:
+                stale = True
+                prices = price_history.latest_prices()
+            else:
+                rows = await queries.fetch(conn, "current_prices")
+                prices = {row["TOKEN_SYMBOL"]: row["CURRENT_PRICE"] for row in rows}
+    # Fiat symbols take precedence over tokens with the same ticker, as in /convert
+    for currency, rate in exchange_rates.items():
+        if currency in FIATS and rate:
+            prices[currency] = 1.0 / rate
+    return prices, stale
+
+class BodyStreamingResponse(StreamingResponse):
+    """StreamingResponse whose content may read the request body while it is sent.
+
+    StreamingResponse listens on `receive` for a client disconnect while
+    streaming, which would swallow the request body messages; here the
+    body stream itself raises ClientDisconnect instead.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+@app.post("/convert/bulk")
+async def convert_bulk(request: Request):
+    """Convert a CSV or NDJSON upload of (from, to, amount) rows.
+
+    The body is read as a stream and converted in chunks against one price
+    snapshot taken when the request starts; results are streamed back in
+    the same format, in input order, with an error column (or field) for
+    rows that could not be converted. The last line reports the row count
+    and rows/sec ("# ..." for CSV, {"summary": ...} for NDJSON). With
+    Accept: application/msgpack the results come back as a stream of
+    MessagePack maps shaped like the NDJSON lines instead.
+    """
+    fmt = detect_format(request.headers.get("content-type"))
+    if fmt is None:
+        raise HTTPException(status_code=415, detail="Send text/csv or application/x-ndjson")
+    
+    try:
+        prices, stale = await get_price_snapshot()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error loading prices: {str(e)}")
+    
+    output = MSGPACK if prefers_msgpack(request.headers.get("accept")) else fmt
+    job = BulkConversion(prices, fmt, output)
+    headers = {STALE_HEADER: "true"} if stale else {}
+    return BodyStreamingResponse(job.run(request.stream()), media_type=OUTPUT_MEDIA_TYPES[output], headers=headers)
+
 @app.get("/prices/refresh")
 async def refresh_prices():
     """Force refresh prices (now a no-op since we use Supabase)"""
     return {"message": "Using live prices from database, no refresh needed"}
 
+@app.get("/prices")
+async def get_prices(response: Response, since: Optional[str] = None):
+    """Get current token prices (USD), or only the ones that changed since a cursor.
+
+    Pass the `version` of the previous response as `since` to receive just
+    the tokens whose price changed after it. `full` is true when the
+    response holds every price instead: no cursor, or one that is older
+    than the change log or was issued by another worker, node or process.
+    """
+    prices, full = price_feed.changes_since(since)
+    response.headers["Cache-Control"] = "no-cache"
+    if app.state.db_pool is None or not db_breaker.is_closed:
+        response.headers[STALE_HEADER] = "true"
+    return {"version": price_feed.cursor, "full": full, "prices": prices}
+
+async def refresh_price_history():
+    """Snapshot the current price of every token into the price history"""
+    async with acquire_connection() as conn:
+        if conn is None:
+            # Warm-up or open breaker: try again next interval
+            return
+        rows = await queries.fetch(conn, "current_prices")
+    now = time.time()
+    for row in rows:
+        price_history.record(row["TOKEN_SYMBOL"], row["CURRENT_PRICE"], now)
+    logger.info(f"Recorded prices for {len(rows)} tokens")
+
+async def price_refresh_loop():
+    """Periodically refresh prices in the background"""
+    while True:
+        try:
+            await refresh_price_history()
+        except Exception as e:
+            logger.error(f"Price refresh failed: {str(e)}")
+        await asyncio.sleep(PRICE_REFRESH_INTERVAL)
+
+async def catalog_refresh_loop():
+    """Periodically rebuild the canonical token table when the catalog changes"""
+    while True:
+        try:
+            if await canonical_tokens.refresh(acquire_connection):
+                await asyncio.to_thread(typeahead_bundle.build, list(canonical_tokens.by_symbol.values()))
+        except Exception as e:
+            logger.error(f"Catalog refresh failed: {str(e)}")
+        await asyncio.sleep(CATALOG_REFRESH_INTERVAL)
+
+async def replica_sync_loop():
+    """Keep the local replica in step with the token view"""
+    while True:
+        try:
+            await local_replica.sync(acquire_connection)
+        except Exception as e:
+            local_replica.failures += 1
+            logger.error(f"Local replica sync failed: {str(e)}")
+        await asyncio.sleep(LOCAL_REPLICA_SYNC_INTERVAL)
+
+def build_snapshot():
+    """Capture catalog, latest prices and fiat rates for a warm start"""
+    tokens = []
+    for token in canonical_tokens.by_symbol.values():
+        latest = price_history.latest(token.symbol)
+        price_ts, price = latest if latest else (0, None)
+        tokens.append(SnapshotToken(
+            token.token_id, token.symbol, token.name, encode_images(token.images),
+            token.market_cap, price, price_ts
+        ))
+    return Snapshot(time.time(), dict(exchange_rates_cache), exchange_rates_timestamp, tokens)
+
+def apply_snapshot(snapshot):
+    """Load a warm-start snapshot into the in-memory catalog, price history and fiat rates"""
+    global exchange_rates_cache, exchange_rates_timestamp
+    canonical_tokens.load(
+        CanonicalToken(t.token_id, t.symbol, t.name, t.images, t.market_cap)
+        for t in snapshot.tokens
+    )
+    typeahead_bundle.build(canonical_tokens.by_symbol.values())
+    for token in snapshot.tokens:
+        if token.price is not None:
+            price_history.record(token.symbol, token.price, token.price_ts)
+    if snapshot.rates:
+        exchange_rates_cache = snapshot.rates
+        exchange_rates_timestamp = int(snapshot.rates_timestamp)
+
+async def save_snapshot():
+    """Write the warm-start snapshot, unless there is nothing worth saving yet"""
+    if not canonical_tokens.by_symbol:
+        return
+    snapshot = build_snapshot()
+    await asyncio.to_thread(write_snapshot, SNAPSHOT_FILE, snapshot)
+
+async def snapshot_loop():
+    """Periodically write the warm-start snapshot"""
+    while True:
+        await asyncio.sleep(SNAPSHOT_INTERVAL)
+        try:
+            await save_snapshot()
+        except Exception as e:
+            logger.error(f"Failed to write snapshot: {str(e)}")
+
+async def connect_and_refresh():
+    """Open the database pool, fetch live data and start the background refreshes"""
+    logger.info("Starting up - initializing database connection pool...")
+    # Create a database connection pool with hot statements prepared
+    # on every connection, warmed up and resized from acquire waits
+    pool = await PoolManager.create(
+        host=DB_HOST,
+        port=DB_PORT,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        database=DB_NAME
+    )
+    logger.info("Database connection pool created successfully!")
+    
+    # Prefetch exchange rates
+    await get_exchange_rates()
+    
+    # Live data is available from here on
+    app.state.db_pool = pool
+    startup_timer.ready()
+    
+    # Start the periodic refreshes
+    app.state.price_refresh_task = asyncio.create_task(price_refresh_loop())
+    app.state.catalog_refresh_task = asyncio.create_task(catalog_refresh_loop())
+    app.state.snapshot_task = asyncio.create_task(snapshot_loop())
+    if local_replica is not None:
+        app.state.replica_sync_task = asyncio.create_task(replica_sync_loop())
+
+async def connect_in_background():
+    """Keep retrying the live startup while the snapshot is being served"""
+    while True:
+        try:
+            await connect_and_refresh()
+            return
+        except Exception as e:
+            logger.error(f"Error during startup, serving snapshot and retrying: {str(e)}", exc_info=True)
+            await asyncio.sleep(10)
+
+async def connect_shared_cache():
+    """Attach the shared L2 tier to the caches if REDIS_URL is configured"""
+    app.state.shared_cache = None
+    app.state.local_redis = None
+    if not REDIS_URL:
+        return
+    try:
+        if REDIS_URL == "local":
+            # In-process stand-in: exercises the L2 path without a Redis server
+            app.state.local_redis = LocalRedisServer()
+            port = await app.state.local_redis.start()
+            client = RespClient("127.0.0.1", port)
+        else:
+            client = RespClient.from_url(REDIS_URL)
+        await client.execute("PING")
+    except Exception as e:
+        # Not fatal: the caches work without the shared tier
+        logger.error(f"Shared cache unavailable, continuing without it: {str(e)}")
+        return
+    app.state.shared_cache = client
+    for cache in TIERED_CACHES:
+        cache.l2 = client
+    logger.info("Connected shared cache tier")
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize data on startup"""
-    logger.info("Starting up - initializing database connection pool...")
+    app.state.db_pool = None
+    app.state.loop_monitor_task = asyncio.create_task(loop_monitor.run())
+    await connect_shared_cache()
+    if local_replica is not None:
+        # A replica still within its lag budget serves reads before the database is up
+        await asyncio.to_thread(local_replica.open)
     try:
-        # Create a database connection pool
-        app.state.db_pool = await asyncpg.create_pool(
-            host=DB_HOST,
-            port=DB_PORT,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            database=DB_NAME,
-            min_size=2,
-            max_size=10
-        )
-        logger.info("Database connection pool created successfully!")
+        # Restore persisted price history before anything records newer prices
+        if PRICE_HISTORY_FILE:
+            await asyncio.to_thread(price_history.load, PRICE_HISTORY_FILE)
         
-        # Prefetch exchange rates
-        await get_exchange_rates()
+        # Serve the warm-start snapshot immediately (marked stale) and bring
+        # up the database and live data in the background
+        snapshot = await asyncio.to_thread(read_snapshot, SNAPSHOT_FILE)
+    except Exception as e:
+        logger.error(f"Failed to load warm-start data: {str(e)}", exc_info=True)
+        snapshot = None
+    
+    if snapshot is not None:
+        apply_snapshot(snapshot)
+        startup_timer.snapshot_served(time.time() - snapshot.created_at)
+        app.state.warm_up_task = asyncio.create_task(connect_in_background())
+        return
+    
+    # Nothing to serve yet: block until live data is available
+    try:
+        await connect_and_refresh()
     except Exception as e:
         logger.error(f"Error during startup: {str(e)}", exc_info=True)
         raise
@@ -530,14 +930,243 @@ async def startup_event():
 @app.on_event("shutdown")
 async def shutdown_event():
     """Clean up resources on shutdown"""
+    # Stop background work
+    for task_name in ("warm_up_task", "price_refresh_task", "catalog_refresh_task", "snapshot_task",
+                      "loop_monitor_task", "replica_sync_task"):
+        task = getattr(app.state, task_name, None)
+        if task is not None:
+            task.cancel()
+    
+    # Persist the price history and the warm-start snapshot
+    if PRICE_HISTORY_FILE:
+        try:
+            await asyncio.to_thread(price_history.save, PRICE_HISTORY_FILE)
+        except Exception as e:
+            logger.error(f"Failed to save price history: {str(e)}")
+    try:
+        await save_snapshot()
+    except Exception as e:
+        logger.error(f"Failed to write snapshot: {str(e)}")
+    
     # Close the database connection pool
-    await app.state.db_pool.close()
+    if app.state.db_pool is not None:
+        await app.state.db_pool.close()
+    
+    if local_replica is not None:
+        local_replica.close()
+    
+    if app.state.shared_cache is not None:
+        await app.state.shared_cache.close()
+    if app.state.local_redis is not None:
+        await app.state.local_redis.close()
+
+@app.get("/debug/breakers")
+async def get_breaker_stats():
+    """Get state of the per-dependency circuit breakers"""
+    return {name: breaker.stats() for name, breaker in BREAKERS.items()}
+
+@app.get("/debug/hot-keys")
+async def get_hot_keys(limit: int = 20):
+    """Get the most requested pairs, symbols and search queries (decayed counts)"""
+    return {
+        name: {"top": sketch.most_common(limit), **sketch.stats()}
+        for name, sketch in (("pairs", hot_pairs), ("symbols", hot_symbols), ("searches", hot_searches))
+    }
+
+@app.get("/debug/cache")
+async def get_tiered_cache_stats():
+    """Get hit/miss counters of the two-tier caches"""
+    return {cache.name: cache.stats() for cache in TIERED_CACHES}
+
+@app.get("/debug/admission")
+async def get_admission_stats():
+    """Get in-flight requests, queue depths and shed counts per admission class"""
+    return admission.stats()
+
+@app.get("/debug/replica")
+async def get_replica_stats():
+    """Get the local replica's freshness lag and last sync"""
+    if local_replica is None:
+        return {"enabled": False}
+    return {"enabled": True, **local_replica.stats()}
+
+@app.get("/debug/loop-lag")
+async def get_loop_lag():
+    """Get the event loop lag histogram and the call sites that blocked the loop"""
+    return loop_monitor.stats()
+
+# Armed or finished per-route profiles, by route path
+route_profiles = {}
+
+def check_profiler_token(token):
+    """Profiling is off unless PROFILER_TOKEN is set, and then needs the token in PROFILER_HEADER"""
+    if not PROFILER_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if token != PROFILER_TOKEN:
+        raise HTTPException(status_code=403, detail=f"Missing or wrong {PROFILER_HEADER}")
+
+@app.post("/debug/profile/window")
+async def profile_window(
+    seconds: float = 10,
+    interval_ms: float = 5,
+    x_profiler_token: Optional[str] = Header(None)
+):
+    """Sample every thread of the process for a time window; returns collapsed stacks"""
+    check_profiler_token(x_profiler_token)
+    seconds = min(max(seconds, 0.1), MAX_WINDOW_SECONDS)
+    sampler = StackSampler(interval=max(interval_ms, 1) / 1000)
+    sampler.start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        stacks = sampler.stop()
+    return PlainTextResponse(format_collapsed(stacks))
+
+@app.post("/debug/profile/route")
+async def arm_route_profile(
+    path: str,
+    count: int = 20,
+    interval_ms: float = 5,
+    max_seconds: float = MAX_ARMED_SECONDS,
+    x_profiler_token: Optional[str] = Header(None)
+):
+    """Profile the next `count` requests of a route (e.g. /convert, /tokens/search).
+
+    The profile stops after `max_seconds` with the requests it has seen,
+    or earlier through DELETE /debug/profile/route.
+    """
+    check_profiler_token(x_profiler_token)
+    route = next((r for r in app.routes if isinstance(r, APIRoute) and r.path == path), None)
+    if route is None:
+        raise HTTPException(status_code=404, detail=f"No route {path}")
+    current = route_profiles.get(path)
+    if current is not None and not current.done:
+        raise HTTPException(status_code=409, detail=f"{path} is already being profiled")
+    count = min(max(count, 1), MAX_PROFILED_REQUESTS)
+    max_seconds = min(max(max_seconds, 1), MAX_ARMED_SECONDS)
+    route_profiles[path] = RouteProfile(route, count, interval=max(interval_ms, 1) / 1000, max_seconds=max_seconds)
+    return route_profiles[path].status()
+
+@app.delete("/debug/profile/route")
+async def disarm_route_profile(path: str, x_profiler_token: Optional[str] = Header(None)):
+    """Stop an armed route profile now; its stacks so far stay readable"""
+    check_profiler_token(x_profiler_token)
+    profile = route_profiles.get(path)
+    if profile is None:
+        raise HTTPException(status_code=404, detail=f"No profile for {path}")
+    profile.finish("disarmed")
+    return profile.status()
+
+@app.get("/debug/profile/route")
+async def get_route_profile(path: str, x_profiler_token: Optional[str] = Header(None)):
+    """Collapsed stacks of a finished route profile, or its progress while it runs"""
+    check_profiler_token(x_profiler_token)
+    profile = route_profiles.get(path)
+    if profile is None:
+        raise HTTPException(status_code=404, detail=f"No profile for {path}")
+    if not profile.done:
+        return profile.status()
+    return PlainTextResponse(format_collapsed(profile.stacks))
+
+@app.get("/debug/startup")
+async def get_startup_stats():
+    """Get warm-start and time-to-first-good-response measurements"""
+    return startup_timer.stats()
+
+@app.get("/debug/pool")
+async def get_pool_stats():
+    """Get runtime stats of the database connection pool"""
+    if app.state.db_pool is None:
+        return {"ready": False}
+    return {"ready": True, **app.state.db_pool.stats()}
+
+@app.get("/debug/catalog")
+async def get_catalog_stats():
+    """Get state of the canonical symbol -> token table and the typeahead bundle built from it"""
+    return {**canonical_tokens.stats(), "typeahead_bundle": typeahead_bundle.stats()}
+
+@app.get("/debug/price-history")
+async def get_price_history_stats():
+    """Get size of the in-memory price history"""
+    return {**price_history.stats(), "ohlc": ohlc_store.stats(), "feed": price_feed.stats()}
+
+def get_sparkline(symbol, resolution, window):
+    """Get OHLC buckets of a token covering the last `window` seconds"""
+    if resolution not in OHLC_RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"Unsupported resolution {resolution}, use one of {list(OHLC_RESOLUTIONS)}")
+    buckets = ohlc_store.get(symbol.upper(), resolution, time.time() - window)
+    if buckets is None:
+        return None
+    return {"symbol": symbol.upper(), "resolution": resolution, **buckets}
+
+@app.get("/tokens/sparklines")
+async def get_sparklines(symbols: str, resolution: str = "5m", window: int = SPARKLINE_WINDOW):
+    """Get OHLC sparklines for a comma-separated list of symbols"""
+    result = {}
+    for symbol in symbols.split(","):
+        symbol = symbol.strip()
+        if not symbol:
+            continue
+        sparkline = get_sparkline(symbol, resolution, window)
+        if sparkline is not None:
+            result[sparkline["symbol"]] = sparkline
+    return result
+
+@app.get("/tokens/{symbol}/sparkline")
+async def get_token_sparkline(symbol: str, resolution: str = "5m", window: int = SPARKLINE_WINDOW):
+    """Get OHLC sparkline buckets for a token (t = bucket start, o/h/l/c = prices)"""
+    sparkline = get_sparkline(symbol, resolution, window)
+    if sparkline is None:
+        raise HTTPException(status_code=404, detail=f"No price history for {symbol.upper()}")
+    return sparkline
+
+@app.get("/tokens/typeahead")
+async def get_typeahead_manifest(response: Response):
+    """Get the version and URL of the current typeahead bundle"""
+    response.headers["Cache-Control"] = "public, max-age=60"
+    return typeahead_bundle.manifest()
+
+@app.get("/tokens/typeahead/{version}")
+async def get_typeahead_bundle(version: str, request: Request):
+    """Get a typeahead bundle: the top tokens by market cap and a prefix index.
+
+    Bundles are immutable (the version is a digest of the content), so
+    they are cached for a year; clients read /tokens/typeahead to find the
+    current version.
+    """
+    body = typeahead_bundle.body(version)
+    if body is None:
+        raise HTTPException(status_code=404, detail=f"Unknown typeahead bundle {version}")
+    headers = {"Cache-Control": "public, max-age=31536000, immutable", "ETag": f'"{version}"', "Vary": "Accept-Encoding"}
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        headers["Content-Encoding"] = "gzip"
+    else:
+        body = gzip.decompress(body)
+    return Response(body, media_type="application/json", headers=headers)
+
+@app.get("/debug/search-cache")
+async def get_search_cache_stats():
+    """Get hit/miss counters of the typeahead search cache"""
+    return {**search_cache.stats(), "sessions": search_sessions.stats()}
 
 @app.get("/tokens/search")
-async def search_tokens(query: str):
-    """Search for tokens by name or symbol using direct database connection"""
+async def search_tokens(
+    query: str,
+    response: Response,
+    session: Optional[str] = None,
+    x_search_session: Optional[str] = Header(None)
+):
+    """Search for tokens by name or symbol using direct database connection.
+
+    Clients may identify their typeahead session with the X-Search-Session
+    header (or the `session` query parameter); a new query from the same
+    session cancels the previous one if it is still running.
+    """
+    session_id = x_search_session or session
     if not query or len(query) < 1:
         return []  # Don't search for very short queries
+    
+    hot_searches.add(normalize_query(query))
         
     try:
         # First check against our pre-defined list of tokens
@@ -574,95 +1203,99 @@ async def search_tokens(query: str):
                     )
                 )
                 
-        # Now query the database for more matches
-        async with app.state.db_pool.acquire() as conn:
-            # SQL query for search
-            sql_query = """
-            SELECT 
-                "TOKEN_ID", 
-                "TOKEN_NAME", 
-                "TOKEN_SYMBOL", 
-                "CURRENT_PRICE", 
-                "IMAGES"
-            FROM 
-                analytics.crypto_info_hub_current_view 
-            WHERE 
-                LOWER("TOKEN_SYMBOL") LIKE LOWER($1) OR 
-                LOWER("TOKEN_NAME") LIKE LOWER($1)
-            ORDER BY 
-                CASE 
-                    WHEN LOWER("TOKEN_SYMBOL") = LOWER($2) THEN 1
-                    WHEN LOWER("TOKEN_SYMBOL") LIKE LOWER($2 || '%') THEN 2
-                    WHEN LOWER("TOKEN_NAME") = LOWER($2) THEN 3
-                    WHEN LOWER("TOKEN_NAME") LIKE LOWER($2 || '%') THEN 4
-                    ELSE 5
-                END,
-                "MARKET_CAP" DESC NULLS LAST
-            LIMIT 20
-            """
-            
-            # Execute query with timeout
-            search_pattern = f'%{query}%'
+        # Answer from the typeahead cache when possible (repeated or refining
+        # queries), otherwise query the database for more matches
+        rows = search_cache.get(query)
+        if rows is None:
+            # Then from the shared tier, filled by any node
+            shared_rows = await search_results_cache.get(normalize_query(query))
+            if shared_rows is not MISSING:
+                rows = shared_rows
+                search_cache.put(query, rows)
+        replica = fresh_replica()
+        if rows is None and replica is not None:
+            rows = await replica.fetch("search_tokens", f'%{query}%', query)
+            search_cache.put(query, rows)
+        if rows is None:
+            # The timeout is handled outside the connection block so the
+            # database breaker records it as a failure
             try:
-                rows = await asyncio.wait_for(
-                    conn.fetch(sql_query, search_pattern, query),
-                    timeout=3.0  # Reduce timeout to 3 seconds for faster response
-                )
+                async with acquire_connection() as conn:
+                    if conn is None:
+                        # Warming up or database circuit open: only the predefined matches are available
+                        response.headers[STALE_HEADER] = "true"
+                        return predefined_results
+                    
+                    # Execute query with timeout; asyncpg cancels the statement
+                    # server-side when the timeout fires
+                    search_pattern = f'%{query}%'
+                    rows = await search_sessions.run(
+                        session_id,
+                        queries.fetch(conn, "search_tokens", search_pattern, query, timeout=3.0)
+                    )
             except asyncio.TimeoutError:
                 logger.warning(f"Search query timed out for: {query}")
                 # Return predefined results if we have any
                 if predefined_results:
                     return predefined_results
                 raise HTTPException(status_code=504, detail="Database query timed out")
+            rows = [dict(row) for row in rows]
+            search_cache.put(query, rows)
+            await search_results_cache.put(normalize_query(query), rows)
+        
+        # Process DB results
+        db_results = []
+        seen_symbols = set(item.symbol for item in predefined_results)
+        
+        for row in rows:
+            symbol = row["TOKEN_SYMBOL"]
             
-            # Process DB results
-            db_results = []
-            seen_symbols = set(item.symbol for item in predefined_results)
-            
-            for row in rows:
-                symbol = row["TOKEN_SYMBOL"]
-                
-                # Skip if we already have this symbol from predefined list
-                if symbol in seen_symbols:
-                    continue
-                    
-                seen_symbols.add(symbol)
+            # Skip if we already have this symbol from predefined list
+            if symbol in seen_symbols:
+                continue
                 
-                # Get default logo
-                default_logo = get_default_logo(symbol)
-                
-                # Extract logo from database
-                db_logo = extract_image_from_db(row["IMAGES"])
-                
-                # Use database logo if available, otherwise default
-                logo = db_logo if db_logo else default_logo
-                
-                token_obj = SupportedToken(
-                    symbol=symbol,
-                    name=row["TOKEN_NAME"],
-                    token_id=row["TOKEN_ID"],
-                    logo=logo,
-                    price_usd=row["CURRENT_PRICE"] if row["CURRENT_PRICE"] else 0
-                )
-                db_results.append(token_obj)
+            seen_symbols.add(symbol)
             
-            # Update prices for predefined results if we have them in the DB
-            for predef_token in predefined_results:
-                for db_token in db_results:
-                    if predef_token.symbol == db_token.symbol:
-                        predef_token.price_usd = db_token.price_usd
-                        break
+            # Get default logo
+            default_logo = get_default_logo(symbol)
             
-            # Combine results, with predefined results first
-            combined_results = predefined_results + [
-                t for t in db_results if t.symbol not in set(pt.symbol for pt in predefined_results)
-            ]
+            # Extract logo from database
+            db_logo = extract_image_from_db(row["IMAGES"])
             
-            return combined_results
+            # Use database logo if available, otherwise default
+            logo = db_logo if db_logo else default_logo
+            
+            token_obj = SupportedToken(
+                symbol=symbol,
+                name=row["TOKEN_NAME"],
+                token_id=row["TOKEN_ID"],
+                logo=logo,
+                price_usd=row["CURRENT_PRICE"] if row["CURRENT_PRICE"] else 0
+            )
+            db_results.append(token_obj)
+        
+        # Update prices for predefined results if we have them in the DB
+        for predef_token in predefined_results:
+            for db_token in db_results:
+                if predef_token.symbol == db_token.symbol:
+                    predef_token.price_usd = db_token.price_usd
+                    break
+        
+        # Combine results, with predefined results first
+        combined_results = predefined_results + [
+            t for t in db_results if t.symbol not in set(pt.symbol for pt in predefined_results)
+        ]
+        
+        return combined_results
             
     except asyncio.TimeoutError:
         # If we got here, we already tried returning predefined results
         raise HTTPException(status_code=504, detail="Database query timed out")
+    except SearchSuperseded:
+        # A newer query from the same session took over; nobody will read this result
+        raise HTTPException(status_code=409, detail="Search superseded by a newer query")
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in search_tokens: {str(e)}", exc_info=True)
         # Fall back to predefined results if possible
@@ -670,57 +1303,61 @@ async def search_tokens(query: str):
             return predefined_results
         raise HTTPException(status_code=500, detail=f"Error searching tokens: {str(e)}")
 
+def get_top_tokens_from_snapshot(limit):
+    """Top tokens by market cap from the in-memory catalog, shaped like "top_tokens" rows"""
+    rows = [get_token_from_snapshot(symbol) for symbol in canonical_tokens.by_symbol]
+    rows = [row for row in rows if row["MARKET_CAP"] and row["CURRENT_PRICE"] is not None]
+    rows.sort(key=lambda row: row["MARKET_CAP"], reverse=True)
+    return rows[:limit]
+
 @app.get("/tokens/top", response_model=List[SupportedToken])
-async def get_top_tokens(limit: int = 50):
+async def get_top_tokens(response: Response, limit: int = 50):
     """Get top tokens by market cap"""
     try:
-        async with app.state.db_pool.acquire() as conn:
-            # Query to get top tokens by market cap
-            query = """
-            SELECT 
-                "TOKEN_ID", 
-                "TOKEN_NAME", 
-                "TOKEN_SYMBOL", 
-                "CURRENT_PRICE", 
-                "MARKET_CAP",
-                "IMAGES"
-            FROM 
-                analytics.crypto_info_hub_current_view
-            WHERE 
-                "MARKET_CAP" IS NOT NULL AND
-                "MARKET_CAP" > 0 AND
-                "CURRENT_PRICE" IS NOT NULL
-            ORDER BY 
-                "MARKET_CAP" DESC
-            LIMIT $1
-            """
+        # The replica and the cache answer without a pooled connection;
+        # one is only acquired on a cache miss
+        stale = False
+        replica = fresh_replica()
+        if replica is not None:
+            rows = await replica.fetch("top_tokens", limit)
+        else:
+            async def load_top_tokens():
+                async with acquire_connection() as conn:
+                    if conn is None:
+                        raise DatabaseUnavailable()
+                    return [dict(row) for row in await queries.fetch(conn, "top_tokens", limit)]
+            try:
+                rows = await top_tokens_cache.get_or_load(str(limit), load_top_tokens)
+            except DatabaseUnavailable:
+                rows = get_top_tokens_from_snapshot(limit)
+                response.headers[STALE_HEADER] = "true"
+                stale = True
+        logger.info(f"Fetched {len(rows)} tokens from database")
+        
+        result = []
+        for row in rows:
+            # Get the default logo
+            symbol = row["TOKEN_SYMBOL"]
+            default_logo = get_default_logo(symbol)
             
-            rows = await conn.fetch(query, limit)
-            logger.info(f"Fetched {len(rows)} tokens from database")
+            # Extract logo from database IMAGES
+            db_logo = extract_image_from_db(row["IMAGES"])
             
-            result = []
-            for row in rows:
-                # Get the default logo
-                symbol = row["TOKEN_SYMBOL"]
-                default_logo = get_default_logo(symbol)
-                
-                # Extract logo from database IMAGES
-                db_logo = extract_image_from_db(row["IMAGES"])
-                
-                # Use database logo if available, otherwise use default
-                logo = db_logo if db_logo else default_logo
-                logger.info(f"Logo for {symbol}: {logo} (default: {default_logo}, db: {db_logo})")
-                
-                token_obj = SupportedToken(
-                    symbol=symbol,
-                    name=row["TOKEN_NAME"],
-                    token_id=row["TOKEN_ID"],
-                    logo=logo,
-                    price_usd=row["CURRENT_PRICE"] if row["CURRENT_PRICE"] else 0
-                )
-                result.append(token_obj)
+            # Use database logo if available, otherwise use default
+            logo = db_logo if db_logo else default_logo
+            logger.info(f"Logo for {symbol}: {logo} (default: {default_logo}, db: {db_logo})")
             
-            return result
+            token_obj = SupportedToken(
+                symbol=symbol,
+                name=row["TOKEN_NAME"],
+                token_id=row["TOKEN_ID"],
+                logo=logo,
+                price_usd=row["CURRENT_PRICE"] if row["CURRENT_PRICE"] else 0
+            )
+            result.append(token_obj)
+        
+        startup_timer.response(stale=stale)
+        return result
     except Exception as e:
         logger.error(f"Error in get_top_tokens: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error fetching top tokens: {str(e)}")
@@ -773,37 +1410,16 @@ async def test_images():
         logger.error(f"Error in test_images: {str(e)}", exc_info=True)
         return {"error": str(e)}
 
-def extract_image_from_db(images_data):
-    """Extract image URL from database IMAGES field"""
-    if not images_data:
-        return None
-        
-    # If images_data is a string, try to parse it as JSON
-    if isinstance(images_data, str):
-        try:
-            images_data = json.loads(images_data)
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse IMAGES JSON: {e}")
-            return None
-            
-    # Now extract the image URL
-    if isinstance(images_data, dict):
-        if "small" in images_data:
-            return images_data["small"]
-        elif "thumb" in images_data:
-            return images_data["thumb"]
-        elif "large" in images_data:
-            return images_data["large"]
-    
-    return None
-
 @app.get("/rates")
-async def get_current_rates():
+async def get_current_rates(response: Response):
     """Get current exchange rates for all supported fiat currencies"""
     try:
         rates = await get_exchange_rates()
         formatted_rates = {}
         
+        if fiat_rates_stale():
+            response.headers[STALE_HEADER] = "true"
+        
         # Format rates for display
         for currency, rate in rates.items():
             if currency in FIATS:
@@ -0,0 +1,131 @@
+import logging
+import os
+from array import array
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Resolutions kept per token: name -> (bucket seconds, buckets kept)
+OHLC_RESOLUTIONS = {
+    "1m": (60, 120),     # last 2 hours
+    "5m": (300, 288),    # last 24 hours
+    "1h": (3600, 168),   # last 7 days
+}
+OHLC_MAX_TOKENS = int(os.getenv("OHLC_MAX_TOKENS", "5000"))
+
+class OHLCSeries:
+    """Ring of fixed-width OHLC buckets for one token at one resolution.
+
+    Bucket starts are uint32 unix seconds and OHLC values float32 (plenty for
+    charting), so a bucket costs 20 bytes.
+    """
+
+    __slots__ = ("bucket_seconds", "starts", "opens", "highs", "lows", "closes", "start", "count")
+
+    def __init__(self, bucket_seconds, capacity):
+        self.bucket_seconds = bucket_seconds
+        self.starts = array("I", bytes(4 * capacity))
+        self.opens = array("f", bytes(4 * capacity))
+        self.highs = array("f", bytes(4 * capacity))
+        self.lows = array("f", bytes(4 * capacity))
+        self.closes = array("f", bytes(4 * capacity))
+        self.start = 0
+        self.count = 0
+
+    def update(self, ts, price):
+        """Fold a new price into the current bucket or open the next one"""
+        capacity = len(self.starts)
+        bucket = int(ts) - int(ts) % self.bucket_seconds
+        if self.count:
+            last = (self.start + self.count - 1) % capacity
+            last_bucket = self.starts[last]
+            if bucket == last_bucket:
+                if price > self.highs[last]:
+                    self.highs[last] = price
+                if price < self.lows[last]:
+                    self.lows[last] = price
+                self.closes[last] = price
+                return
+            if bucket < last_bucket:
+                return
+        if self.count < capacity:
+            i = (self.start + self.count) % capacity
+            self.count += 1
+        else:
+            i = self.start
+            self.start = (self.start + 1) % capacity
+        self.starts[i] = bucket
+        self.opens[i] = price
+        self.highs[i] = price
+        self.lows[i] = price
+        self.closes[i] = price
+
+    def _ordered(self, values, first):
+        """Values from the first-th oldest bucket on, as a list"""
+        capacity = len(values)
+        begin = self.start + first
+        end = self.start + self.count
+        if end <= capacity:
+            return values[begin:end].tolist()
+        if begin >= capacity:
+            return values[begin - capacity:end - capacity].tolist()
+        return values[begin:].tolist() + values[:end - capacity].tolist()
+
+    def since(self, since_ts):
+        """Columnar buckets starting at or after since_ts"""
+        capacity = len(self.starts)
+        # Buckets are ordered, so skip the ones that are too old by bisection
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.starts[(self.start + mid) % capacity] < since_ts:
+                lo = mid + 1
+            else:
+                hi = mid
+        return {
+            "t": self._ordered(self.starts, lo),
+            "o": self._ordered(self.opens, lo),
+            "h": self._ordered(self.highs, lo),
+            "l": self._ordered(self.lows, lo),
+            "c": self._ordered(self.closes, lo),
+        }
+
+class OHLCStore:
+    """Incrementally maintained OHLC buckets at several resolutions for every token"""
+
+    def __init__(self, resolutions=OHLC_RESOLUTIONS, max_tokens=OHLC_MAX_TOKENS):
+        self.resolutions = resolutions
+        self.max_tokens = max_tokens
+        self._series = {}  # symbol -> {resolution: OHLCSeries}
+        self.dropped_tokens = 0
+
+    def update(self, symbol, ts, price):
+        """Price listener: fold a new price into every resolution"""
+        series = self._series.get(symbol)
+        if series is None:
+            if len(self._series) >= self.max_tokens:
+                self.dropped_tokens += 1
+                return
+            series = self._series[symbol] = {
+                name: OHLCSeries(bucket_seconds, capacity)
+                for name, (bucket_seconds, capacity) in self.resolutions.items()
+            }
+        for ohlc in series.values():
+            ohlc.update(ts, price)
+
+    def get(self, symbol, resolution, since_ts):
+        """Buckets of a token at a resolution since a timestamp, or None if unknown"""
+        series = self._series.get(symbol)
+        if series is None:
+            return None
+        return series[resolution].since(since_ts)
+
+    def stats(self):
+        """Size counters"""
+        buckets = sum(capacity for _, capacity in self.resolutions.values())
+        return {
+            "tokens": len(self._series),
+            "bytes_per_token": buckets * 20,
+            "max_bytes": buckets * 20 * self.max_tokens,
+            "dropped_tokens": self.dropped_tokens,
+        }
@@ -0,0 +1,46 @@
+import numpy as np
+
+# Configuration
+MAX_PORTFOLIO_HOLDINGS = 50000
+
+def value_portfolio(symbols, amounts, prices, rates):
+    """Value holdings in several currencies at once.
+
+    symbols: symbol of each holding (may repeat)
+    amounts: amount of each holding
+    prices: symbol -> USD price; symbols without a price are left unvalued
+    rates: 1 USD in each target currency
+
+    Each distinct symbol's price is looked up once; the USD values are
+    amounts * prices, and the value in every currency is the outer product
+    of those with the rate vector. Returns (price_usd, values, totals):
+    per-holding USD prices (NaN if unpriced), a holdings x currencies
+    matrix and the per-currency totals over the priced holdings.
+    """
+    index = {}
+    codes = np.fromiter(
+        (index.setdefault(symbol, len(index)) for symbol in symbols),
+        dtype=np.intp,
+        count=len(symbols)
+    )
+    unique_prices = np.fromiter(
+        (np.nan if prices.get(symbol) is None else prices[symbol] for symbol in index),
+        dtype=np.float64,
+        count=len(index)
+    )
+    price_usd = unique_prices[codes]
+    usd_values = np.asarray(amounts, dtype=np.float64) * price_usd
+    values = np.multiply.outer(usd_values, np.asarray(rates, dtype=np.float64))
+    totals = np.nansum(values, axis=0)
+    return price_usd, values, totals
+
+def invalid_amounts(amounts):
+    """Indices of the holding amounts that are negative, NaN or infinite"""
+    amounts = np.asarray(amounts, dtype=np.float64)
+    return np.flatnonzero(~(np.isfinite(amounts) & (amounts >= 0))).tolist()
+
+def to_json_list(column):
+    """Array -> list for a JSON response, with NaN as null"""
+    if not np.isnan(column).any():
+        return column.tolist()
+    return [None if value != value else value for value in column.tolist()]
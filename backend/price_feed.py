@@ -0,0 +1,85 @@
+import logging
+import os
+import secrets
+from collections import deque
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Configuration
+PRICE_FEED_LOG_SIZE = int(os.getenv("PRICE_FEED_LOG_SIZE", "100000"))  # price changes kept for delta reads
+
+class PriceFeed:
+    """Current price of every token with a version per change, for delta sync.
+
+    Every price change gets the next version of one increasing sequence and
+    goes into a bounded change log, so changes_since(cursor) costs one step
+    per change since the cursor instead of one per token. Cursors are
+    "<epoch>:<version>", where the epoch is random per feed instance: a
+    cursor from another worker, another node or before a restart never
+    matches, and gets a full snapshot instead of a delta with gaps.
+    """
+
+    def __init__(self, log_size=PRICE_FEED_LOG_SIZE):
+        self.epoch = secrets.token_hex(6)
+        self.version = 0
+        self.floor = 0  # changes after this version are all in the log
+        self.prices = {}           # symbol -> (price, version of its last change)
+        self._log = deque()        # (version, symbol), oldest first
+        self.log_size = log_size
+        self.full_reads = 0
+        self.delta_reads = 0
+
+    def update(self, symbol, ts, price):
+        """Price history listener: version the price if it changed"""
+        current = self.prices.get(symbol)
+        if current is not None and current[0] == price:
+            return
+        self.version += 1
+        self.prices[symbol] = (price, self.version)
+        self._log.append((self.version, symbol))
+        while len(self._log) > self.log_size:
+            self.floor = self._log.popleft()[0]
+
+    @property
+    def cursor(self):
+        """Cursor of the current version, for the next changes_since()"""
+        return f"{self.epoch}:{self.version}"
+
+    def _parse(self, cursor):
+        """Version of a cursor from this feed, or None"""
+        epoch, _, version = (cursor or "").partition(":")
+        if epoch != self.epoch:
+            return None
+        try:
+            return int(version)
+        except ValueError:
+            return None
+
+    def changes_since(self, cursor=None):
+        """(prices, full): tokens changed after `cursor`, or every price if the
+        cursor is missing, malformed, older than the log or from another feed"""
+        since = self._parse(cursor)
+        if since is None or since < self.floor or since > self.version:
+            self.full_reads += 1
+            return {symbol: price for symbol, (price, _) in self.prices.items()}, True
+        self.delta_reads += 1
+        changed = {}
+        for version, symbol in reversed(self._log):
+            if version <= since:
+                break
+            if symbol not in changed:
+                changed[symbol] = self.prices[symbol][0]
+        return changed, False
+
+    def stats(self):
+        return {
+            "epoch": self.epoch,
+            "version": self.version,
+            "floor": self.floor,
+            "tokens": len(self.prices),
+            "log_entries": len(self._log),
+            "log_size": self.log_size,
+            "full_reads": self.full_reads,
+            "delta_reads": self.delta_reads,
+        }
@@ -0,0 +1,208 @@
+import logging
+import os
+import struct
+import time
+from array import array
+from pathlib import Path
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Configuration
+PRICE_HISTORY_POINTS = int(os.getenv("PRICE_HISTORY_POINTS", "360"))  # 6h at one point per minute
+PRICE_HISTORY_MAX_TOKENS = int(os.getenv("PRICE_HISTORY_MAX_TOKENS", "20000"))
+PRICE_HISTORY_FILE = os.getenv("PRICE_HISTORY_FILE")  # optional persistence
+
+# How far past the newest point a lookup may still be answered with it
+PRICE_HISTORY_MAX_EXTRAPOLATION = 180.0  # seconds
+
+# File layout: magic, capacity, token count, then per token:
+# symbol length, symbol, point count, timestamps (uint32), prices (float64)
+_FILE_MAGIC = b"CCHIST01"
+_FILE_HEADER = struct.Struct("<8sII")
+_TOKEN_HEADER = struct.Struct("<B")
+_COUNT = struct.Struct("<I")
+
+class PriceRing:
+    """Fixed-size ring buffer of (timestamp, price) points for one token.
+
+    Timestamps are whole unix seconds in a uint32 array and prices float64,
+    so a ring costs 12 bytes per point regardless of how many are filled.
+    """
+
+    __slots__ = ("timestamps", "prices", "start", "count")
+
+    def __init__(self, capacity):
+        self.timestamps = array("I", bytes(4 * capacity))
+        self.prices = array("d", bytes(8 * capacity))
+        self.start = 0
+        self.count = 0
+
+    @property
+    def capacity(self):
+        return len(self.prices)
+
+    def _index(self, i):
+        """Physical index of the i-th oldest point"""
+        return (self.start + i) % len(self.prices)
+
+    def append(self, ts, price):
+        """Add a point; out-of-order or duplicate timestamps are ignored"""
+        ts = int(ts)
+        if self.count and ts <= self.timestamps[self._index(self.count - 1)]:
+            return False
+        capacity = len(self.prices)
+        if self.count < capacity:
+            i = self._index(self.count)
+            self.count += 1
+        else:
+            i = self.start
+            self.start = (self.start + 1) % capacity
+        self.timestamps[i] = ts
+        self.prices[i] = price
+        return True
+
+    def points(self):
+        """All points, oldest first"""
+        return [(self.timestamps[self._index(i)], self.prices[self._index(i)]) for i in range(self.count)]
+
+    def latest(self):
+        """Newest (timestamp, price) or None"""
+        if not self.count:
+            return None
+        i = self._index(self.count - 1)
+        return self.timestamps[i], self.prices[i]
+
+    def price_at(self, ts):
+        """Price at ts, linearly interpolated between the surrounding points"""
+        if not self.count:
+            return None
+        oldest = self.timestamps[self.start]
+        newest_i = self._index(self.count - 1)
+        newest = self.timestamps[newest_i]
+        if ts < oldest:
+            return None
+        if ts >= newest:
+            if ts - newest > PRICE_HISTORY_MAX_EXTRAPOLATION:
+                return None
+            return self.prices[newest_i]
+
+        # Binary search for the first point with timestamp > ts
+        lo, hi = 0, self.count - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.timestamps[self._index(mid)] > ts:
+                hi = mid
+            else:
+                lo = mid + 1
+        right = self._index(lo)
+        left = self._index(lo - 1)
+        t0, t1 = self.timestamps[left], self.timestamps[right]
+        p0, p1 = self.prices[left], self.prices[right]
+        return p0 + (p1 - p0) * (ts - t0) / (t1 - t0)
+
+class PriceHistory:
+    """In-memory price time series for every token, bounded per token and in total"""
+
+    def __init__(self, capacity=PRICE_HISTORY_POINTS, max_tokens=PRICE_HISTORY_MAX_TOKENS):
+        self.capacity = capacity
+        self.max_tokens = max_tokens
+        self._rings = {}
+        self.dropped_tokens = 0
+        self.listeners = []  # callables(symbol, ts, price) notified of every new point
+
+    def record(self, symbol, price, ts=None):
+        """Record the price of a token at ts (defaults to now)"""
+        if price is None:
+            return
+        ts = time.time() if ts is None else ts
+        ring = self._rings.get(symbol)
+        if ring is None:
+            if len(self._rings) >= self.max_tokens:
+                self.dropped_tokens += 1
+                return
+            ring = self._rings[symbol] = PriceRing(self.capacity)
+        price = float(price)
+        if ring.append(ts, price):
+            for listener in self.listeners:
+                listener(symbol, ts, price)
+
+    def record_many(self, prices, ts=None):
+        """Record a {symbol: price} snapshot taken at ts"""
+        ts = time.time() if ts is None else ts
+        for symbol, price in prices.items():
+            self.record(symbol, price, ts)
+
+    def price_at(self, symbol, ts):
+        """Interpolated price of a token at ts, or None if outside the recorded window"""
+        ring = self._rings.get(symbol)
+        return ring.price_at(ts) if ring is not None else None
+
+    def latest(self, symbol):
+        """Newest (timestamp, price) of a token, or None"""
+        ring = self._rings.get(symbol)
+        return ring.latest() if ring is not None else None
+
+    def latest_prices(self):
+        """{symbol: newest price} of every token with history"""
+        prices = {}
+        for symbol, ring in self._rings.items():
+            latest = ring.latest()
+            if latest is not None:
+                prices[symbol] = latest[1]
+        return prices
+
+    def series(self, symbol):
+        """Recorded (timestamp, price) points of a token, oldest first"""
+        ring = self._rings.get(symbol)
+        return ring.points() if ring is not None else []
+
+    def stats(self):
+        """Size counters"""
+        return {
+            "tokens": len(self._rings),
+            "points_per_token": self.capacity,
+            "bytes_per_token": self.capacity * 12,
+            "max_bytes": self.capacity * 12 * self.max_tokens,
+            "dropped_tokens": self.dropped_tokens,
+        }
+
+    def save(self, path):
+        """Persist all rings to a compact binary file"""
+        path = Path(path)
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(_FILE_HEADER.pack(_FILE_MAGIC, self.capacity, len(self._rings)))
+            for symbol, ring in self._rings.items():
+                encoded = symbol.encode("utf-8")[:255]
+                points = ring.points()
+                f.write(_TOKEN_HEADER.pack(len(encoded)))
+                f.write(encoded)
+                f.write(_COUNT.pack(len(points)))
+                array("I", (p[0] for p in points)).tofile(f)
+                array("d", (p[1] for p in points)).tofile(f)
+        os.replace(tmp_path, path)
+        logger.info(f"Saved price history for {len(self._rings)} tokens to {path}")
+
+    def load(self, path):
+        """Load rings from a file written by save()"""
+        path = Path(path)
+        if not path.exists():
+            return
+        with open(path, "rb") as f:
+            magic, _capacity, token_count = _FILE_HEADER.unpack(f.read(_FILE_HEADER.size))
+            if magic != _FILE_MAGIC:
+                logger.error(f"Ignoring price history file {path}: bad header")
+                return
+            for _ in range(token_count):
+                (length,) = _TOKEN_HEADER.unpack(f.read(_TOKEN_HEADER.size))
+                symbol = f.read(length).decode("utf-8")
+                (count,) = _COUNT.unpack(f.read(_COUNT.size))
+                timestamps = array("I")
+                timestamps.fromfile(f, count)
+                prices = array("d")
+                prices.fromfile(f, count)
+                # Keep the newest points if the configured capacity shrank
+                for ts, price in zip(timestamps[-self.capacity:], prices[-self.capacity:]):
+                    self.record(symbol, price, ts)
+        logger.info(f"Loaded price history for {len(self._rings)} tokens from {path}")
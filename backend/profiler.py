@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Configuration
+PROFILER_TOKEN = os.getenv("PROFILER_TOKEN")  # profiling endpoints are disabled unless set
+PROFILER_HEADER = "X-Profiler-Token"
+DEFAULT_SAMPLE_INTERVAL = 0.005  # seconds between stack samples
+MAX_WINDOW_SECONDS = 60
+MAX_PROFILED_REQUESTS = 1000
+MAX_ARMED_SECONDS = 600  # an armed route profile stops after this long even if requests are missing
+# While sampling, the interpreter switches threads this often (seconds), so
+# the sampler also sees short CPU bursts that never release the GIL
+SAMPLING_SWITCH_INTERVAL = 0.0005
+
+_active_samplers = 0
+_saved_switch_interval = None
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def collapse(frame):
+    """Stack of a frame in collapsed format (root first, ';'-separated)"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+def format_collapsed(stacks):
+    """Counter of collapsed stacks -> flame-graph input ("stack count" per line)"""
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+class StackSampler:
+    """Samples thread stacks from a background thread.
+
+    Nothing is installed in the sampled code: when no sampler is running
+    there is no overhead at all. While one runs, the interpreter's thread
+    switch interval is lowered so the sampler gets to run. Coroutines show up while they run on the
+    event loop thread, so a profile is on-loop (CPU) time, not time spent
+    awaiting I/O.
+    """
+
+    def __init__(self, interval=DEFAULT_SAMPLE_INTERVAL, thread_ids=None, stack_filter=None):
+        self.interval = interval
+        self.thread_ids = thread_ids  # None = every thread except the sampler
+        self.stack_filter = stack_filter  # frame -> bool, for keeping only relevant stacks
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        global _active_samplers, _saved_switch_interval
+        if _active_samplers == 0:
+            _saved_switch_interval = sys.getswitchinterval()
+            sys.setswitchinterval(SAMPLING_SWITCH_INTERVAL)
+        _active_samplers += 1
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        global _active_samplers
+        if self._thread is None or self._stop.is_set():
+            return self.stacks
+        self._stop.set()
+        self._thread.join()
+        _active_samplers -= 1
+        if _active_samplers == 0:
+            sys.setswitchinterval(_saved_switch_interval)
+        return self.stacks
+
+    def _run(self):
+        names = {}
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                    continue
+                if self.stack_filter is not None and not self.stack_filter(frame):
+                    continue
+                if thread_id not in names:
+                    names.update((t.ident, t.name) for t in threading.enumerate())
+                    names.setdefault(thread_id, str(thread_id))
+                self.stacks[f"{names[thread_id]};{collapse(frame)}"] += 1
+
+def _runs_code(frame, code):
+    while frame is not None:
+        if frame.f_code is code:
+            return True
+        frame = frame.f_back
+    return False
+
+class RouteProfile:
+    """Profiles the next `count` requests of one route.
+
+    The route's ASGI app is wrapped only while the profile is armed and
+    restored afterwards. Meanwhile the event loop thread (the thread that
+    armed the profile) is sampled, keeping only stacks that run inside the
+    route's endpoint function. Must be created on the event loop: the
+    profile finishes by itself after `max_seconds`, so a route that gets
+    no requests doesn't keep the sampler (and the lowered switch
+    interval) around; finish() stops it earlier.
+    """
+
+    def __init__(self, route, count, interval=DEFAULT_SAMPLE_INTERVAL, max_seconds=MAX_ARMED_SECONDS):
+        self.route = route
+        self.count = count
+        self.interval = interval
+        self.completed = 0
+        self.stacks = Counter()
+        self.started_at = time.time()
+        self.finished_at = None
+        self.expires_at = self.started_at + max_seconds
+        self.reason = None  # why it finished: "completed", "expired" or "disarmed"
+        endpoint_code = route.endpoint.__code__
+        self._sampler = StackSampler(
+            interval,
+            thread_ids={threading.get_ident()},
+            stack_filter=lambda frame: _runs_code(frame, endpoint_code)
+        )
+        self._sampler.start()
+        self._original_app = route.app
+        self._wrapper = self._profiled_app
+        route.app = self._wrapper
+        self._expiry = asyncio.get_running_loop().call_later(max_seconds, self.finish, "expired")
+
+    @property
+    def done(self):
+        return self.finished_at is not None
+
+    async def _profiled_app(self, scope, receive, send):
+        try:
+            await self._original_app(scope, receive, send)
+        finally:
+            self.completed += 1
+            if self.completed >= self.count:
+                self.finish()
+
+    def finish(self, reason="completed"):
+        """Restore the route and stop sampling"""
+        if self.route.app is self._wrapper:
+            self.route.app = self._original_app
+        if self.finished_at is None:
+            self._expiry.cancel()
+            self.stacks = self._sampler.stop()
+            self.finished_at = time.time()
+            self.reason = reason
+            logger.info(f"Profiled {self.completed} requests of {self.route.path} ({reason})")
+
+    def status(self):
+        return {
+            "path": self.route.path,
+            "requested": self.count,
+            "completed": self.completed,
+            "done": self.done,
+            "reason": self.reason,
+            "expires_at": self.expires_at,
+            "stacks": len(self.stacks),
+        }
@@ -0,0 +1,225 @@
+import logging
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Hot SQL statements used on the request path, keyed by name.
+# Every entry is prepared once per pool connection by init_connection(),
+# so requests skip the parse/plan round-trip on a fresh connection.
+QUERIES = {
+    # Resolve a crypto symbol to its price, logo and name (largest market cap wins)
+    "token_by_symbol": """
+    SELECT
+        "CURRENT_PRICE",
+        "IMAGES",
+        "TOKEN_NAME",
+        "TOKEN_SYMBOL"
+    FROM analytics.crypto_info_hub_current_view
+    WHERE "TOKEN_SYMBOL" = $1
+    ORDER BY "MARKET_CAP" DESC NULLS LAST
+    LIMIT 1
+    """,
+
+    # Same columns as "token_by_symbol", for a token already resolved to its ID
+    "token_by_id": """
+    SELECT
+        "CURRENT_PRICE",
+        "IMAGES",
+        "TOKEN_NAME",
+        "TOKEN_SYMBOL"
+    FROM analytics.crypto_info_hub_current_view
+    WHERE "TOKEN_ID" = $1
+    LIMIT 1
+    """,
+
+    # Typeahead search over symbol and name
+    "search_tokens": """
+    SELECT
+        "TOKEN_ID",
+        "TOKEN_NAME",
+        "TOKEN_SYMBOL",
+        "CURRENT_PRICE",
+        "MARKET_CAP",
+        "IMAGES"
+    FROM
+        analytics.crypto_info_hub_current_view
+    WHERE
+        LOWER("TOKEN_SYMBOL") LIKE LOWER($1) OR
+        LOWER("TOKEN_NAME") LIKE LOWER($1)
+    ORDER BY
+        CASE
+            WHEN LOWER("TOKEN_SYMBOL") = LOWER($2) THEN 1
+            WHEN LOWER("TOKEN_SYMBOL") LIKE LOWER($2 || '%') THEN 2
+            WHEN LOWER("TOKEN_NAME") = LOWER($2) THEN 3
+            WHEN LOWER("TOKEN_NAME") LIKE LOWER($2 || '%') THEN 4
+            ELSE 5
+        END,
+        "MARKET_CAP" DESC NULLS LAST
+    LIMIT 20
+    """,
+
+    # Top tokens by market cap
+    "top_tokens": """
+    SELECT
+        "TOKEN_ID",
+        "TOKEN_NAME",
+        "TOKEN_SYMBOL",
+        "CURRENT_PRICE",
+        "MARKET_CAP",
+        "IMAGES"
+    FROM
+        analytics.crypto_info_hub_current_view
+    WHERE
+        "MARKET_CAP" IS NOT NULL AND
+        "MARKET_CAP" > 0 AND
+        "CURRENT_PRICE" IS NOT NULL
+    ORDER BY
+        "MARKET_CAP" DESC
+    LIMIT $1
+    """,
+
+    # Current price of every symbol, with the same tie-break as "token_by_symbol"
+    "current_prices": """
+    SELECT DISTINCT ON ("TOKEN_SYMBOL")
+        "TOKEN_SYMBOL",
+        "CURRENT_PRICE"
+    FROM
+        analytics.crypto_info_hub_current_view
+    WHERE
+        "CURRENT_PRICE" IS NOT NULL
+    ORDER BY
+        "TOKEN_SYMBOL",
+        "MARKET_CAP" DESC NULLS LAST
+    """,
+
+    # Current prices of a set of symbols in one round-trip (same tie-break as "current_prices")
+    "prices_for_symbols": """
+    SELECT DISTINCT ON ("TOKEN_SYMBOL")
+        "TOKEN_SYMBOL",
+        "CURRENT_PRICE"
+    FROM
+        analytics.crypto_info_hub_current_view
+    WHERE
+        "TOKEN_SYMBOL" = ANY($1::text[]) AND
+        "CURRENT_PRICE" IS NOT NULL
+    ORDER BY
+        "TOKEN_SYMBOL",
+        "MARKET_CAP" DESC NULLS LAST
+    """,
+
+    # Canonical token of every symbol (largest market cap wins, as in "token_by_symbol")
+    "canonical_tokens": """
+    SELECT DISTINCT ON ("TOKEN_SYMBOL")
+        "TOKEN_ID",
+        "TOKEN_SYMBOL",
+        "TOKEN_NAME",
+        "MARKET_CAP",
+        "IMAGES"
+    FROM
+        analytics.crypto_info_hub_current_view
+    WHERE
+        "TOKEN_SYMBOL" IS NOT NULL
+    ORDER BY
+        "TOKEN_SYMBOL",
+        "MARKET_CAP" DESC NULLS LAST
+    """,
+
+    # Digest of the canonical symbol -> TOKEN_ID resolution; changes when a
+    # token is listed, delisted or a symbol collision flips on market cap
+    "catalog_fingerprint": """
+    SELECT md5(string_agg(c."TOKEN_SYMBOL" || ':' || c."TOKEN_ID", ',' ORDER BY c."TOKEN_SYMBOL"))
+    FROM (
+        SELECT DISTINCT ON ("TOKEN_SYMBOL")
+            "TOKEN_SYMBOL",
+            "TOKEN_ID"
+        FROM
+            analytics.crypto_info_hub_current_view
+        WHERE
+            "TOKEN_SYMBOL" IS NOT NULL
+        ORDER BY
+            "TOKEN_SYMBOL",
+            "MARKET_CAP" DESC NULLS LAST
+    ) c
+    """,
+
+    # Per-token change keys for the local replica: prices inline, the rest
+    # as a digest so unchanged names and images are not transferred again
+    "replica_digest": """
+    SELECT DISTINCT ON ("TOKEN_ID")
+        "TOKEN_ID",
+        "CURRENT_PRICE",
+        "MARKET_CAP",
+        md5(concat_ws('|', "TOKEN_SYMBOL", "TOKEN_NAME", "IMAGES"::text)) AS "META_HASH"
+    FROM
+        analytics.crypto_info_hub_current_view
+    WHERE
+        "TOKEN_ID" IS NOT NULL
+    ORDER BY
+        "TOKEN_ID",
+        "MARKET_CAP" DESC NULLS LAST
+    """,
+
+    # Full replica rows of the tokens whose digest changed
+    "replica_rows": """
+    SELECT DISTINCT ON ("TOKEN_ID")
+        "TOKEN_ID",
+        "TOKEN_SYMBOL",
+        "TOKEN_NAME",
+        "IMAGES",
+        "CURRENT_PRICE",
+        "MARKET_CAP",
+        md5(concat_ws('|', "TOKEN_SYMBOL", "TOKEN_NAME", "IMAGES"::text)) AS "META_HASH"
+    FROM
+        analytics.crypto_info_hub_current_view
+    WHERE
+        "TOKEN_ID" = ANY($1::bigint[])
+    ORDER BY
+        "TOKEN_ID",
+        "MARKET_CAP" DESC NULLS LAST
+    """,
+}
+
+# Prepared statements per backend connection, keyed by server PID.
+# asyncpg hands out proxies from the pool, so the PID is the stable
+# handle that works for both the raw connection and its proxy.
+_prepared_statements = {}
+
+async def init_connection(conn):
+    """Pool init hook: prepare every registered statement on a new connection"""
+    pid = conn.get_server_pid()
+    statements = {}
+    for name, sql in QUERIES.items():
+        try:
+            statements[name] = await conn.prepare(sql)
+        except Exception as e:
+            # A broken statement should not take the whole pool down;
+            # fetch() falls back to the plain query text for it
+            logger.error(f"Failed to prepare statement '{name}': {e}")
+    _prepared_statements[pid] = statements
+    conn.add_termination_listener(lambda _conn: _prepared_statements.pop(pid, None))
+    logger.info(f"Prepared {len(statements)} statements on connection {pid}")
+
+def _get_statement(conn, name):
+    """Return the prepared statement for this connection, if any"""
+    return _prepared_statements.get(conn.get_server_pid(), {}).get(name)
+
+async def fetch(conn, name, *args, timeout=None):
+    """Run a registered query and return all rows"""
+    statement = _get_statement(conn, name)
+    if statement is None:
+        return await conn.fetch(QUERIES[name], *args, timeout=timeout)
+    return await statement.fetch(*args, timeout=timeout)
+
+async def fetchrow(conn, name, *args, timeout=None):
+    """Run a registered query and return the first row"""
+    statement = _get_statement(conn, name)
+    if statement is None:
+        return await conn.fetchrow(QUERIES[name], *args, timeout=timeout)
+    return await statement.fetchrow(*args, timeout=timeout)
+
+async def fetchval(conn, name, *args, timeout=None):
+    """Run a registered query and return the first column of the first row"""
+    statement = _get_statement(conn, name)
+    if statement is None:
+        return await conn.fetchval(QUERIES[name], *args, timeout=timeout)
+    return await statement.fetchval(*args, timeout=timeout)
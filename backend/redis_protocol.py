@@ -0,0 +1,419 @@
+import asyncio
+import logging
+import time
+from urllib.parse import urlsplit
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+class RespError(Exception):
+    """Error reply from a Redis-protocol server"""
+
+_WRONGTYPE = b"-WRONGTYPE Operation against a key holding the wrong kind of value\r\n"
+
+def encode_command(args):
+    """Encode a command as a RESP array of bulk strings"""
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+async def read_reply(reader):
+    """Read one RESP reply (bulk strings come back as bytes)"""
+    line = await reader.readline()
+    if not line:
+        raise ConnectionResetError("Connection closed by server")
+    prefix, payload = line[:1], line[1:-2]
+    if prefix == b"+":
+        return payload.decode()
+    if prefix == b"-":
+        raise RespError(payload.decode())
+    if prefix == b":":
+        return int(payload)
+    if prefix == b"$":
+        length = int(payload)
+        if length < 0:
+            return None
+        return (await reader.readexactly(length + 2))[:-2]
+    if prefix == b"*":
+        length = int(payload)
+        if length < 0:
+            return None
+        return [await read_reply(reader) for _ in range(length)]
+    raise RespError(f"Unexpected reply: {line!r}")
+
+def encode_reply(value):
+    """Encode a RESP reply: bytes as bulk strings, None as a null, int, list"""
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(encode_reply(item) for item in value)
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+class RespClient:
+    """Minimal asyncio client for the commands the shared cache and the
+    partitioned price refresh need.
+
+    Keeps up to `max_connections` connections, each running one command at
+    a time. The timeout covers waiting for a free connection, connecting
+    and the reply, so a slow or saturated server never holds a caller
+    longer than that. A connection whose command failed (other than an
+    error reply) is dropped; the next command opens a new one.
+    """
+
+    def __init__(self, host="localhost", port=6379, db=0, password=None, timeout=0.25, max_connections=4):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self._slots = asyncio.Semaphore(max_connections)
+        self._idle = []  # (reader, writer) ready for a command
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        """redis://[:password@]host[:port][/db]"""
+        parts = urlsplit(url)
+        db = parts.path.lstrip("/")
+        return cls(
+            host=parts.hostname or "localhost",
+            port=parts.port or 6379,
+            db=int(db) if db else 0,
+            password=parts.password,
+            **kwargs
+        )
+
+    async def _connect(self):
+        conn = await asyncio.open_connection(self.host, self.port)
+        try:
+            if self.password:
+                await self._send(conn, "AUTH", self.password)
+            if self.db:
+                await self._send(conn, "SELECT", self.db)
+        except BaseException:
+            conn[1].close()
+            raise
+        return conn
+
+    @staticmethod
+    async def _send(conn, *args):
+        reader, writer = conn
+        writer.write(encode_command(args))
+        await writer.drain()
+        return await read_reply(reader)
+
+    async def execute(self, *args):
+        """Run one command, with the client timeout covering the wait for a connection, connect and reply"""
+        return await asyncio.wait_for(self._execute(args), self.timeout)
+
+    async def _execute(self, args):
+        async with self._slots:
+            conn = self._idle.pop() if self._idle else await self._connect()
+            try:
+                reply = await self._send(conn, *args)
+            except RespError:
+                # The server answered; the connection is still in step
+                self._idle.append(conn)
+                raise
+            except BaseException:
+                conn[1].close()
+                raise
+            self._idle.append(conn)
+            return reply
+
+    async def transaction_if(self, key, expected, *commands):
+        """Run `commands` in one MULTI/EXEC if `key` holds `expected` (bytes).
+
+        The key is WATCHed before it is read, so the transaction is also
+        dropped when the key changes or expires before EXEC. Returns the
+        replies, or None if the commands didn't run.
+        """
+        return await asyncio.wait_for(self._transaction_if(key, expected, commands), self.timeout)
+
+    async def _transaction_if(self, key, expected, commands):
+        async with self._slots:
+            conn = self._idle.pop() if self._idle else await self._connect()
+            try:
+                await self._send(conn, "WATCH", key)
+                if await self._send(conn, "GET", key) != expected:
+                    await self._send(conn, "UNWATCH")
+                    replies = None
+                else:
+                    await self._send(conn, "MULTI")
+                    for command in commands:
+                        await self._send(conn, *command)
+                    replies = await self._send(conn, "EXEC")
+            except BaseException:
+                # Possibly inside MULTI: don't hand the connection to another command
+                conn[1].close()
+                raise
+            self._idle.append(conn)
+            return replies
+
+    async def get(self, key):
+        return await self.execute("GET", key)
+
+    async def set(self, key, value, px=None, nx=False, xx=False):
+        """"OK", or None when NX/XX kept the value from being set"""
+        args = ["SET", key, value]
+        if px is not None:
+            args += ["PX", int(px)]
+        if nx:
+            args.append("NX")
+        if xx:
+            args.append("XX")
+        return await self.execute(*args)
+
+    async def incr(self, key):
+        return await self.execute("INCR", key)
+
+    async def delete(self, key):
+        return await self.execute("DEL", key)
+
+    async def mget(self, *keys):
+        return await self.execute("MGET", *keys)
+
+    async def sadd(self, key, *members):
+        return await self.execute("SADD", key, *members)
+
+    async def srem(self, key, *members):
+        return await self.execute("SREM", key, *members)
+
+    async def smembers(self, key):
+        return await self.execute("SMEMBERS", key)
+
+    async def hset(self, key, mapping):
+        args = [item for field_value in mapping.items() for item in field_value]
+        return await self.execute("HSET", key, *args)
+
+    async def hgetall(self, key):
+        """Hash contents as a dict of bytes"""
+        reply = await self.execute("HGETALL", key)
+        return dict(zip(reply[::2], reply[1::2]))
+
+    async def close(self):
+        """Close the idle connections (ones in use are closed when their command fails)"""
+        idle, self._idle = self._idle, []
+        for _, writer in idle:
+            writer.close()
+
+class _Session:
+    """Transaction state of one connection to the stand-in"""
+
+    def __init__(self):
+        self.watched = {}  # key -> its version when WATCHed
+        self.queue = None  # commands queued since MULTI
+
+class LocalRedisServer:
+    """In-process stand-in for Redis speaking the same protocol.
+
+    Supports PING, GET, MGET, SET (EX/PX, NX/XX), INCR, DEL, SADD, SREM,
+    SMEMBERS, HSET, HGETALL, AUTH, SELECT, FLUSHALL and
+    WATCH/UNWATCH/MULTI/EXEC/DISCARD, which is enough to run the shared cache tier and partitioned refresh
+    on one machine or in tests without a real Redis. As in Redis, a
+    watched key that is written, deleted or expires aborts the EXEC.
+    """
+
+    def __init__(self):
+        self.data = {}  # key -> (value, expires_at or None)
+        self.versions = {}  # watched key -> number of writes since it was first watched
+        self.watchers = {}  # watched key -> connections watching it
+        self.server = None
+        self.port = None
+
+    async def start(self, host="127.0.0.1", port=0):
+        self.server = await asyncio.start_server(self._handle, host, port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        logger.info(f"Local Redis stand-in listening on {host}:{self.port}")
+        return self.port
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        session = _Session()
+        try:
+            while True:
+                try:
+                    command = await read_reply(reader)
+                except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+                    break
+                writer.write(self._dispatch_session(session, command))
+                await writer.drain()
+        finally:
+            self._unwatch(session)
+            writer.close()
+
+    def _dispatch_session(self, session, command):
+        """Transaction commands, which keep per-connection state; the rest go to _dispatch"""
+        name = command[0].decode().upper() if isinstance(command, list) and command else None
+        if name == "MULTI":
+            if session.queue is not None:
+                return b"-ERR MULTI calls can not be nested\r\n"
+            session.queue = []
+            return b"+OK\r\n"
+        if name == "EXEC":
+            if session.queue is None:
+                return b"-ERR EXEC without MULTI\r\n"
+            queue, session.queue = session.queue, None
+            # Expire watched keys first: an expiry counts as a write
+            for key in session.watched:
+                self._get(key)
+            changed = any(self.versions[key] != version for key, version in session.watched.items())
+            self._unwatch(session)
+            if changed:
+                return b"*-1\r\n"
+            return b"*%d\r\n" % len(queue) + b"".join(self._dispatch(queued) for queued in queue)
+        if name == "DISCARD":
+            if session.queue is None:
+                return b"-ERR DISCARD without MULTI\r\n"
+            session.queue = None
+            self._unwatch(session)
+            return b"+OK\r\n"
+        if session.queue is not None:
+            if name == "WATCH":
+                return b"-ERR WATCH inside MULTI is not allowed\r\n"
+            session.queue.append(command)
+            return b"+QUEUED\r\n"
+        if name == "WATCH" and len(command) > 1:
+            for key in command[1:]:
+                self._get(key)
+                if key not in session.watched:
+                    self.watchers[key] = self.watchers.get(key, 0) + 1
+                    session.watched[key] = self.versions.setdefault(key, 0)
+            return b"+OK\r\n"
+        if name == "UNWATCH":
+            self._unwatch(session)
+            return b"+OK\r\n"
+        return self._dispatch(command)
+
+    def _unwatch(self, session):
+        for key in session.watched:
+            self.watchers[key] -= 1
+            if not self.watchers[key]:
+                del self.watchers[key]
+                del self.versions[key]
+        session.watched = {}
+
+    def _touch(self, key):
+        """Record a write to a key, for the transactions watching it"""
+        if key in self.versions:
+            self.versions[key] += 1
+
+    def _dispatch(self, command):
+        if not isinstance(command, list) or not command:
+            return b"-ERR protocol error\r\n"
+        name = command[0].decode().upper()
+        args = command[1:]
+        if name == "PING":
+            return b"+PONG\r\n"
+        if name in ("AUTH", "SELECT"):
+            return b"+OK\r\n"
+        if name == "FLUSHALL":
+            for key in self.data:
+                self._touch(key)
+            self.data.clear()
+            return b"+OK\r\n"
+        if name == "GET" and len(args) == 1:
+            value = self._get(args[0])
+            if value is not None and not isinstance(value, bytes):
+                return _WRONGTYPE
+            return encode_reply(value)
+        if name == "MGET" and args:
+            values = [self._get(key) for key in args]
+            return encode_reply([value if isinstance(value, bytes) else None for value in values])
+        if name == "SET" and len(args) >= 2:
+            return self._set(args[0], args[1], [a.decode().upper() for a in args[2:]])
+        if name == "INCR" and len(args) == 1:
+            value = self._get(args[0])
+            if value is not None and not isinstance(value, bytes):
+                return _WRONGTYPE
+            try:
+                value = int(value or 0) + 1
+            except ValueError:
+                return b"-ERR value is not an integer or out of range\r\n"
+            # Keeps the TTL of an existing key, like Redis
+            _, expires_at = self.data.get(args[0], (None, None))
+            self.data[args[0]] = (str(value).encode(), expires_at)
+            self._touch(args[0])
+            return encode_reply(value)
+        if name == "DEL":
+            removed = 0
+            for key in args:
+                if self.data.pop(key, None) is not None:
+                    self._touch(key)
+                    removed += 1
+            return b":%d\r\n" % removed
+        if name in ("SADD", "SREM", "SMEMBERS", "HSET", "HGETALL") and args:
+            return self._dispatch_collection(name, args[0], args[1:])
+        return b"-ERR unknown command '%s'\r\n" % name.encode()
+
+    def _set(self, key, value, options):
+        expires_at = None
+        condition = None
+        while options:
+            option = options.pop(0)
+            if option in ("PX", "EX") and options:
+                ttl = int(options.pop(0)) / (1000 if option == "PX" else 1)
+                expires_at = time.monotonic() + ttl
+            elif option in ("NX", "XX") and condition is None:
+                condition = option
+            else:
+                return b"-ERR syntax error\r\n"
+        exists = self._get(key) is not None
+        if (condition == "NX" and exists) or (condition == "XX" and not exists):
+            return encode_reply(None)
+        self.data[key] = (value, expires_at)
+        self._touch(key)
+        return b"+OK\r\n"
+
+    def _dispatch_collection(self, name, key, args):
+        """Set and hash commands (collections never expire here)"""
+        kind = set if name.startswith("S") else dict
+        value = self._get(key)
+        if value is not None and not isinstance(value, kind):
+            return _WRONGTYPE
+        if name == "SMEMBERS":
+            return encode_reply(sorted(value or ()))
+        if name == "HGETALL":
+            return encode_reply([item for field_value in (value or {}).items() for item in field_value])
+        if name == "SREM":
+            if value is None:
+                return encode_reply(0)
+            self._touch(key)
+            removed = len(value.intersection(args))
+            value.difference_update(args)
+            if not value:
+                del self.data[key]
+            return encode_reply(removed)
+        if name == "HSET" and (not args or len(args) % 2):
+            return b"-ERR wrong number of arguments for 'hset' command\r\n"
+        if value is None:
+            value = kind()
+            self.data[key] = (value, None)
+        self._touch(key)
+        if name == "SADD":
+            added = len(set(args) - value)
+            value.update(args)
+            return encode_reply(added)
+        added = sum(1 for field in args[::2] if field not in value)
+        value.update(zip(args[::2], args[1::2]))
+        return encode_reply(added)
+
+    def _get(self, key):
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.data[key]
+            self._touch(key)
+            return None
+        return value
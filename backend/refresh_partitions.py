@@ -0,0 +1,417 @@
+"""Price refresh split across nodes by consistent hashing over token_id.
+
+Every node holds a lease in the shared store (a key that expires unless
+renewed every PARTITION_LEASE_TTL / 3 seconds) and is listed in a member
+set. Each refresh cycle a node builds a hash ring over the members whose
+leases are live and refreshes the tokens whose token_id maps to itself,
+so N nodes each spend their API quota on about 1/N of the universe. When
+a node dies its lease expires and its tokens spread over the others;
+joining or leaving only moves the tokens of that node.
+
+Each lease holds a fencing token from a shared counter, and a node writes
+prices only in a transaction that WATCHes its lease key and runs only
+while the key still holds its token. A node that stalls past its lease
+(and whose tokens may already belong to another node) publishes nothing
+until it rejoins with a new token, even if the lease lapses between the
+check and the write. Changed prices go to a shared hash and to a
+numbered change entry; every node merges the entries after the last one
+it saw, and reads the whole hash only on its first cycle or when entries
+are missing (expired, or dropped by the fence).
+
+The shared store speaks the Redis protocol (REDIS_URL). For several local
+processes, run the stand-in and point the nodes at it:
+    python refresh_partitions.py coordinator --port 6390
+    python refresh_partitions.py node --store redis://127.0.0.1:6390 --synthetic 3000 --interval 10
+    python refresh_partitions.py node --store redis://127.0.0.1:6390 --synthetic 3000 --interval 10
+    python refresh_partitions.py status --store redis://127.0.0.1:6390
+
+--synthetic serves random-walk prices for that many generated tokens
+instead of calling the Token Metrics API (and keeps the data files
+untouched). Real nodes use tokens.json from ./data; start them from
+separate directories on one machine. The API quota
+(TOKEN_METRICS_REQUESTS_PER_MINUTE) is per node: if nodes share an API
+key, set it to each node's share.
+"""
+import argparse
+import asyncio
+import bisect
+import hashlib
+import json
+import logging
+import os
+import random
+import signal
+import socket
+from datetime import datetime
+
+import httpx
+from dotenv import load_dotenv
+
+# Load environment variables before the local modules read their settings
+load_dotenv()
+
+from redis_protocol import RespClient, LocalRedisServer
+from tiered_cache import REDIS_URL
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Configuration
+PARTITION_LEASE_TTL = float(os.getenv("PARTITION_LEASE_TTL", "15"))  # seconds a node stays a member without renewing
+PARTITION_REFRESH_INTERVAL = float(os.getenv("PARTITION_REFRESH_INTERVAL", "60"))  # seconds between refresh cycles
+PARTITION_VNODES = 64  # ring points per node; more spreads the universe more evenly
+PARTITION_MAX_CHANGE_READ = 1000  # change entries merged per cycle before reading the whole hash instead
+KEY_PREFIX = "price_refresh"
+MEMBERS_KEY = f"{KEY_PREFIX}:members"
+PRICES_KEY = f"{KEY_PREFIX}:prices"  # symbol -> [price, updated_at]
+FENCE_KEY = f"{KEY_PREFIX}:fence"  # counter handing out lease tokens
+VERSION_KEY = f"{KEY_PREFIX}:version"  # number of the last change entry
+
+def _hash(value):
+    return int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), "big")
+
+def lease_key(node_id):
+    return f"{KEY_PREFIX}:lease:{node_id}"
+
+def _decode(raw):
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return None
+
+def change_key(version):
+    """One publish: {"node", "token", "prices": {symbol: [price, updated_at]}}"""
+    return f"{KEY_PREFIX}:changes:{version}"
+
+class HashRing:
+    """Consistent hash ring mapping keys (token IDs) to nodes"""
+
+    def __init__(self, nodes, vnodes=PARTITION_VNODES):
+        self.nodes = sorted(set(nodes))
+        points = sorted((_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(vnodes))
+        self._hashes = [h for h, _ in points]
+        self._owners = [node for _, node in points]
+
+    def owner(self, key):
+        """Node owning a key, or None on an empty ring"""
+        if not self._hashes:
+            return None
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._owners[index]
+
+class PartitionedRefresher:
+    """Refreshes one node's partition of a TokenRepository and shares the results.
+
+    `store` is a RespClient on the shared store. run() keeps the lease
+    alive and runs a refresh cycle every `interval` seconds until
+    cancelled, then leaves so the others take over at once. Change entries
+    live for `change_ttl` seconds (default: five cycles); a node that
+    falls further behind reads the whole hash.
+    """
+
+    def __init__(self, repository, store, node_id=None, lease_ttl=PARTITION_LEASE_TTL,
+                 interval=PARTITION_REFRESH_INTERVAL, change_ttl=None):
+        self.repository = repository
+        self.store = store
+        self.node_id = node_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.lease_ttl = lease_ttl
+        self.interval = interval
+        self.change_ttl = change_ttl or max(5 * interval, lease_ttl)
+        self.token = None  # fencing token of our current lease
+        self.seen_version = None  # last change entry merged
+        self._lease_lock = asyncio.Lock()
+        self.members = []
+        self.owned = 0
+        self.cycles = 0
+        self.published = 0
+        self.merged = 0
+        self.fenced = 0
+        self.full_merges = 0
+        self.failures = 0
+        self.last_cycle = None
+
+    async def renew_lease(self):
+        """Extend our lease, or take a new one with a new fencing token if it lapsed"""
+        key = lease_key(self.node_id)
+        ttl = self.lease_ttl * 1000
+        async with self._lease_lock:
+            if self.token is not None:
+                renewed = await self.store.transaction_if(
+                    key, str(self.token).encode(),
+                    ("SET", key, self.token, "PX", int(ttl)),
+                    ("SADD", MEMBERS_KEY, self.node_id)
+                )
+                if renewed is not None:
+                    return
+            if self.token is not None:
+                logger.warning(f"Lease of {self.node_id} lapsed: rejoining with a new fencing token")
+                self.token = None
+            token = await self.store.incr(FENCE_KEY)
+            if await self.store.set(key, token, int(ttl), nx=True) is None:
+                raise RuntimeError(f"Lease of {self.node_id} is held by another process")
+            self.token = token
+            await self.store.sadd(MEMBERS_KEY, self.node_id)
+
+    async def holds_lease(self):
+        """Whether our lease is live and still carries our fencing token"""
+        if self.token is None:
+            return False
+        return await self.store.get(lease_key(self.node_id)) == str(self.token).encode()
+
+    async def leave(self):
+        """Drop the lease so the partition moves to the other nodes now"""
+        if await self.holds_lease():
+            await self.store.delete(lease_key(self.node_id))
+        self.token = None
+        await self.store.srem(MEMBERS_KEY, self.node_id)
+
+    async def live_members(self):
+        """Members with a live lease; expired ones are removed from the set"""
+        members = sorted(m.decode() for m in await self.store.smembers(MEMBERS_KEY))
+        leases = await self.store.mget(*[lease_key(m) for m in members]) if members else []
+        live = [m for m, lease in zip(members, leases) if lease is not None]
+        expired = [m for m, lease in zip(members, leases) if lease is None and m != self.node_id]
+        if expired:
+            logger.info(f"Leases expired for {', '.join(expired)}: taking over their partitions")
+            await self.store.srem(MEMBERS_KEY, *expired)
+        if self.node_id not in live:
+            live.append(self.node_id)
+        return sorted(live)
+
+    def partition(self, ring):
+        """Symbols of the tokens this node owns on a ring"""
+        return [
+            symbol for symbol, token in self.repository.tokens.items()
+            if ring.owner(token.token_id) == self.node_id
+        ]
+
+    async def publish(self, symbols):
+        """Write this node's current prices of `symbols` to the shared hash and a
+        new change entry, in one transaction that only runs under our lease"""
+        repo = self.repository
+        prices = {
+            symbol: [repo.prices[symbol], repo.prices_updated_at[symbol].isoformat()]
+            for symbol in symbols
+        }
+        if not prices:
+            return 0
+        # The fence: after a stall past the lease these tokens may belong to another node
+        written = None
+        if self.token is not None:
+            # The entry's number is taken first; a fenced write leaves a gap readers fill from the hash
+            version = await self.store.incr(VERSION_KEY)
+            change = {"node": self.node_id, "token": self.token, "prices": prices}
+            written = await self.store.transaction_if(
+                lease_key(self.node_id), str(self.token).encode(),
+                ("HSET", PRICES_KEY, *[item for symbol, value in prices.items() for item in (symbol, json.dumps(value))]),
+                ("SET", change_key(version), json.dumps(change), "PX", int(self.change_ttl * 1000))
+            )
+        if written is None:
+            self.fenced += len(prices)
+            logger.warning(f"Node {self.node_id} lost its lease: dropping {len(prices)} price updates")
+            return 0
+        self.published += len(prices)
+        return len(prices)
+
+    async def _read_changes(self, version):
+        """Prices in the change entries after the last one merged, or None when
+        some are missing (expired, or not written yet) or there are too many"""
+        if self.seen_version is None or not 0 <= version - self.seen_version <= PARTITION_MAX_CHANGE_READ:
+            return None
+        if version == self.seen_version:
+            return []
+        entries = await self.store.mget(*[change_key(v) for v in range(self.seen_version + 1, version + 1)])
+        if any(entry is None for entry in entries):
+            return None
+        updates = []
+        for entry in entries:
+            change = _decode(entry)
+            if not isinstance(change, dict):
+                return None
+            if change.get("node") != self.node_id:
+                updates.extend(change.get("prices", {}).items())
+        return updates
+
+    async def merge_shared(self):
+        """Take the prices other nodes published since the last merge that are newer than ours"""
+        version = int(await self.store.get(VERSION_KEY) or 0)
+        updates = await self._read_changes(version)
+        if updates is None:
+            self.full_merges += 1
+            updates = [(symbol.decode(), _decode(raw)) for symbol, raw in (await self.store.hgetall(PRICES_KEY)).items()]
+        self.seen_version = version
+
+        parsed = []
+        for symbol, value in updates:
+            try:
+                price, updated_at = value
+                parsed.append((symbol, price, datetime.fromisoformat(updated_at)))
+            except (ValueError, TypeError):
+                continue
+        merged = len(self.repository.merge_prices(parsed))
+        self.merged += merged
+        return merged
+
+    async def refresh_once(self):
+        """One cycle: recompute ownership, refresh our partition, publish and merge"""
+        await self.renew_lease()
+        self.members = await self.live_members()
+        owned = self.partition(HashRing(self.members))
+        self.owned = len(owned)
+
+        started = datetime.now()
+        refresh = await self.repository.refresh_all_prices(symbols=owned)
+        changed = [s for s in owned if self.repository.prices_updated_at.get(s, datetime.min) >= started]
+        published = await self.publish(changed)
+        merged = await self.merge_shared()
+
+        self.cycles += 1
+        self.last_cycle = {
+            "at": started.isoformat(),
+            "members": len(self.members),
+            "owned": len(owned),
+            "published": published,
+            "merged": merged,
+            "tokens_per_sec": refresh["tokens_per_sec"],
+            "changed_fraction": refresh["changed_fraction"],
+        }
+        logger.info(
+            f"Node {self.node_id}: {len(owned)}/{len(self.repository.tokens)} tokens owned "
+            f"({len(self.members)} members), {published} published, {merged} merged"
+        )
+        return self.last_cycle
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.lease_ttl / 3)
+            try:
+                await self.renew_lease()
+            except Exception as e:
+                logger.warning(f"Failed to renew lease of {self.node_id}: {str(e)}")
+
+    async def run(self):
+        heartbeat = asyncio.create_task(self._heartbeat())
+        try:
+            while True:
+                try:
+                    await self.refresh_once()
+                except Exception as e:
+                    self.failures += 1
+                    logger.error(f"Partitioned refresh cycle failed: {str(e)}")
+                await asyncio.sleep(self.interval)
+        finally:
+            heartbeat.cancel()
+            try:
+                await self.leave()
+            except Exception as e:
+                logger.warning(f"Failed to leave the refresh ring: {str(e)}")
+
+    def stats(self):
+        return {
+            "node_id": self.node_id,
+            "members": self.members,
+            "owned": self.owned,
+            "cycles": self.cycles,
+            "published": self.published,
+            "merged": self.merged,
+            "fenced": self.fenced,
+            "full_merges": self.full_merges,
+            "token": self.token,
+            "seen_version": self.seen_version,
+            "failures": self.failures,
+            "last_cycle": self.last_cycle,
+        }
+
+def synthetic_repository(count):
+    """A TokenRepository over generated tokens with a random-walk price API (no files, no API key)"""
+    from token_repository import TokenRepository, DEFAULT_CRYPTO_ICON
+
+    repo = TokenRepository(load=False)
+    repo.set_tokens(
+        {"token_id": 100_000 + i, "name": f"Token {i}", "symbol": f"TK{i}", "logo": DEFAULT_CRYPTO_ICON}
+        for i in range(count)
+    )
+    walk = {}
+
+    async def api_get(client, url, params):
+        repo.scheduler.quota.record()
+        items = []
+        for token_id in params["token_id"].split(","):
+            price = walk.get(token_id) or float(int(token_id) % 1000 + 1)
+            if random.random() < 0.1:
+                price *= random.choice((0.99, 1.01))
+            walk[token_id] = price
+            items.append({"TOKEN_ID": int(token_id), "CURRENT_PRICE": price})
+        return httpx.Response(200, json={"data": items})
+
+    repo._api_get = api_get
+    repo._save_prices = lambda: None
+    return repo
+
+async def run_coordinator(port):
+    server = LocalRedisServer()
+    await server.start(port=port)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+async def run_node(args):
+    if args.synthetic:
+        repo = synthetic_repository(args.synthetic)
+    else:
+        from token_repository import token_repository as repo
+    store = RespClient.from_url(args.store, timeout=5.0)
+    refresher = PartitionedRefresher(repo, store, node_id=args.node_id, interval=args.interval)
+    # Leave the ring on SIGTERM too, so process managers hand the partition over at once
+    task = asyncio.current_task()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, task.cancel)
+    try:
+        await refresher.run()
+    except asyncio.CancelledError:
+        pass
+    finally:
+        await store.close()
+
+async def run_status(args):
+    store = RespClient.from_url(args.store, timeout=5.0)
+    try:
+        members = sorted(m.decode() for m in await store.smembers(MEMBERS_KEY))
+        leases = await store.mget(*[lease_key(m) for m in members]) if members else []
+        prices = await store.hgetall(PRICES_KEY)
+        version = await store.get(VERSION_KEY)
+    finally:
+        await store.close()
+    return {
+        "members": {m: int(lease) if lease is not None else None for m, lease in zip(members, leases)},
+        "published_prices": len(prices),
+        "change_version": int(version or 0),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Price refresh partitioned across nodes")
+    commands = parser.add_subparsers(dest="command", required=True)
+    coordinator = commands.add_parser("coordinator", help="run the local shared store stand-in")
+    coordinator.add_argument("--port", type=int, default=6390)
+    node = commands.add_parser("node", help="run a refresh node until interrupted")
+    node.add_argument("--store", default=REDIS_URL, required=not REDIS_URL, help="redis://host:port (default: REDIS_URL)")
+    node.add_argument("--node-id", help="default: hostname-pid")
+    node.add_argument("--interval", type=float, default=PARTITION_REFRESH_INTERVAL, help="seconds between cycles")
+    node.add_argument("--synthetic", type=int, metavar="TOKENS", help="refresh generated tokens with fake prices")
+    status = commands.add_parser("status", help="members, lease tokens and published price count")
+    status.add_argument("--store", default=REDIS_URL, required=not REDIS_URL, help="redis://host:port (default: REDIS_URL)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        if args.command == "coordinator":
+            asyncio.run(run_coordinator(args.port))
+        elif args.command == "node":
+            asyncio.run(run_node(args))
+        else:
+            print(json.dumps(asyncio.run(run_status(args)), indent=2, sort_keys=True))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
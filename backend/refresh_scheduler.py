@@ -0,0 +1,156 @@
+import logging
+import os
+import time
+from collections import deque
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Configuration
+API_REQUESTS_PER_MINUTE = int(os.getenv("TOKEN_METRICS_REQUESTS_PER_MINUTE", "20"))
+HOT_WINDOW = int(os.getenv("REFRESH_HOT_WINDOW_MINUTES", "15")) * 60  # seconds
+ON_DEMAND_RESERVE = 0.25  # share of the quota kept free for on-demand refreshes
+MAX_DEMAND_ENTRIES = 50000
+STALEST_REPORTED = 10
+
+class ApiQuota:
+    """Sliding one-minute window of API requests"""
+
+    def __init__(self, per_minute=API_REQUESTS_PER_MINUTE):
+        self.per_minute = per_minute
+        self.calls = deque()
+
+    def _expire(self, now):
+        while self.calls and now - self.calls[0] >= 60:
+            self.calls.popleft()
+
+    def record(self):
+        now = time.monotonic()
+        self._expire(now)
+        self.calls.append(now)
+
+    def remaining(self):
+        self._expire(time.monotonic())
+        return max(0, self.per_minute - len(self.calls))
+
+    def wait_time(self, keep=0):
+        """Seconds until a request can be made while leaving `keep` requests of the window free"""
+        now = time.monotonic()
+        self._expire(now)
+        excess = len(self.calls) - (self.per_minute - keep - 1)
+        if excess <= 0:
+            return 0.0
+        return max(0.0, self.calls[min(excess, len(self.calls)) - 1] + 60 - now)
+
+class RefreshScheduler:
+    """Chooses which tokens a background price refresh cycle fetches.
+
+    Tokens requested within the last HOT_WINDOW seconds are refreshed every
+    cycle, stalest first. Whatever budget is left rotates round-robin
+    through the rest of the universe, so every token is eventually
+    refreshed. The budget is what the API quota allows after keeping
+    ON_DEMAND_RESERVE of it for user-triggered refreshes.
+    """
+
+    def __init__(self, quota=None, batch_size=20):
+        self.quota = quota or ApiQuota()
+        self.batch_size = batch_size
+        self.last_requested = {}  # symbol -> monotonic time of last demand
+        self.cursor = 0
+        self.cycles = 0
+        self.last_plan = {"hot": 0, "rotation": 0, "budget": 0}
+
+    def touch(self, symbol):
+        """Record demand for a token"""
+        self.last_requested[symbol] = time.monotonic()
+        if len(self.last_requested) > MAX_DEMAND_ENTRIES:
+            self._prune()
+
+    def _prune(self):
+        cutoff = time.monotonic() - HOT_WINDOW
+        self.last_requested = {s: t for s, t in self.last_requested.items() if t >= cutoff}
+
+    def hot_symbols(self):
+        """Symbols requested within the hot window"""
+        self._prune()
+        return set(self.last_requested)
+
+    def budget(self):
+        """Tokens this cycle may fetch without eating into the on-demand reserve"""
+        reserve = int(self.quota.per_minute * ON_DEMAND_RESERVE)
+        return max(0, self.quota.remaining() - reserve) * self.batch_size
+
+    def plan(self, candidates, is_due, updated_at):
+        """Pick symbols to refresh this cycle.
+
+        candidates: every refreshable symbol, in a stable order
+        is_due: symbol -> whether its cached price has expired
+        updated_at: symbol -> last refresh time (for stalest-first ordering)
+        """
+        budget = self.budget()
+        hot = self.hot_symbols()
+        candidate_set = set(candidates)
+
+        # Hot tokens first, stalest first, in case demand exceeds the budget
+        due_hot = sorted(
+            (s for s in hot if s in candidate_set and is_due(s)),
+            key=lambda s: updated_at(s)
+        )
+        selected = due_hot[:budget]
+
+        # Round-robin through the cold remainder with what is left
+        cold = [s for s in candidates if s not in hot]
+        rotation = []
+        if cold and len(selected) < budget:
+            start = self.cursor % len(cold)
+            scanned = 0
+            while scanned < len(cold) and len(selected) + len(rotation) < budget:
+                symbol = cold[(start + scanned) % len(cold)]
+                scanned += 1
+                if is_due(symbol):
+                    rotation.append(symbol)
+            self.cursor = (start + scanned) % len(cold)
+
+        self.cycles += 1
+        self.last_plan = {"hot": len(selected), "rotation": len(rotation), "budget": budget}
+        if len(due_hot) > budget:
+            logger.warning(f"Refresh budget {budget} below hot demand {len(due_hot)}; hot tokens will lag")
+        return selected + rotation
+
+    def staleness(self, symbols, updated_at, now):
+        """Seconds since each token's last refresh (None if never refreshed)"""
+        ages = {}
+        for symbol in symbols:
+            last = updated_at.get(symbol)
+            ages[symbol] = (now - last).total_seconds() if last is not None else None
+        return ages
+
+    def stats(self, symbols, updated_at, now):
+        """Scheduler state and per-token staleness"""
+        ages = self.staleness(symbols, updated_at, now)
+        known = sorted(age for age in ages.values() if age is not None)
+        hot = self.hot_symbols()
+
+        def percentile(p):
+            return round(known[min(len(known) - 1, int(len(known) * p))], 1) if known else None
+
+        stalest = sorted(
+            ages.items(),
+            key=lambda item: float("inf") if item[1] is None else item[1],
+            reverse=True
+        )[:STALEST_REPORTED]
+        return {
+            "cycles": self.cycles,
+            "last_plan": self.last_plan,
+            "quota_per_minute": self.quota.per_minute,
+            "quota_remaining": self.quota.remaining(),
+            "hot_window_seconds": HOT_WINDOW,
+            "hot_tokens": len(hot),
+            "tokens": len(ages),
+            "never_refreshed": len(ages) - len(known),
+            "staleness_p50": percentile(0.5),
+            "staleness_p95": percentile(0.95),
+            "staleness_max": round(known[-1], 1) if known else None,
+            "hot_staleness": {s: ages[s] for s in hot if s in ages},
+            "stalest": dict(stalest),
+        }
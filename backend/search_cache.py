@@ -0,0 +1,119 @@
+import logging
+import time
+from collections import OrderedDict
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Configuration
+SEARCH_CACHE_MAX_ENTRIES = 2048
+SEARCH_CACHE_TTL = 60.0  # seconds; rows carry prices, so keep this short
+SEARCH_RESULT_LIMIT = 20  # must match the LIMIT of the "search_tokens" query
+
+# LIKE wildcards; queries containing them can't be refined in Python
+_LIKE_SPECIAL = ('%', '_', '\\')
+
+def normalize_query(query):
+    """Normalize a search query into a cache key (the SQL compares lowercased)"""
+    return query.lower()
+
+def _search_rank(row, key):
+    """Python equivalent of the ORDER BY of the "search_tokens" query"""
+    symbol = (row["TOKEN_SYMBOL"] or "").lower()
+    name = (row["TOKEN_NAME"] or "").lower()
+    if symbol == key:
+        bucket = 1
+    elif symbol.startswith(key):
+        bucket = 2
+    elif name == key:
+        bucket = 3
+    elif name.startswith(key):
+        bucket = 4
+    else:
+        bucket = 5
+    market_cap = row.get("MARKET_CAP")
+    # MARKET_CAP DESC NULLS LAST
+    return (bucket, market_cap is None, -(market_cap or 0))
+
+def _matches(row, key):
+    """Python equivalent of the WHERE clause of the "search_tokens" query"""
+    return key in (row["TOKEN_SYMBOL"] or "").lower() or key in (row["TOKEN_NAME"] or "").lower()
+
+class SearchCache:
+    """Bounded LRU+TTL cache of raw search rows keyed by normalized query.
+
+    Matches for a query are a subset of the matches for any substring of it,
+    so when a shorter prefix was cached with a complete result set (fewer rows
+    than the LIMIT), a longer query is answered by filtering and re-ranking
+    those rows instead of scanning the view again.
+    """
+
+    def __init__(self, max_entries=SEARCH_CACHE_MAX_ENTRIES, ttl=SEARCH_CACHE_TTL, result_limit=SEARCH_RESULT_LIMIT):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.result_limit = result_limit
+        self._entries = OrderedDict()  # key -> (expires_at, rows, complete)
+        self.hits = 0
+        self.refined = 0
+        self.misses = 0
+
+    def _lookup(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= now:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def get(self, query):
+        """Return cached rows for query, or None if the database must be asked"""
+        key = normalize_query(query)
+        now = time.monotonic()
+
+        entry = self._lookup(key, now)
+        if entry is not None:
+            self.hits += 1
+            return entry[1]
+
+        if not any(c in key for c in _LIKE_SPECIAL):
+            # Longest cached prefix with a complete result set wins
+            for end in range(len(key) - 1, 0, -1):
+                entry = self._lookup(key[:end], now)
+                if entry is None or not entry[2]:
+                    continue
+                rows = [row for row in entry[1] if _matches(row, key)]
+                rows.sort(key=lambda row: _search_rank(row, key))
+                # The refined set is complete too; it inherits the prefix expiry
+                self._store(key, rows, entry[0])
+                self.refined += 1
+                return rows
+
+        self.misses += 1
+        return None
+
+    def put(self, query, rows):
+        """Cache rows returned by the database for query"""
+        self._store(normalize_query(query), rows, time.monotonic() + self.ttl)
+
+    def _store(self, key, rows, expires_at):
+        self._entries[key] = (expires_at, rows, len(rows) < self.result_limit)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop all cached results"""
+        self._entries.clear()
+
+    def stats(self):
+        """Cache counters"""
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "refined": self.refined,
+            "misses": self.misses,
+        }
@@ -0,0 +1,70 @@
+import asyncio
+import logging
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Request header (or `session` query parameter) identifying a client's typeahead session
+SEARCH_SESSION_HEADER = "X-Search-Session"
+
+class SearchSuperseded(Exception):
+    """Raised in a search that was cancelled by a newer query from the same session"""
+
+class _InFlightSearch:
+    __slots__ = ("task", "superseded")
+
+    def __init__(self, task):
+        self.task = task
+        self.superseded = False
+
+class SearchSessionRegistry:
+    """Tracks the in-flight search query of each client session.
+
+    A new query from a session cancels the previous one's task. asyncpg
+    then sends a protocol-level cancel request for the running statement
+    (over a short-lived socket, not a pool connection) and doesn't hand the
+    connection back until the server has acknowledged it, so superseding
+    a search never needs a second connection.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self.superseded = 0
+
+    async def run(self, session_id, coro):
+        """Run a search query coroutine for session_id, superseding the previous one"""
+        if not session_id:
+            return await coro
+
+        previous = self._inflight.get(session_id)
+        if previous is not None:
+            self._supersede(previous)
+
+        task = asyncio.ensure_future(coro)
+        entry = _InFlightSearch(task)
+        self._inflight[session_id] = entry
+        try:
+            return await task
+        except asyncio.CancelledError:
+            # Only translate cancellations we caused; a cancelled request
+            # (client disconnect, shutdown) must keep propagating
+            if entry.superseded and not asyncio.current_task().cancelling():
+                raise SearchSuperseded()
+            raise
+        finally:
+            if self._inflight.get(session_id) is entry:
+                del self._inflight[session_id]
+
+    def _supersede(self, entry):
+        if entry.task.done():
+            return
+        entry.superseded = True
+        self.superseded += 1
+        entry.task.cancel()
+
+    def stats(self):
+        """Session counters"""
+        return {
+            "in_flight": len(self._inflight),
+            "superseded": self.superseded,
+        }
@@ -0,0 +1,169 @@
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+from pathlib import Path
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Configuration
+SNAPSHOT_FILE = os.getenv("SNAPSHOT_FILE", "./data/snapshot.bin")
+SNAPSHOT_INTERVAL = 300  # seconds between periodic dumps
+
+# File layout (little endian):
+#   header:  magic, created_at, fiat rates timestamp, fiat count, token count
+#   fiats:   currency code (8 bytes, NUL padded), rate
+#   tokens:  token_id, market_cap, price, price timestamp, then (offset, length)
+#            of symbol, name and images inside the string blob
+#   strings: UTF-8 blob referenced by the token records
+_MAGIC = b"CCSNAP01"
+_HEADER = struct.Struct("<8sddII")
+_FIAT = struct.Struct("<8sd")
+_TOKEN = struct.Struct("<qddIIHIHII")
+_NAN = float("nan")
+
+class SnapshotToken:
+    """One catalog entry with its last known price"""
+
+    __slots__ = ("token_id", "symbol", "name", "images", "market_cap", "price", "price_ts")
+
+    def __init__(self, token_id, symbol, name, images, market_cap, price, price_ts):
+        self.token_id = token_id
+        self.symbol = symbol
+        self.name = name
+        self.images = images
+        self.market_cap = market_cap
+        self.price = price
+        self.price_ts = price_ts
+
+class Snapshot:
+    """Price, catalog and fiat state of the service at one point in time"""
+
+    def __init__(self, created_at, rates, rates_timestamp, tokens):
+        self.created_at = created_at
+        self.rates = rates
+        self.rates_timestamp = rates_timestamp
+        self.tokens = tokens
+
+def _optional(value):
+    """NaN encodes a missing float"""
+    return _NAN if value is None else float(value)
+
+def _from_optional(value):
+    return None if value != value else value
+
+def write_snapshot(path, snapshot):
+    """Write a snapshot atomically (temp file + rename)"""
+    blob = bytearray()
+    records = []
+    for token in snapshot.tokens:
+        fields = []
+        for text in (token.symbol, token.name or "", token.images or ""):
+            encoded = text.encode("utf-8")
+            fields.append((len(blob), len(encoded)))
+            blob += encoded
+        (symbol_off, symbol_len), (name_off, name_len), (images_off, images_len) = fields
+        records.append(_TOKEN.pack(
+            int(token.token_id),
+            _optional(token.market_cap),
+            _optional(token.price),
+            int(token.price_ts or 0),
+            symbol_off, min(symbol_len, 0xFFFF),
+            name_off, min(name_len, 0xFFFF),
+            images_off, images_len
+        ))
+
+    path = Path(path)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, snapshot.created_at, snapshot.rates_timestamp, len(snapshot.rates), len(records)))
+        for code, rate in snapshot.rates.items():
+            f.write(_FIAT.pack(code.encode("ascii"), float(rate)))
+        f.write(b"".join(records))
+        f.write(blob)
+    os.replace(tmp_path, path)
+    logger.info(f"Wrote snapshot with {len(records)} tokens to {path}")
+
+def read_snapshot(path):
+    """Memory-map a snapshot file and decode it, or return None if unusable"""
+    path = Path(path)
+    if not path.exists() or path.stat().st_size < _HEADER.size:
+        return None
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        magic, created_at, rates_timestamp, fiat_count, token_count = _HEADER.unpack_from(data, 0)
+        if magic != _MAGIC:
+            logger.error(f"Ignoring snapshot {path}: bad header")
+            return None
+
+        offset = _HEADER.size
+        rates = {}
+        for code, rate in _FIAT.iter_unpack(data[offset:offset + fiat_count * _FIAT.size]):
+            rates[code.rstrip(b"\0").decode("ascii")] = rate
+        offset += fiat_count * _FIAT.size
+
+        blob_offset = offset + token_count * _TOKEN.size
+        tokens = []
+        for token_id, market_cap, price, price_ts, symbol_off, symbol_len, name_off, name_len, images_off, images_len in _TOKEN.iter_unpack(data[offset:blob_offset]):
+            symbol = data[blob_offset + symbol_off:blob_offset + symbol_off + symbol_len].decode("utf-8")
+            name = data[blob_offset + name_off:blob_offset + name_off + name_len].decode("utf-8")
+            images = data[blob_offset + images_off:blob_offset + images_off + images_len].decode("utf-8")
+            tokens.append(SnapshotToken(
+                token_id, symbol, name or None, images or None,
+                _from_optional(market_cap), _from_optional(price), price_ts
+            ))
+    logger.info(f"Read snapshot with {len(tokens)} tokens from {path} ({time.time() - created_at:.0f}s old)")
+    return Snapshot(created_at, rates, rates_timestamp, tokens)
+
+def encode_images(images):
+    """Store IMAGES the way the view returns it (JSON text)"""
+    if images is None or isinstance(images, str):
+        return images
+    return json.dumps(images)
+
+class StartupTimer:
+    """Measures how long after process start the service answered, and answered with fresh data"""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.snapshot_loaded = False
+        self.snapshot_age = None
+        self.time_to_snapshot = None
+        self.time_to_ready = None
+        self.time_to_first_response = None
+        self.time_to_first_good_response = None
+
+    def _elapsed(self):
+        return round(time.perf_counter() - self.started_at, 4)
+
+    def snapshot_served(self, age):
+        self.snapshot_loaded = True
+        self.snapshot_age = round(age, 1)
+        self.time_to_snapshot = self._elapsed()
+
+    def ready(self):
+        if self.time_to_ready is None:
+            self.time_to_ready = self._elapsed()
+            logger.info(f"Live data ready {self.time_to_ready}s after start")
+
+    def response(self, stale):
+        """Call on every successful data response"""
+        if self.time_to_first_good_response is not None:
+            return
+        if self.time_to_first_response is None:
+            self.time_to_first_response = self._elapsed()
+        if not stale:
+            self.time_to_first_good_response = self._elapsed()
+            logger.info(f"First good response {self.time_to_first_good_response}s after start")
+
+    def stats(self):
+        return {
+            "snapshot_loaded": self.snapshot_loaded,
+            "snapshot_age_seconds": self.snapshot_age,
+            "time_to_snapshot": self.time_to_snapshot,
+            "time_to_ready": self.time_to_ready,
+            "time_to_first_response": self.time_to_first_response,
+            "time_to_first_good_response": self.time_to_first_good_response,
+        }
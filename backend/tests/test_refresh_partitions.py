@@ -0,0 +1,174 @@
+"""Partitioned price refresh against the in-process Redis stand-in.
+
+Run from the backend directory:
+    python -m pytest tests
+"""
+import asyncio
+import json
+import os
+import signal
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from redis_protocol import LocalRedisServer, RespClient
+from refresh_partitions import (
+    HashRing, PartitionedRefresher, synthetic_repository, change_key, lease_key,
+    MEMBERS_KEY, PRICES_KEY, VERSION_KEY
+)
+
+SCRIPT = Path(__file__).resolve().parent.parent / "refresh_partitions.py"
+
+@pytest.fixture(autouse=True)
+def in_tmp_path(tmp_path, monkeypatch):
+    # Importing token_repository writes ./data
+    monkeypatch.chdir(tmp_path)
+
+async def with_stand_in(test):
+    server = LocalRedisServer()
+    port = await server.start()
+    store = RespClient("127.0.0.1", port, timeout=5.0)
+    try:
+        await test(server, store)
+    finally:
+        await store.close()
+        await server.close()
+
+async def wait_for(condition, timeout=15.0, step=0.1):
+    deadline = time.monotonic() + timeout
+    while not await condition():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(step)
+
+async def changes(store, first, last):
+    """Change entries first..last (missing ones skipped)"""
+    entries = await store.mget(*[change_key(v) for v in range(first, last + 1)]) if last >= first else []
+    return [json.loads(entry) for entry in entries if entry is not None]
+
+def test_nodes_split_the_universe_and_merge_each_other():
+    async def test(server, store):
+        repos = [synthetic_repository(200) for _ in range(2)]
+        nodes = [PartitionedRefresher(repo, store, node_id=f"n{i}") for i, repo in enumerate(repos)]
+        for node in nodes:
+            await node.renew_lease()
+        for node in nodes:
+            await node.refresh_once()
+        await nodes[0].merge_shared()
+
+        assert sum(node.owned for node in nodes) == 200
+        assert len(await store.hgetall(PRICES_KEY)) == 200
+        # Each repository now has the prices of both partitions
+        for repo in repos:
+            assert len(repo.prices) == 200
+        assert repos[0].prices == repos[1].prices
+
+    asyncio.run(with_stand_in(test))
+
+def test_merge_reads_only_new_change_entries():
+    async def test(server, store):
+        repos = [synthetic_repository(100) for _ in range(2)]
+        nodes = [PartitionedRefresher(repo, store, node_id=f"n{i}") for i, repo in enumerate(repos)]
+        for node in nodes:
+            await node.renew_lease()
+        for _ in range(3):
+            for node in nodes:
+                await node.refresh_once()
+        # Only the first merge of each node read the whole hash
+        assert [node.full_merges for node in nodes] == [1, 1]
+
+        # Entries that expired before a node caught up fall back to the hash
+        await nodes[0].refresh_once()
+        await store.delete(change_key(int(await store.get(VERSION_KEY))))
+        await nodes[1].merge_shared()
+        assert nodes[1].full_merges == 2
+
+    asyncio.run(with_stand_in(test))
+
+def test_lapsed_lease_is_fenced():
+    async def test(server, store):
+        repo = synthetic_repository(50)
+        node = PartitionedRefresher(repo, store, node_id="n0")
+        await node.refresh_once()
+        token = node.token
+        await store.delete(PRICES_KEY)
+        await store.delete(lease_key("n0"))
+
+        # The lease expired while the node was stalled: its writes are dropped
+        assert not await node.holds_lease()
+        assert await node.publish(list(repo.tokens)) == 0
+        assert node.fenced == 50
+        assert await store.hgetall(PRICES_KEY) == {}
+        assert await store.get(change_key(int(await store.get(VERSION_KEY)))) is None
+
+        # Rejoining takes a new fencing token
+        await node.renew_lease()
+        assert node.token > token
+        assert await node.publish(list(repo.tokens)) == 50
+
+    asyncio.run(with_stand_in(test))
+
+def test_node_processes_partition_and_take_over_a_dead_node(tmp_path):
+    async def test(server, store):
+        env = {
+            **os.environ,
+            "PARTITION_LEASE_TTL": "1.5",
+            "TOKEN_METRICS_REQUESTS_PER_MINUTE": "100000",
+        }
+        node_ids = ["n0", "n1", "n2"]
+        processes = [
+            await asyncio.create_subprocess_exec(
+                sys.executable, str(SCRIPT), "node", "--store", f"redis://127.0.0.1:{server.port}",
+                "--node-id", node_id, "--synthetic", "300", "--interval", "0.2",
+                cwd=tmp_path, env=env, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL
+            )
+            for node_id in node_ids
+        ]
+        tokens = {f"TK{i}": 100_000 + i for i in range(300)}
+        try:
+            async def all_joined():
+                return len(await store.hgetall(PRICES_KEY)) == 300 and len(await store.smembers(MEMBERS_KEY)) == 3
+            await wait_for(all_joined)
+            # Let the cycles that started with fewer members finish
+            await asyncio.sleep(1.0)
+
+            # Every publish now stays inside its node's partition of the three-node ring
+            ring = HashRing(node_ids)
+            first = int(await store.get(VERSION_KEY)) + 1
+            await asyncio.sleep(1.0)
+            published = await changes(store, first, int(await store.get(VERSION_KEY)))
+            assert {change["node"] for change in published} == set(node_ids)
+            for change in published:
+                assert all(ring.owner(tokens[symbol]) == change["node"] for symbol in change["prices"])
+
+            # Kill a node without letting it leave: the others take over once its lease expires
+            processes[2].send_signal(signal.SIGKILL)
+            await processes[2].wait()
+
+            async def dead_node_dropped():
+                return await store.smembers(MEMBERS_KEY) == [b"n0", b"n1"]
+            await wait_for(dead_node_dropped)
+            await asyncio.sleep(1.0)
+
+            ring = HashRing(node_ids[:2])
+            first = int(await store.get(VERSION_KEY)) + 1
+            await asyncio.sleep(2.0)
+            published = await changes(store, first, int(await store.get(VERSION_KEY)))
+            symbols = set()
+            for change in published:
+                assert change["node"] in node_ids[:2]
+                assert all(ring.owner(tokens[symbol]) == change["node"] for symbol in change["prices"])
+                symbols.update(change["prices"])
+            taken_over = {symbol for symbol, token_id in tokens.items() if HashRing(node_ids).owner(token_id) == "n2"}
+            assert symbols & taken_over
+        finally:
+            for process in processes:
+                if process.returncode is None:
+                    process.terminate()
+                    await process.wait()
+
+        # Terminated nodes leave the ring at once
+        assert await store.smembers(MEMBERS_KEY) == []
+
+    asyncio.run(with_stand_in(test))
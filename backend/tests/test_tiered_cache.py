@@ -0,0 +1,195 @@
+"""TieredCache and RespClient against the in-process Redis stand-in.
+
+Run from the backend directory:
+    python -m pytest tests
+"""
+import asyncio
+
+import pytest
+
+from circuit_breaker import CLOSED, OPEN
+from redis_protocol import LocalRedisServer, RespClient
+from tiered_cache import TieredCache, redis_breaker
+
+@pytest.fixture(autouse=True)
+def closed_breaker():
+    redis_breaker.state = CLOSED
+    redis_breaker.consecutive_failures = 0
+    yield
+    redis_breaker.state = CLOSED
+    redis_breaker.consecutive_failures = 0
+
+class Loader:
+    """Counts calls; returns `value` after `delay` seconds"""
+
+    def __init__(self, value, delay=0.0):
+        self.value = value
+        self.delay = delay
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return self.value
+
+async def with_stand_in(test):
+    server = LocalRedisServer()
+    port = await server.start()
+    clients = []
+
+    def client(**kwargs):
+        clients.append(RespClient("127.0.0.1", port, **kwargs))
+        return clients[-1]
+
+    try:
+        await test(server, client)
+    finally:
+        for c in clients:
+            await c.close()
+        await server.close()
+
+def test_l1_hit_after_load():
+    async def test():
+        cache = TieredCache("t", ttl=60)
+        loader = Loader({"price": 1.5})
+        assert await cache.get_or_load("BTC", loader) == {"price": 1.5}
+        assert await cache.get_or_load("BTC", loader) == {"price": 1.5}
+        assert loader.calls == 1
+        assert cache.stats()["l1_hits"] == 1
+        assert cache.stats()["misses"] == 1
+
+    asyncio.run(test())
+
+def test_l2_hit_from_another_node():
+    async def test(server, client):
+        node_a = TieredCache("t", ttl=60, l2=client())
+        node_b = TieredCache("t", ttl=60, l2=client())
+        loader = Loader([1, 2, 3])
+        assert await node_a.get_or_load("top", loader) == [1, 2, 3]
+        assert await node_b.get_or_load("top", loader) == [1, 2, 3]
+        assert loader.calls == 1
+        assert node_b.stats()["l2_hits"] == 1
+        # Now in node B's L1 as well
+        assert await node_b.get_or_load("top", loader) == [1, 2, 3]
+        assert node_b.stats()["l1_hits"] == 1
+
+    asyncio.run(with_stand_in(test))
+
+def test_l2_miss_calls_loader_and_fills_both_tiers():
+    async def test(server, client):
+        cache = TieredCache("t", ttl=60, l2=client())
+        loader = Loader("value")
+        assert await cache.get_or_load("k", loader) == "value"
+        assert loader.calls == 1
+        assert cache.stats()["misses"] == 1
+        assert b"t:k" in server.data
+
+    asyncio.run(with_stand_in(test))
+
+def test_negative_entries_are_shared():
+    async def test(server, client):
+        node_a = TieredCache("t", ttl=60, negative_ttl=60, l2=client())
+        node_b = TieredCache("t", ttl=60, negative_ttl=60, l2=client())
+        loader = Loader(None)
+        assert await node_a.get_or_load("unknown", loader) is None
+        assert await node_b.get_or_load("unknown", loader) is None
+        assert loader.calls == 1
+        assert node_b.stats()["negative_hits"] == 1
+
+    asyncio.run(with_stand_in(test))
+
+def test_redis_down_falls_back_to_loader():
+    async def test():
+        server = LocalRedisServer()
+        port = await server.start()
+        await server.close()
+        client = RespClient("127.0.0.1", port)
+        cache = TieredCache("t", ttl=60, l2=client)
+        for i in range(redis_breaker.failure_threshold):
+            assert await cache.get_or_load(f"k{i}", Loader(i)) == i
+        assert redis_breaker.state == OPEN
+        errors = cache.stats()["l2_errors"]
+        # With the breaker open the shared tier isn't even tried
+        assert await cache.get_or_load("more", Loader("v")) == "v"
+        assert cache.stats()["l2_errors"] == errors
+
+    asyncio.run(test())
+
+def test_concurrent_loads_share_one_loader_call():
+    async def test(server, client):
+        cache = TieredCache("t", ttl=60, l2=client())
+        loader = Loader("shared", delay=0.05)
+        results = await asyncio.gather(*(cache.get_or_load("k", loader) for _ in range(10)))
+        assert results == ["shared"] * 10
+        assert loader.calls == 1
+
+    asyncio.run(with_stand_in(test))
+
+def test_shared_load_survives_cancelled_first_caller():
+    async def test(server, client):
+        cache = TieredCache("t", ttl=60, l2=client())
+        loader = Loader("shared", delay=0.05)
+        first = asyncio.ensure_future(cache.get_or_load("k", loader))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(cache.get_or_load("k", loader))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        assert await second == "shared"
+        assert first.cancelled()
+        assert loader.calls == 1
+
+    asyncio.run(with_stand_in(test))
+
+def test_client_runs_commands_concurrently():
+    async def test(server, client):
+        resp = client(max_connections=4)
+        await asyncio.gather(*(resp.set(f"k{i}", str(i)) for i in range(20)))
+        assert await resp.mget(*(f"k{i}" for i in range(20))) == [str(i).encode() for i in range(20)]
+        assert len(resp._idle) <= 4
+
+    asyncio.run(with_stand_in(test))
+
+def test_client_timeout_covers_waiting_for_a_connection():
+    async def test(server, client):
+        resp = client(max_connections=1, timeout=0.1)
+        async with resp._slots:
+            # Every connection is busy: the command gives up after the timeout
+            with pytest.raises(asyncio.TimeoutError):
+                await resp.get("k")
+        assert await resp.get("k") is None
+
+    asyncio.run(with_stand_in(test))
+
+def test_transaction_runs_only_while_the_key_holds_the_value():
+    async def test(server, client):
+        resp = client()
+        await resp.set("lease", "1")
+        assert await resp.transaction_if("lease", b"1", ("SET", "a", "x"), ("INCR", "n")) == ["OK", 1]
+        assert await resp.transaction_if("lease", b"2", ("SET", "a", "y")) is None
+        assert await resp.get("a") == b"x"
+
+    asyncio.run(with_stand_in(test))
+
+def test_write_to_a_watched_key_aborts_exec():
+    async def test(server, client):
+        # One connection, so WATCH and EXEC share it
+        resp = client(max_connections=1)
+        other = client()
+        await resp.set("lease", "1")
+        await resp.execute("WATCH", "lease")
+        await other.set("lease", "2")
+        await resp.execute("MULTI")
+        assert await resp.execute("SET", "a", "x") == "QUEUED"
+        assert await resp.execute("EXEC") is None
+        assert await resp.get("a") is None
+
+        # An expiry counts as a write too
+        await resp.set("lease", "1", px=50)
+        await resp.execute("WATCH", "lease")
+        await asyncio.sleep(0.1)
+        await resp.execute("MULTI")
+        await resp.execute("SET", "a", "x")
+        assert await resp.execute("EXEC") is None
+        assert server.versions == {}
+
+    asyncio.run(with_stand_in(test))
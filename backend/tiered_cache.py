@@ -0,0 +1,186 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import time
+from collections import OrderedDict
+from decimal import Decimal
+
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Configuration
+REDIS_URL = os.getenv("REDIS_URL")  # shared L2; "local" runs an in-process stand-in
+XFETCH_BETA = 1.0  # > 1 refreshes earlier, < 1 later
+
+# Returned by TieredCache.get() when the caller should load the value
+MISSING = object()
+
+# Negative entries (the loader returned None) are stored as this in L2
+_NEGATIVE = {"negative": True}
+
+# Breaker around the shared tier: when it is down every node falls back to
+# L1 + loader without waiting on timeouts
+redis_breaker = CircuitBreaker("redis")
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Cannot cache {type(value).__name__}")
+
+class _Entry:
+    __slots__ = ("value", "expires_at", "delta")
+
+    def __init__(self, value, expires_at, delta):
+        self.value = value
+        self.expires_at = expires_at  # wall clock, shared with other nodes through L2
+        self.delta = delta            # seconds the last load took
+
+class TieredCache:
+    """In-process LRU+TTL (L1) in front of an optional shared Redis tier (L2).
+
+    get_or_load() looks in L1, then L2, then calls the loader and writes
+    the result to both tiers. A loader result of None is cached for
+    `negative_ttl` (unknown symbols don't hit the database every time).
+
+    Stampede protection uses probabilistic early expiration (XFetch): a
+    read near the end of an entry's TTL reports a miss with a probability
+    that grows with the time the value took to load, so one caller
+    recomputes it before it expires while the others keep getting the
+    cached value. Concurrent loads of the same key on this node share one
+    loader call, which is not cancelled when any one of its callers is.
+    """
+
+    def __init__(self, name, ttl, negative_ttl=None, l1_max_entries=1024, l2=None):
+        self.name = name
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.l1_max_entries = l1_max_entries
+        self.l2 = l2
+        self._l1 = OrderedDict()
+        self._inflight = {}
+        self.l1_hits = 0
+        self.l2_hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.early_refreshes = 0
+        self.l2_errors = 0
+
+    def _expiry(self, entry, now):
+        """None if the entry can be served, "early" if this caller should
+        refresh it ahead of time (XFetch), "expired" otherwise"""
+        if now >= entry.expires_at:
+            return "expired"
+        early = entry.delta * XFETCH_BETA * -math.log(random.random() or 1e-12)
+        if now + early >= entry.expires_at:
+            self.early_refreshes += 1
+            return "early"
+        return None
+
+    def _store_l1(self, key, entry):
+        if self.l1_max_entries <= 0:
+            return
+        self._l1[key] = entry
+        self._l1.move_to_end(key)
+        while len(self._l1) > self.l1_max_entries:
+            self._l1.popitem(last=False)
+
+    def _served(self, entry):
+        if entry.value is None:
+            self.negative_hits += 1
+        return entry.value
+
+    async def _l2_call(self, command, *args):
+        """Run a command on the shared tier; None if it is disabled or unavailable"""
+        if self.l2 is None:
+            return None
+        try:
+            return await redis_breaker.call(getattr(self.l2, command), *args)
+        except CircuitOpenError:
+            return None
+        except Exception as e:
+            self.l2_errors += 1
+            logger.warning(f"Shared cache '{self.name}' unavailable: {str(e)}")
+            return None
+
+    async def get(self, key):
+        """Cached value (None for a negative entry), or MISSING if it should be loaded"""
+        now = time.time()
+        entry = self._l1.get(key)
+        if entry is not None:
+            expiry = self._expiry(entry, now)
+            if expiry is None:
+                self._l1.move_to_end(key)
+                self.l1_hits += 1
+                return self._served(entry)
+            if expiry == "early":
+                # Other callers keep the entry until this one replaces it
+                self.misses += 1
+                return MISSING
+            del self._l1[key]
+
+        raw = await self._l2_call("get", f"{self.name}:{key}")
+        if raw is not None:
+            try:
+                data = json.loads(raw)
+                value = None if data["value"] == _NEGATIVE else data["value"]
+                entry = _Entry(value, data["expires_at"], data["delta"])
+            except (ValueError, KeyError, TypeError):
+                entry = None
+            if entry is not None and self._expiry(entry, now) is None:
+                self._store_l1(key, entry)
+                self.l2_hits += 1
+                return self._served(entry)
+
+        self.misses += 1
+        return MISSING
+
+    async def put(self, key, value, delta=0.0):
+        """Store a value (None caches a negative entry) in both tiers"""
+        ttl = self.negative_ttl if value is None else self.ttl
+        if not ttl:
+            return
+        entry = _Entry(value, time.time() + ttl, delta)
+        self._store_l1(key, entry)
+        if self.l2 is not None:
+            payload = json.dumps(
+                {"value": _NEGATIVE if value is None else value, "expires_at": entry.expires_at, "delta": delta},
+                default=_json_default
+            )
+            await self._l2_call("set", f"{self.name}:{key}", payload, ttl * 1000)
+
+    async def get_or_load(self, key, loader):
+        """Cached value for key, or the result of awaiting loader() (stored in both tiers)"""
+        value = await self.get(key)
+        if value is not MISSING:
+            return value
+        task = self._inflight.get(key)
+        if task is None:
+            # The load runs as its own task, so it keeps going for the
+            # other callers if the one that started it goes away; loaders
+            # must therefore not use resources of the calling request
+            task = self._inflight[key] = asyncio.ensure_future(self._load(key, loader))
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _load(self, key, loader):
+        started = time.perf_counter()
+        value = await loader()
+        await self.put(key, value, time.perf_counter() - started)
+        return value
+
+    def stats(self):
+        return {
+            "l1_entries": len(self._l1),
+            "l1_hits": self.l1_hits,
+            "l2_hits": self.l2_hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "early_refreshes": self.early_refreshes,
+            "l2_enabled": self.l2 is not None,
+            "l2_errors": self.l2_errors,
+        }
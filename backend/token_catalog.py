@@ -0,0 +1,99 @@
+import logging
+import time
+
+import queries
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Configuration
+CATALOG_REFRESH_INTERVAL = 300  # seconds between catalog change checks
+
+class CanonicalToken:
+    """The token a symbol resolves to"""
+
+    __slots__ = ("token_id", "symbol", "name", "images", "market_cap")
+
+    def __init__(self, token_id, symbol, name, images, market_cap):
+        self.token_id = token_id
+        self.symbol = symbol
+        self.name = name
+        self.images = images
+        self.market_cap = market_cap
+
+class CanonicalTokenTable:
+    """Precomputed symbol -> token resolution.
+
+    Several tokens can share a symbol; the view resolves the collision with
+    ORDER BY "MARKET_CAP" DESC NULLS LAST. This table applies the same rule
+    once per catalog change instead of on every request, so resolving a
+    symbol is a dict hit and the price lookup becomes a TOKEN_ID match.
+    """
+
+    def __init__(self):
+        self.by_symbol = {}
+        self.by_id = {}
+        self.fingerprint = None
+        self.built_at = None
+        self.rebuilds = 0
+
+    def resolve(self, symbol):
+        """TOKEN_ID a symbol resolves to, or None if unknown"""
+        token = self.by_symbol.get(symbol)
+        return token.token_id if token is not None else None
+
+    def get(self, symbol):
+        """Canonical token for a symbol, or None"""
+        return self.by_symbol.get(symbol)
+
+    def get_by_id(self, token_id):
+        """Canonical token with this TOKEN_ID, or None if it isn't canonical for its symbol"""
+        return self.by_id.get(token_id)
+
+    async def refresh(self, acquire):
+        """Rebuild the table if the canonical resolution changed since the last build.
+
+        `acquire` opens an async context yielding a connection, or None while
+        the database is unavailable (the table is then kept as it is).
+        """
+        async with acquire() as conn:
+            if conn is None:
+                return False
+            fingerprint = await queries.fetchval(conn, "catalog_fingerprint")
+            if fingerprint is not None and fingerprint == self.fingerprint:
+                return False
+            rows = await queries.fetch(conn, "canonical_tokens")
+
+        self.load(
+            (
+                CanonicalToken(row["TOKEN_ID"], row["TOKEN_SYMBOL"], row["TOKEN_NAME"], row["IMAGES"], row["MARKET_CAP"])
+                for row in rows
+            ),
+            fingerprint
+        )
+        logger.info(f"Rebuilt canonical token table with {len(self.by_symbol)} symbols")
+        return True
+
+    def load(self, tokens, fingerprint=None):
+        """Replace the table with already-resolved tokens (one per symbol)"""
+        by_symbol = {}
+        by_id = {}
+        for token in tokens:
+            by_symbol[token.symbol] = token
+            by_id[token.token_id] = token
+
+        # Swap in one step so readers never see a half-built table
+        self.by_symbol = by_symbol
+        self.by_id = by_id
+        self.fingerprint = fingerprint
+        self.built_at = time.time()
+        self.rebuilds += 1
+
+    def stats(self):
+        """Table counters"""
+        return {
+            "symbols": len(self.by_symbol),
+            "fingerprint": self.fingerprint,
+            "built_at": self.built_at,
+            "rebuilds": self.rebuilds,
+        }
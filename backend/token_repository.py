@@ -1,11 +1,17 @@
 import os
+import sys
 import json
+import time
+import asyncio
 import httpx
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 import logging
 from pathlib import Path
 
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from refresh_scheduler import RefreshScheduler, ON_DEMAND_RESERVE
+
 # Load environment variables
 load_dotenv()
 
@@ -23,6 +29,15 @@ DATA_DIR = Path("./data")
 TOKENS_FILE = DATA_DIR / "tokens.json"
 PRICES_FILE = DATA_DIR / "prices.json"
 PRICE_CACHE_EXPIRY = timedelta(minutes=1)  # Refresh prices every minute
+PRICE_BATCH_SIZE = 20  # token IDs per price request on the on-demand and scheduled paths
+# Full-universe refresh: token IDs per request, and the relative price move
+# below which a fetched price counts as unchanged
+FULL_REFRESH_BATCH_SIZE = int(os.getenv("FULL_REFRESH_BATCH_SIZE", "100"))
+PRICE_CHANGE_EPSILON = float(os.getenv("PRICE_CHANGE_EPSILON", "1e-6"))
+
+# Breaker around the Token Metrics API: when it is down, refreshes fail fast
+# and callers keep the last known-good prices
+tokenmetrics_breaker = CircuitBreaker("tokenmetrics")
 
 # Default placeholder for missing crypto icons
 DEFAULT_CRYPTO_ICON = "https://cryptologos.cc/logos/question-mark.png"
@@ -30,7 +45,7 @@ DEFAULT_CRYPTO_ICON = "https://cryptologos.cc/logos/question-mark.png"
 # Ensure data directory exists
 DATA_DIR.mkdir(exist_ok=True)
 
-# Pre-defined list of tokens with IDs and hardcoded market prices
+# Pre-defined list of tokens with IDs and seed market prices (used until the API has priced them)
 DEFAULT_TOKENS = {
     "BTC": {
         "token_id": 3375,  # Corrected ID based on API response
@@ -104,45 +119,120 @@ DEFAULT_TOKENS = {
     }
 }
 
+def _id_key(token_id):
+    """Normalize a token ID from files or API payloads (int or numeric string) to an int"""
+    try:
+        return int(token_id)
+    except (TypeError, ValueError):
+        return None
+
+class TokenRecord:
+    """Token metadata; slots and interned strings keep 100k+ tokens compact"""
+
+    __slots__ = ("token_id", "name", "symbol", "logo", "market_price", "price_usd")
+
+    def __init__(self, token_id, name, symbol, logo, market_price=None, price_usd=None):
+        self.token_id = token_id
+        self.name = name
+        # Symbols and logos repeat across indexes, files and API payloads
+        self.symbol = sys.intern(symbol)
+        self.logo = sys.intern(logo) if logo else logo
+        self.market_price = market_price
+        self.price_usd = price_usd
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data["token_id"],
+            data.get("name", data["symbol"]),
+            data["symbol"],
+            data.get("logo"),
+            data.get("market_price")
+        )
+
+    def to_dict(self):
+        """Token metadata in the tokens.json format"""
+        data = {
+            "token_id": self.token_id,
+            "name": self.name,
+            "symbol": self.symbol,
+            "logo": self.logo
+        }
+        if self.market_price is not None:
+            data["market_price"] = self.market_price
+        return data
+
 class TokenRepository:
-    def __init__(self):
-        self.tokens = {}
+    def __init__(self, load=True):
+        """Pass load=False for an empty repository that skips the data files and default tokens"""
+        self.tokens = {}  # symbol -> TokenRecord
+        self.symbols_by_id = {}  # int token_id -> symbol
         self.prices = {}
         self.prices_updated_at = {}
+        self.scheduler = RefreshScheduler(batch_size=PRICE_BATCH_SIZE)
+        self.full_refresh_at = None  # when the last full-universe refresh checked every token
+        self.last_full_refresh = None
+        if not load:
+            return
         self._load_data()
         
         # Initialize with tokens from API or default tokens if that fails
         if not self.tokens:
             # Fix the coroutine not awaited warning by using synchronous initialization
             # with default tokens instead of calling the async method
-            self.tokens = DEFAULT_TOKENS.copy()
+            self.set_tokens(DEFAULT_TOKENS.values())
             
             # Initialize prices for default tokens using market prices
             now = datetime.now()
             for symbol, token_data in DEFAULT_TOKENS.items():
                 if "market_price" in token_data:
-                    self.prices[symbol] = token_data["market_price"]
-                    self.prices_updated_at[symbol] = now
+                    self._set_price(symbol, token_data["market_price"], now)
             
             self._save_tokens()
             self._save_prices()
             
             logger.info(f"Initialized with {len(self.tokens)} default tokens")
+        else:
+            # Seed default tokens the stored prices don't cover yet
+            now = datetime.now()
+            for symbol, token_data in DEFAULT_TOKENS.items():
+                if symbol in self.tokens and symbol not in self.prices and "market_price" in token_data:
+                    self._set_price(symbol, token_data["market_price"], now)
+
+    def set_tokens(self, tokens):
+        """Replace the token set (TokenRecords or tokens.json dicts) and rebuild the indexes"""
+        self.tokens = {}
+        self.symbols_by_id = {}
+        for token in tokens:
+            if not isinstance(token, TokenRecord):
+                token = TokenRecord.from_dict(token)
+            token.price_usd = self.prices.get(token.symbol)
+            self.tokens[token.symbol] = token
+            self.symbols_by_id[_id_key(token.token_id)] = token.symbol
+
+    def _set_price(self, symbol, price, now):
+        """Store a price and keep the token record in sync"""
+        self.prices[symbol] = price
+        self.prices_updated_at[symbol] = now
+        token = self.tokens.get(symbol)
+        if token is not None:
+            token.price_usd = price
+
+    def merge_prices(self, updates):
+        """Take prices refreshed elsewhere, as (symbol, price, updated_at), where they
+        are newer than ours; saves them and returns the symbols that changed"""
+        changed = set()
+        for symbol, price, updated_at in updates:
+            if symbol in self.tokens and updated_at > self.prices_updated_at.get(symbol, datetime.min):
+                self._set_price(symbol, price, updated_at)
+                changed.add(symbol)
+        if changed:
+            self._save_prices()
+        return changed
 
     def _load_data(self):
         """Load token and price data from storage"""
-        # Load tokens
-        if TOKENS_FILE.exists():
-            try:
-                with open(TOKENS_FILE, 'r') as f:
-                    data = json.load(f)
-                    self.tokens = data.get('tokens', {})
-                    logger.info(f"Loaded {len(self.tokens)} tokens from local storage")
-            except Exception as e:
-                logger.error(f"Failed to load tokens data: {e}")
-                self.tokens = {}
-
-        # Load prices
+        # Load prices first so token records pick them up
         if PRICES_FILE.exists():
             try:
                 with open(PRICES_FILE, 'r') as f:
@@ -156,12 +246,23 @@ class TokenRepository:
                 self.prices = {}
                 self.prices_updated_at = {}
 
+        # Load tokens
+        if TOKENS_FILE.exists():
+            try:
+                with open(TOKENS_FILE, 'r') as f:
+                    data = json.load(f)
+                    self.set_tokens(data.get('tokens', {}).values())
+                    logger.info(f"Loaded {len(self.tokens)} tokens from local storage")
+            except Exception as e:
+                logger.error(f"Failed to load tokens data: {e}")
+                self.set_tokens([])
+
     def _save_tokens(self):
         """Save token data to storage"""
         try:
             with open(TOKENS_FILE, 'w') as f:
                 json.dump({
-                    'tokens': self.tokens,
+                    'tokens': {symbol: token.to_dict() for symbol, token in self.tokens.items()},
                     'updated_at': datetime.now().isoformat()
                 }, f, indent=2)
             logger.info(f"Saved {len(self.tokens)} tokens to local storage")
@@ -180,6 +281,23 @@ class TokenRepository:
         except Exception as e:
             logger.error(f"Failed to save prices data: {e}")
 
+    async def _api_get(self, client, url, params):
+        """GET from the Token Metrics API through its circuit breaker"""
+        if not tokenmetrics_breaker.allow():
+            raise CircuitOpenError(tokenmetrics_breaker.name)
+        self.scheduler.quota.record()
+        try:
+            response = await client.get(url, headers={"api_key": TOKEN_METRICS_API_KEY}, params=params)
+        except Exception:
+            tokenmetrics_breaker.finish(False)
+            raise
+        except BaseException:
+            tokenmetrics_breaker.finish(None)
+            raise
+        # Client errors are our fault, not an outage
+        tokenmetrics_breaker.finish(response.status_code < 500 and response.status_code != 429)
+        return response
+
     async def discover_tokens(self, force=False):
         """Discover all available tokens from Token Metrics API"""
         logger.info("Discovering tokens from Token Metrics API...")
@@ -188,16 +306,15 @@ class TokenRepository:
         try:
             # We need to make multiple requests to get all tokens
             async with httpx.AsyncClient(timeout=60.0) as client:
-                headers = {"api_key": TOKEN_METRICS_API_KEY}
                 page = 0
                 has_more = True
                 
                 # Keep fetching pages until we get all tokens
                 while has_more:
                     logger.info(f"Fetching tokens page {page}")
-                    response = await client.get(
+                    response = await self._api_get(
+                        client,
                         'https://api.tokenmetrics.com/v2/tokens',
-                        headers=headers,
                         params={
                             'limit': 1000,
                             'page': page
@@ -278,90 +395,160 @@ class TokenRepository:
         return list(self.tokens.values())
 
     async def get_token_by_symbol(self, symbol):
-        """Get token data by symbol"""
-        # Normalize symbol
-        symbol = symbol.upper()
-        
-        # Check if token exists
-        if symbol in self.tokens:
-            token_data = self.tokens[symbol].copy()
+        """Get token record by symbol (price_usd is kept current); treat it as read-only"""
+        token = self.tokens.get(symbol.upper())
+        if token is not None:
+            self.scheduler.touch(token.symbol)
+        return token
+
+    async def get_token_by_id(self, token_id):
+        """Get token record by token ID"""
+        symbol = self.symbols_by_id.get(_id_key(token_id))
+        return self.tokens.get(symbol) if symbol is not None else None
+
+    def _match_price_items(self, price_data, batch_symbols):
+        """Yield (symbol, price) for the API price items of the requested batch"""
+        batch = set(batch_symbols)
+        for price_item in price_data:
+            token_id = price_item.get('TOKEN_ID')
+            price = price_item.get('CURRENT_PRICE')
+            symbol = (price_item.get('TOKEN_SYMBOL') or '').upper()
             
-            # Add current price if available
-            if symbol in self.prices:
-                token_data['price_usd'] = self.prices[symbol]
+            # Match by token ID first, then by symbol, within the requested batch
+            matching_symbol = self.symbols_by_id.get(_id_key(token_id))
+            if matching_symbol not in batch:
+                matching_symbol = symbol if symbol in batch else None
+            
+            if matching_symbol and price is not None:
+                # Never store a zero price (conversions divide by it)
+                yield matching_symbol, max(float(price), 0.000001)
+
+    def _apply_price_items(self, price_data, batch_symbols, now):
+        """Store prices from an API batch response; returns the number of tokens updated"""
+        updated = 0
+        for symbol, price in self._match_price_items(price_data, batch_symbols):
+            logger.debug(f"Updated price for {symbol}: {price}")
+            self._set_price(symbol, price, now)
+            updated += 1
+        return updated
+
+    def _last_checked(self, symbol):
+        """When the price of a token was last confirmed, changed or not"""
+        updated_at = self.prices_updated_at.get(symbol, datetime.min)
+        if self.full_refresh_at is not None and self.full_refresh_at > updated_at:
+            return self.full_refresh_at
+        return updated_at
+
+    async def refresh_all_prices(self, epsilon=PRICE_CHANGE_EPSILON, symbols=None):
+        """Fetch the price of every discovered token, storing only the ones that changed.
+
+        A price counts as changed when it moved by more than `epsilon`
+        relative to the stored one (or there was none). Unchanged tokens
+        keep their stored price and timestamp, and the prices file is only
+        rewritten if something changed. Requests are paced to the API
+        quota, leaving the on-demand reserve free. Returns throughput and
+        change statistics (also kept in last_full_refresh).
+
+        Pass `symbols` to refresh only those tokens (one node's partition);
+        a partial refresh doesn't mark the other tokens as checked.
+        """
+        started_at = time.perf_counter()
+        checked_at = datetime.now()
+        partial = symbols is not None
+        symbols = [s for s in symbols if s in self.tokens] if partial else list(self.tokens)
+        reserve = int(self.scheduler.quota.per_minute * ON_DEMAND_RESERVE)
+        fetched = 0
+        changed = 0
+        requests = 0
+        failed_batches = 0
+        
+        async with httpx.AsyncClient() as client:
+            for i in range(0, len(symbols), FULL_REFRESH_BATCH_SIZE):
+                batch_symbols = symbols[i:i + FULL_REFRESH_BATCH_SIZE]
+                wait = self.scheduler.quota.wait_time(reserve)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                try:
+                    requests += 1
+                    response = await self._api_get(
+                        client,
+                        'https://api.tokenmetrics.com/v2/price',
+                        params={'token_id': ','.join(str(self.tokens[s].token_id) for s in batch_symbols)}
+                    )
+                except Exception as e:
+                    failed_batches += 1
+                    logger.error(f"Full refresh batch failed: {e}")
+                    if isinstance(e, CircuitOpenError):
+                        break
+                    continue
+                if response.status_code != 200:
+                    failed_batches += 1
+                    logger.error(f"API request failed with status {response.status_code}: {response.text}")
+                    continue
                 
-            return token_data
+                now = datetime.now()
+                for symbol, price in self._match_price_items(response.json().get('data', []), batch_symbols):
+                    fetched += 1
+                    old = self.prices.get(symbol)
+                    if old is None or abs(price - old) > epsilon * abs(old):
+                        self._set_price(symbol, price, now)
+                        changed += 1
         
-        return None
+        if changed:
+            self._save_prices()
+        if not failed_batches and not partial:
+            self.full_refresh_at = checked_at
+        
+        elapsed = time.perf_counter() - started_at
+        self.last_full_refresh = {
+            "at": checked_at.isoformat(),
+            "partial": partial,
+            "tokens": len(symbols),
+            "fetched": fetched,
+            "changed": changed,
+            "changed_fraction": round(changed / fetched, 4) if fetched else None,
+            "requests": requests,
+            "failed_batches": failed_batches,
+            "seconds": round(elapsed, 3),
+            "tokens_per_sec": round(fetched / elapsed, 1) if elapsed > 0 else None,
+        }
+        logger.info(
+            f"{'Partial' if partial else 'Full'} price refresh: {fetched}/{len(symbols)} tokens fetched, {changed} changed, "
+            f"{self.last_full_refresh['tokens_per_sec']} tokens/sec"
+        )
+        return self.last_full_refresh
 
     async def refresh_prices(self, symbols=None, force=False):
         """Refresh prices for specified symbols or all tokens"""
         now = datetime.now()
         
-        # For default tokens, we use hardcoded prices initially
-        for symbol, token_data in DEFAULT_TOKENS.items():
-            if 'market_price' in token_data:
-                self.prices[symbol] = token_data['market_price']
-                self.prices_updated_at[symbol] = now
-        
-        # For Bitcoin specifically, let's check it directly
-        if force or 'BTC' not in self.prices or (now - self.prices_updated_at.get('BTC', datetime.min)) >= PRICE_CACHE_EXPIRY:
-            try:
-                async with httpx.AsyncClient() as client:
-                    headers = {"api_key": TOKEN_METRICS_API_KEY}
-                    # Get Bitcoin price specifically
-                    btc_response = await client.get(
-                        'https://api.tokenmetrics.com/v2/price',
-                        headers=headers,
-                        params={
-                            'token_id': str(self.tokens["BTC"]["token_id"])
-                        }
-                    )
-                    
-                    if btc_response.status_code == 200:
-                        btc_data = btc_response.json()
-                        price_data = btc_data.get('data', [])
-                        if price_data and len(price_data) > 0 and 'CURRENT_PRICE' in price_data[0]:
-                            btc_price = float(price_data[0]['CURRENT_PRICE'])
-                            logger.info(f"API returned Bitcoin price: {btc_price}")
-                            # Store the real price from API
-                            self.prices['BTC'] = btc_price
-                            self.prices_updated_at['BTC'] = now
-            except Exception as e:
-                logger.error(f"Error fetching Bitcoin price: {e}")
-        
         token_ids_to_fetch = []
         symbols_to_fetch = []
         
         # Determine which tokens need price refresh
         if symbols:
-            # Only refresh specific symbols that are not in DEFAULT_TOKENS
+            # Only refresh the requested symbols
             symbols = [s.upper() for s in symbols]
             for symbol in symbols:
-                if symbol in self.tokens and symbol not in DEFAULT_TOKENS:
+                if symbol in self.tokens:
                     # Check if cache is still valid
                     if not force and symbol in self.prices_updated_at:
-                        last_updated = self.prices_updated_at[symbol]
+                        last_updated = self._last_checked(symbol)
                         if (now - last_updated) < PRICE_CACHE_EXPIRY:
                             logger.info(f"Using cached price for {symbol}")
                             continue
                             
-                    token_ids_to_fetch.append(str(self.tokens[symbol]['token_id']))
+                    token_ids_to_fetch.append(str(self.tokens[symbol].token_id))
                     symbols_to_fetch.append(symbol)
         else:
-            # For non-default tokens, fetch from API (limited batch)
-            other_tokens = [(s, t) for s, t in self.tokens.items() if s not in DEFAULT_TOKENS]
-            other_tokens = other_tokens[:40]  # Limit to 40 non-default tokens
+            # Let the scheduler pick by demand and quota
+            def is_due(symbol):
+                if force or symbol not in self.prices_updated_at:
+                    return True
+                return (now - self._last_checked(symbol)) >= PRICE_CACHE_EXPIRY
             
-            for symbol, token in other_tokens:
-                # Check if cache is still valid
-                if not force and symbol in self.prices_updated_at:
-                    last_updated = self.prices_updated_at[symbol]
-                    if (now - last_updated) < PRICE_CACHE_EXPIRY:
-                        continue
-                    
-                token_ids_to_fetch.append(str(token['token_id']))
-                symbols_to_fetch.append(symbol)
+            symbols_to_fetch = self.scheduler.plan(list(self.tokens), is_due, self._last_checked)
+            token_ids_to_fetch = [str(self.tokens[s].token_id) for s in symbols_to_fetch]
         
         # If no tokens need refresh, return current prices
         if not token_ids_to_fetch:
@@ -371,10 +558,9 @@ class TokenRepository:
         logger.info(f"Fetching prices for {len(token_ids_to_fetch)} tokens")
         try:
             async with httpx.AsyncClient() as client:
-                headers = {"api_key": TOKEN_METRICS_API_KEY}
                 
-                # Split into batches of 20 tokens to avoid URL length limits
-                batch_size = 20
+                # Split into batches to avoid URL length limits
+                batch_size = PRICE_BATCH_SIZE
                 for i in range(0, len(token_ids_to_fetch), batch_size):
                     batch_ids = token_ids_to_fetch[i:i+batch_size]
                     batch_symbols = symbols_to_fetch[i:i+batch_size]
@@ -382,9 +568,9 @@ class TokenRepository:
                     token_id_param = ','.join(batch_ids)
                     logger.info(f"Fetching batch with IDs: {token_id_param}")
                     
-                    response = await client.get(
+                    response = await self._api_get(
+                        client,
                         'https://api.tokenmetrics.com/v2/price',
-                        headers=headers,
                         params={
                             'token_id': token_id_param
                         }
@@ -396,26 +582,8 @@ class TokenRepository:
                     
                     data = response.json()
                     
-                    # Process price data (for non-default tokens)
-                    price_data = data.get('data', [])
-                    for price_item in price_data:
-                        token_id = price_item.get('TOKEN_ID')
-                        price = price_item.get('CURRENT_PRICE')
-                        symbol = price_item.get('TOKEN_SYMBOL', '').upper()
-                        
-                        # Find matching symbol
-                        matching_symbol = None
-                        for s in batch_symbols:
-                            if (s == symbol) or (str(self.tokens[s]['token_id']) == str(token_id)):
-                                matching_symbol = s
-                                break
-                        
-                        if matching_symbol and price is not None and matching_symbol not in DEFAULT_TOKENS:
-                            price = float(price)
-                            logger.info(f"Updated price for {matching_symbol}: {price}")
-                            # Store token price - use a random value if the API returns 0
-                            self.prices[matching_symbol] = max(price, 0.000001)
-                            self.prices_updated_at[matching_symbol] = now
+                    # Process price data
+                    self._apply_price_items(data.get('data', []), batch_symbols, now)
                 
             # Save updated prices
             self._save_prices()
@@ -437,6 +605,9 @@ class TokenRepository:
             logger.error(f"One or both tokens not found: {from_symbol}, {to_symbol}")
             return None
         
+        self.scheduler.touch(from_symbol)
+        self.scheduler.touch(to_symbol)
+        
         # Refresh prices if needed
         await self.refresh_prices([from_symbol, to_symbol], force_refresh)
         
@@ -463,5 +634,14 @@ class TokenRepository:
             logger.error(f"Missing price data for {from_symbol} or {to_symbol}")
             return None
 
+    def refresh_stats(self):
+        """Refresh scheduler state, per-token price staleness and the last full-universe refresh"""
+        # Staleness counts from the last check, like plan(): a full refresh confirms unchanged prices too
+        checked_at = {symbol: self._last_checked(symbol) for symbol in self.tokens if symbol in self.prices_updated_at}
+        return {
+            **self.scheduler.stats(self.tokens, checked_at, datetime.now()),
+            "last_full_refresh": self.last_full_refresh
+        }
+
 # Initialize repository
 token_repository = TokenRepository() 
\ No newline at end of file
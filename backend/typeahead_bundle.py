@@ -0,0 +1,109 @@
+import gzip
+import hashlib
+import heapq
+import json
+import logging
+import re
+import time
+from collections import OrderedDict
+
+from formatting import extract_image_from_db, get_default_logo
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Configuration
+TYPEAHEAD_BUNDLE_SIZE = 500  # top tokens by market cap in the bundle
+TYPEAHEAD_MIN_PREFIX = 2     # the frontend doesn't search shorter queries
+TYPEAHEAD_MAX_PREFIX = 4     # longer queries filter the bucket of their first 4 characters
+TYPEAHEAD_KEEP_VERSIONS = 3  # older versions stay downloadable for clients that just read the manifest
+BUNDLE_FIELDS = ("symbol", "name", "token_id", "logo")
+
+_WORD_SPLIT = re.compile(r"[\s\-_.()/]+")
+
+def search_keys(symbol, name):
+    """Lowercased symbol and name words a typeahead query can be a prefix of"""
+    keys = {symbol.lower()} if symbol else set()
+    keys.update(word for word in _WORD_SPLIT.split((name or "").lower()) if word)
+    return keys
+
+class TypeaheadBundle:
+    """Versioned, gzipped top-N token list with a prebuilt prefix index.
+
+    The bundle holds the TYPEAHEAD_BUNDLE_SIZE largest tokens by market cap
+    as rows of BUNDLE_FIELDS, in market cap order, and maps every prefix
+    (TYPEAHEAD_MIN_PREFIX to TYPEAHEAD_MAX_PREFIX characters) of a
+    lowercased symbol or name word to the rows it matches, so a client
+    answers a query with one dict lookup and a filter of a short list.
+    The version is a digest of the content: rebuilding an unchanged
+    catalog keeps the version (and clients' cached copies) as they are.
+    """
+
+    def __init__(self, size=TYPEAHEAD_BUNDLE_SIZE):
+        self.size = size
+        self.version = None
+        self.built_at = None
+        self.token_count = 0
+        self.rebuilds = 0
+        self._bodies = OrderedDict()  # version -> gzipped JSON
+
+    def build(self, tokens):
+        """Rebuild from catalog tokens (CanonicalToken); True if the content changed"""
+        top = heapq.nlargest(self.size, tokens, key=lambda t: t.market_cap or 0)
+        rows = []
+        prefixes = {}
+        for index, token in enumerate(top):
+            logo = extract_image_from_db(token.images) or get_default_logo(token.symbol)
+            rows.append([token.symbol, token.name or token.symbol, token.token_id, logo])
+            for key in search_keys(token.symbol, token.name):
+                for length in range(TYPEAHEAD_MIN_PREFIX, min(len(key), TYPEAHEAD_MAX_PREFIX) + 1):
+                    bucket = prefixes.setdefault(key[:length], [])
+                    if not bucket or bucket[-1] != index:
+                        bucket.append(index)
+
+        content = {
+            "fields": BUNDLE_FIELDS,
+            "min_prefix": TYPEAHEAD_MIN_PREFIX,
+            "max_prefix": TYPEAHEAD_MAX_PREFIX,
+            "tokens": rows,
+            "prefixes": prefixes,
+        }
+        body = json.dumps(content, separators=(",", ":"), sort_keys=True)
+        version = hashlib.sha256(body.encode()).hexdigest()[:16]
+        if version == self.version:
+            return False
+
+        content["version"] = version
+        self._bodies[version] = gzip.compress(
+            json.dumps(content, separators=(",", ":")).encode(), mtime=0
+        )
+        while len(self._bodies) > TYPEAHEAD_KEEP_VERSIONS:
+            self._bodies.popitem(last=False)
+        self.version = version
+        self.built_at = time.time()
+        self.token_count = len(rows)
+        self.rebuilds += 1
+        logger.info(
+            f"Built typeahead bundle {version}: {len(rows)} tokens, {len(prefixes)} prefixes, "
+            f"{len(self._bodies[version]):,} bytes gzipped"
+        )
+        return True
+
+    def body(self, version):
+        """Gzipped JSON of a version, or None if it is unknown or expired"""
+        return self._bodies.get(version)
+
+    def manifest(self):
+        return {
+            "version": self.version,
+            "url": f"/tokens/typeahead/{self.version}" if self.version else None,
+            "tokens": self.token_count,
+            "built_at": self.built_at,
+        }
+
+    def stats(self):
+        return {
+            **self.manifest(),
+            "rebuilds": self.rebuilds,
+            "versions": {version: len(body) for version, body in self._bodies.items()},
+        }
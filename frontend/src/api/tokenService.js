@@ -8,6 +8,16 @@ const API_URL = import.meta.env.VITE_API_URL ||
 
 console.log('Using API URL:', API_URL);
 
+// Identifies this tab's typeahead session so the backend can cancel
+// searches that a newer keystroke has made obsolete
+const SEARCH_SESSION_ID = (window.crypto && window.crypto.randomUUID)
+  ? window.crypto.randomUUID()
+  : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+
+// Top tokens with a prefix index, downloaded once per page load (the bundle
+// itself is immutable and cached by the browser across visits)
+let typeaheadBundlePromise = null;
+
 const tokenService = {
   // Get all available tokens
   async getTokens() {
@@ -172,6 +182,50 @@ const tokenService = {
     };
   },
 
+  // Load the typeahead bundle for client-side search (null if unavailable)
+  getTypeaheadBundle() {
+    if (!typeaheadBundlePromise) {
+      typeaheadBundlePromise = (async () => {
+        try {
+          const manifest = await axios.get(`${API_URL}/tokens/typeahead`);
+          if (!manifest.data.url) {
+            return null;
+          }
+          const response = await axios.get(`${API_URL}${manifest.data.url}`);
+          const { fields, tokens, ...bundle } = response.data;
+          return {
+            ...bundle,
+            tokens: tokens.map(row => Object.fromEntries(fields.map((field, i) => [field, row[i]])))
+          };
+        } catch (error) {
+          console.error('Error loading typeahead bundle:', error);
+          // Try again on the next search
+          typeaheadBundlePromise = null;
+          return null;
+        }
+      })();
+    }
+    return typeaheadBundlePromise;
+  },
+
+  // Search the typeahead bundle: tokens whose symbol or a name word starts
+  // with the query, exact symbol match first, then by market cap
+  searchTypeaheadBundle(bundle, query) {
+    const q = query.toLowerCase();
+    if (!bundle || q.length < bundle.min_prefix) {
+      return [];
+    }
+    const candidates = bundle.prefixes[q.slice(0, bundle.max_prefix)] || [];
+    const matches = candidates
+      .map(index => bundle.tokens[index])
+      .filter(token =>
+        token.symbol.toLowerCase().startsWith(q) ||
+        token.name.toLowerCase().split(/[\s\-_.()/]+/).some(word => word.startsWith(q))
+      );
+    const exact = matches.filter(token => token.symbol.toLowerCase() === q);
+    return [...exact, ...matches.filter(token => token.symbol.toLowerCase() !== q)];
+  },
+
   // Search for tokens by name or symbol
   async searchTokens(query) {
     if (!query || query.length < 2) {
@@ -180,10 +234,15 @@ const tokenService = {
     
     try {
       const response = await axios.get(`${API_URL}/tokens/search`, {
-        params: { query }
+        params: { query },
+        headers: { 'X-Search-Session': SEARCH_SESSION_ID }
       });
       return response.data;
     } catch (error) {
+      // Superseded by a newer query from this session; the caller should ignore it
+      if (error.response && error.response.status === 409) {
+        return null;
+      }
       console.error('Error searching tokens:', error);
       return [];
     }
@@ -412,6 +412,11 @@ const CryptoConverter = () => {
       if (query.length >= 2) {
         const apiResults = await tokenService.searchTokens(query);
         
+        // A newer search replaced this one
+        if (apiResults === null) {
+          return;
+        }
+        
         // Combine results, removing duplicates
         const allResults = [...localResults];
         
@@ -10,6 +10,8 @@ const TokenSelector = ({ label, value, onChange, tokens, onAmountChange, amount,
   const [isSearching, setIsSearching] = useState(false);
   const dropdownRef = useRef(null);
   const searchTimeoutRef = useRef(null);
+  // Incremented by every search; responses of older searches are ignored
+  const searchIdRef = useRef(0);
   
   // Handle click outside to close dropdown
   useEffect(() => {
@@ -41,10 +43,13 @@ const TokenSelector = ({ label, value, onChange, tokens, onAmountChange, amount,
   
   // Debounced search effect
   useEffect(() => {
-    // Clear any existing timeout
+    // Clear any existing timeout; a request still running for an older
+    // search no longer counts as searching
     if (searchTimeoutRef.current) {
       clearTimeout(searchTimeoutRef.current);
     }
+    const searchId = ++searchIdRef.current;
+    setIsSearching(false);
     
     if (!search || search.length < 2) {
       // When no search term or too short, just show the default tokens
@@ -53,20 +58,41 @@ const TokenSelector = ({ label, value, onChange, tokens, onAmountChange, amount,
     }
     
     // First filter local tokens immediately
-    const localMatches = tokens.filter(token => 
+    const listMatches = tokens.filter(token => 
       token.symbol.toLowerCase().includes(search.toLowerCase()) || 
       token.name.toLowerCase().includes(search.toLowerCase())
     );
     
-    setFilteredTokens(localMatches);
+    setFilteredTokens(listMatches);
     
-    // Then search API after a delay (debounce)
-    if (localMatches.length < 5) {
+    // Then the typeahead bundle, and the API after a delay (debounce) for
+    // the long tail the bundle doesn't cover
+    let cancelled = false;
+    (async () => {
+      const bundle = await tokenService.getTypeaheadBundle();
+      if (cancelled) {
+        return;
+      }
+      const bundleMatches = tokenService.searchTypeaheadBundle(bundle, search).filter(
+        bundleToken => !listMatches.some(listToken => listToken.symbol === bundleToken.symbol)
+      );
+      const localMatches = [...listMatches, ...bundleMatches];
+      setFilteredTokens(localMatches);
+      
+      if (localMatches.length >= 5) {
+        return;
+      }
+
       searchTimeoutRef.current = setTimeout(async () => {
         try {
           setIsSearching(true);
           const apiResults = await tokenService.searchTokens(search);
           
+          // A newer search replaced this one
+          if (apiResults === null || searchId !== searchIdRef.current) {
+            return;
+          }
+          
           // Filter out tokens we already have locally to avoid duplicates
           const newTokens = apiResults.filter(
             apiToken => !localMatches.some(localToken => 
@@ -79,10 +105,20 @@ const TokenSelector = ({ label, value, onChange, tokens, onAmountChange, amount,
         } catch (error) {
           console.error('Search error:', error);
         } finally {
-          setIsSearching(false);
+          // Only the current search owns the spinner
+          if (searchId === searchIdRef.current) {
+            setIsSearching(false);
+          }
         }
       }, 500); // 500ms debounce delay
-    }
+    })();
+    
+    return () => {
+      cancelled = true;
+      if (searchTimeoutRef.current) {
+        clearTimeout(searchTimeoutRef.current);
+      }
+    };
   }, [search, tokens]);
   
   const handleTokenSelect = (token) => {